@@ -0,0 +1,228 @@
+"""
+Streaming anomaly filter for sensor readings
+
+Runs in front of storage and auto-irrigation, so a spiking DHT sensor or a
+disconnected soil probe cannot switch a pump. Each reading is checked per
+field against:
+
+    range  the physically plausible limits (sensor_ingest.FIELD_LIMITS)
+    spike  a robust z-score |x - median| / (1.4826 * MAD) over the device's
+           last `window` readings, once it has `min_history` of them
+    rate   the change since the last reading that passed the first two
+           checks, limited to max_step + max_rate * elapsed seconds
+
+Work per reading is bounded by the window size, and batches are checked in
+one vectorized pass. A lasting level shift (such as a probe being replugged)
+fills the window and is accepted after about half a window of readings.
+Rejected readings are counted per reason and the latest ones are kept per device.
+"""
+import threading
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from sensor_ingest import FIELD_LIMITS
+from sensor_store import SENSOR_FIELDS
+
+CHECKS = ('range', 'spike', 'rate')
+
+# Converts a median absolute deviation into a standard deviation for normal data
+MAD_TO_SIGMA = 1.4826
+
+# Smallest spread assumed per field, so a flat history does not flag sensor noise
+SCALE_FLOOR = {'temperature': 0.5, 'humidity': 2.0, 'soilMoisture': 2.0}
+
+# Allowed change between readings: a fixed step plus a rate per second
+MAX_STEP = {'temperature': 3.0, 'humidity': 10.0, 'soilMoisture': 10.0}
+MAX_RATE = {'temperature': 0.1, 'humidity': 0.5, 'soilMoisture': 0.5}
+
+
+def _nanmedian(a, counts):
+    """Median over the last axis ignoring NaN, given the non-NaN counts; much cheaper than
+    np.nanmedian on many short windows"""
+    ordered = np.sort(a, axis=-1)  # NaN sorts last
+    low = np.take_along_axis(ordered, np.maximum(counts - 1, 0)[..., None] // 2, axis=-1)[..., 0]
+    high = np.take_along_axis(ordered, (counts // 2)[..., None], axis=-1)[..., 0]
+    median = (low + high) / 2.0
+    median[counts == 0] = np.nan
+    return median
+
+
+def _median(ordered):
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2.0
+
+
+class _DeviceHistory:
+    __slots__ = ('values', 'ref_values', 'ref_seconds', 'rejected')
+
+    def __init__(self, window, n_fields, log_size):
+        self.values = np.full((window, n_fields), np.nan)
+        self.ref_values = np.full(n_fields, np.nan)
+        self.ref_seconds = np.full(n_fields, np.nan)
+        self.rejected = deque(maxlen=log_size)
+
+
+class AnomalyFilter:
+    def __init__(self, window=31, min_history=5, z_limit=5.0, fields=SENSOR_FIELDS, log_size=50):
+        self.window = window
+        self.min_history = min_history
+        self.z_limit = z_limit
+        self.fields = tuple(fields)
+        self.log_size = log_size
+        self._low = np.array([FIELD_LIMITS[f][0] for f in self.fields])
+        self._high = np.array([FIELD_LIMITS[f][1] for f in self.fields])
+        self._scale_floor = np.array([SCALE_FLOOR[f] for f in self.fields])
+        self._max_step = np.array([MAX_STEP[f] for f in self.fields])
+        self._max_rate = np.array([MAX_RATE[f] for f in self.fields])
+
+        self._limits = [FIELD_LIMITS[f] for f in self.fields]
+
+        self._devices = {}
+        self.checked = 0
+        self.rejected = 0
+        self.rejection_counts = {f'{field}:{check}': 0 for field in self.fields for check in CHECKS}
+        self._lock = threading.Lock()
+
+    def _device(self, device_id):
+        history = self._devices.get(device_id)
+        if history is None:
+            history = self._devices[device_id] = _DeviceHistory(self.window, len(self.fields), self.log_size)
+        return history
+
+    def check(self, device_id, timestamp_ms, values):
+        """Check one reading; returns its rejection reasons, empty if accepted
+
+        Same checks as check_many, in scalar code: a window this short is
+        cheaper to sort in Python than to push through a dozen NumPy calls.
+        """
+        seconds = timestamp_ms / 1000.0
+        values = [float(v) for v in values]
+        reasons = []
+        with self._lock:
+            history = self._device(device_id)
+            columns = history.values.T.tolist()
+            entered = []
+            for f, x in enumerate(values):
+                in_range = self._limits[f][0] <= x <= self._limits[f][1]  # NaN fails
+                entered.append(x if in_range else np.nan)
+                if not in_range:
+                    reasons.append(f'{self.fields[f]}:range')
+                    continue
+
+                window = [v for v in columns[f] if v == v]
+                if len(window) >= self.min_history:
+                    median = _median(sorted(window))
+                    mad = _median(sorted(abs(v - median) for v in window))
+                    sigma = max(MAD_TO_SIGMA * mad, self._scale_floor[f])
+                    if abs(x - median) > self.z_limit * sigma:
+                        reasons.append(f'{self.fields[f]}:spike')
+                        continue
+
+                previous = history.ref_values[f]
+                elapsed = abs(seconds - history.ref_seconds[f])
+                if abs(x - previous) > self._max_step[f] + self._max_rate[f] * elapsed:
+                    reasons.append(f'{self.fields[f]}:rate')
+                history.ref_values[f] = x
+                history.ref_seconds[f] = seconds
+
+            history.values[:-1] = history.values[1:]
+            history.values[-1] = entered
+            self.checked += 1
+            if reasons:
+                self.rejected += 1
+                for reason in reasons:
+                    self.rejection_counts[reason] += 1
+                history.rejected.append({
+                    'timestamp': int(timestamp_ms), **dict(zip(self.fields, values)), 'reasons': reasons
+                })
+        return reasons
+
+    def check_many(self, device_id, timestamps_ms, values):
+        """Check a batch with shape (n, len(fields)); returns (valid_mask, rejection_counts)"""
+        valid, reasons = self._check(device_id, np.asarray(timestamps_ms, dtype=np.int64),
+                                     np.asarray(values, dtype=np.float64))
+        counts = {}
+        for row_reasons in reasons.values():
+            for reason in row_reasons:
+                counts[reason] = counts.get(reason, 0) + 1
+        return valid, counts
+
+    def _check(self, device_id, timestamps_ms, values):
+        """Return (valid mask in input order, {input row: reasons} for rejected rows)"""
+        n = len(timestamps_ms)
+        if n == 0:
+            return np.ones(0, dtype=bool), {}
+        order = np.argsort(timestamps_ms, kind='stable')
+        x = values[order]
+        seconds = timestamps_ms[order] / 1000.0
+
+        flags = np.zeros((n, len(self.fields), len(CHECKS)), dtype=bool)
+        in_range = (x >= self._low) & (x <= self._high)  # NaN fails both
+        flags[:, :, 0] = ~in_range
+
+        with self._lock:
+            history = self._device(device_id)
+
+            # Window preceding every reading; out-of-range values never enter it
+            sequence = np.concatenate([history.values, np.where(in_range, x, np.nan)])
+            windows = sliding_window_view(sequence, self.window, axis=0)[:n]  # (n, fields, window)
+            counts = np.count_nonzero(~np.isnan(windows), axis=2)
+            median = _nanmedian(windows, counts)
+            mad = _nanmedian(np.abs(windows - median[:, :, None]), counts)
+            sigma = np.maximum(MAD_TO_SIGMA * mad, self._scale_floor)
+            spike = in_range & (counts >= self.min_history) & (np.abs(x - median) > self.z_limit * sigma)
+            flags[:, :, 1] = spike
+
+            # Reference for the rate check: latest earlier reading that passed range and spike,
+            # row 0 being the one carried over from previous calls
+            passed = in_range & ~spike
+            ref_values = np.vstack([history.ref_values, x])
+            ref_seconds = np.vstack([history.ref_seconds, np.repeat(seconds[:, None], len(self.fields), axis=1)])
+            rows = np.where(np.vstack([np.ones((1, len(self.fields)), dtype=bool), passed]),
+                            np.arange(n + 1)[:, None], 0)
+            rows = np.maximum.accumulate(rows, axis=0)[:n]
+            previous = np.take_along_axis(ref_values, rows, axis=0)
+            elapsed = np.abs(seconds[:, None] - np.take_along_axis(ref_seconds, rows, axis=0))
+            flags[:, :, 2] = passed & (np.abs(x - previous) > self._max_step + self._max_rate * elapsed)
+
+            history.values = sequence[-self.window:]
+            last = np.maximum.accumulate(np.where(passed, np.arange(1, n + 1)[:, None], 0), axis=0)[-1]
+            carried = last > 0
+            history.ref_values[carried] = x[last[carried] - 1, carried]
+            history.ref_seconds[carried] = seconds[last[carried] - 1]
+
+            rejected_rows = np.flatnonzero(flags.any(axis=(1, 2)))
+            reasons = {}
+            for row in rejected_rows.tolist():
+                field_index, check_index = np.nonzero(flags[row])
+                row_reasons = [f'{self.fields[f]}:{CHECKS[c]}' for f, c in zip(field_index, check_index)]
+                reasons[int(order[row])] = row_reasons
+                for reason in row_reasons:
+                    self.rejection_counts[reason] += 1
+            for row in rejected_rows[-self.log_size:].tolist():
+                history.rejected.append({
+                    'timestamp': int(timestamps_ms[order[row]]),
+                    **dict(zip(self.fields, x[row].tolist())),
+                    'reasons': reasons[int(order[row])]
+                })
+            self.checked += n
+            self.rejected += len(rejected_rows)
+
+        valid = np.ones(n, dtype=bool)
+        valid[order[rejected_rows]] = False
+        return valid, reasons
+
+    def recent_rejections(self, device_id):
+        """Latest rejected readings for a device, oldest first"""
+        with self._lock:
+            history = self._devices.get(device_id)
+            return list(history.rejected) if history is not None else []
+
+    def stats(self):
+        return {
+            'checked': self.checked,
+            'rejected': self.rejected,
+            'reasons': {reason: count for reason, count in self.rejection_counts.items() if count}
+        }
@@ -0,0 +1,683 @@
+"""
+Micro-benchmarks for the crop recommendation model
+
+Run from the backend_ml directory, e.g.:
+    python benchmarks.py predict
+
+The `suite` command runs the model micro-benchmarks and a mixed-traffic
+HTTP load against the app (all in process, offline) and writes JSON;
+`compare` diffs two such files, e.g. from two commits:
+    python benchmarks.py suite --output before.json
+    python benchmarks.py compare before.json after.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from compiled_forest import CompiledForest
+from ml_model import crop_model
+from state_backend import MemoryStateBackend
+
+
+def import_server():
+    """Import the app with in-memory state
+    
+    Benchmark devices, pump switches and settings must not leak into the
+    persisted state a real server starts from.
+    """
+    if 'server' in sys.modules:
+        import server
+        if not isinstance(server.state_backend, MemoryStateBackend):
+            raise RuntimeError("server was already imported with a persistent state backend")
+        return server
+    
+    previous = os.environ.get('STATE_BACKEND')
+    os.environ['STATE_BACKEND'] = 'memory'
+    try:
+        import server
+    finally:
+        if previous is None:
+            del os.environ['STATE_BACKEND']
+        else:
+            os.environ['STATE_BACKEND'] = previous
+    return server
+
+
+def load_corpus(csv_path='Crop_recommendation.csv'):
+    """Use the training CSV rows as benchmark inputs"""
+    df = pd.read_csv(csv_path)
+    return df[crop_model.feature_names].to_numpy(dtype=np.float64)
+
+
+def sensor_series(rng, n):
+    """Plausible temperature/humidity/soil moisture readings (slow random walks),
+    so the anomaly filter accepts them and the whole ingest path is measured"""
+    steps = rng.normal(0.0, [0.05, 0.2, 0.1], size=(n, 3))
+    return np.clip([25.0, 60.0, 45.0] + np.cumsum(steps, axis=0), [15.0, 30.0, 10.0], [40.0, 90.0, 80.0])
+
+
+def time_calls(fn, inputs, repeat):
+    """Time fn(*row) per call and return latency percentiles in microseconds"""
+    timings = np.empty(repeat, dtype=np.float64)
+    for i in range(repeat):
+        row = inputs[i % len(inputs)]
+        start = time.perf_counter()
+        fn(*row)
+        timings[i] = time.perf_counter() - start
+    timings *= 1e6
+    return {
+        'p50_us': float(np.percentile(timings, 50)),
+        'p99_us': float(np.percentile(timings, 99)),
+        'mean_us': float(timings.mean()),
+    }
+
+
+def legacy_predict(temperature, humidity, ph, rainfall):
+    """The original DataFrame-based predict, kept as the benchmark baseline"""
+    model = crop_model.model
+    encoder = crop_model.label_encoder
+    input_data = pd.DataFrame({
+        'temperature': [temperature],
+        'humidity': [humidity],
+        'ph': [ph],
+        'rainfall': [rainfall]
+    })
+    prediction = model.predict(input_data)
+    predicted_crop = encoder.inverse_transform(prediction)[0]
+    probabilities = model.predict_proba(input_data)[0]
+    top_indices = np.argsort(probabilities)[::-1][:5]
+    recommendations = []
+    for idx in top_indices:
+        recommendations.append({
+            'crop': encoder.inverse_transform([idx])[0],
+            'confidence': round(float(probabilities[idx] * 100), 2)
+        })
+    return {
+        'recommended_crop': predicted_crop,
+        'confidence': round(float(probabilities[prediction[0]] * 100), 2),
+        'all_recommendations': recommendations
+    }
+
+
+def bench_predict(args):
+    """Compare per-call latency of the legacy and fast single-row paths"""
+    inputs = load_corpus()
+    
+    # The legacy path ran with n_jobs=-1 and passed feature names
+    crop_model.model.set_params(n_jobs=-1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        legacy = time_calls(legacy_predict, inputs, args.repeat)
+    crop_model.model.set_params(n_jobs=1)
+    
+    fast = time_calls(crop_model.predict, inputs, args.repeat)
+    
+    print(f"{'path':<10}{'p50 (us)':>12}{'p99 (us)':>12}{'mean (us)':>12}")
+    for name, stats in (('legacy', legacy), ('fast', fast)):
+        print(f"{name:<10}{stats['p50_us']:>12.1f}{stats['p99_us']:>12.1f}{stats['mean_us']:>12.1f}")
+    print(f"p50 speedup: {legacy['p50_us'] / fast['p50_us']:.1f}x")
+
+
+def time_batches(fn, inputs, batch_size, repeat):
+    """Median wall time in microseconds of fn over slices of batch_size rows"""
+    timings = np.empty(repeat, dtype=np.float64)
+    for i in range(repeat):
+        start_row = (i * batch_size) % max(1, len(inputs) - batch_size)
+        batch = inputs[start_row:start_row + batch_size]
+        start = time.perf_counter()
+        fn(batch)
+        timings[i] = time.perf_counter() - start
+    return float(np.median(timings) * 1e6)
+
+
+def bench_backends(args):
+    """Compare sklearn and compiled-forest predict_proba across batch sizes"""
+    inputs = load_corpus()
+    forest = crop_model.model
+    compiled = CompiledForest.from_sklearn(forest)
+    
+    max_error = float(np.abs(compiled.predict_proba(inputs) - forest.predict_proba(inputs)).max())
+    print(f"max |compiled - sklearn| probability difference: {max_error:.2e}")
+    
+    print(f"{'batch':>8}{'sklearn (us)':>16}{'compiled (us)':>16}{'speedup':>10}")
+    for batch_size in args.batch_sizes:
+        sklearn_us = time_batches(forest.predict_proba, inputs, batch_size, args.repeat)
+        compiled_us = time_batches(compiled.predict_proba, inputs, batch_size, args.repeat)
+        print(f"{batch_size:>8}{sklearn_us:>16.1f}{compiled_us:>16.1f}{sklearn_us / compiled_us:>9.1f}x")
+
+
+def bench_startup(args):
+    """Measure `import server` time and time until the model is ready, in fresh processes"""
+    code = (
+        "import time; t0 = time.perf_counter(); import server; t1 = time.perf_counter(); "
+        "server.crop_model.load_or_train(); t2 = time.perf_counter(); print(t1 - t0, t2 - t1)"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    import_times, load_times = [], []
+    for _ in range(args.repeat):
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=here, capture_output=True, text=True, check=True,
+            env={**os.environ, 'STATE_BACKEND': 'memory'}
+        )
+        import_s, load_s = map(float, result.stdout.strip().splitlines()[-1].split())
+        import_times.append(import_s)
+        load_times.append(load_s)
+    
+    print(f"import server:   {np.median(import_times) * 1000:8.1f} ms (median of {args.repeat})")
+    print(f"model ready in:  {np.median(load_times) * 1000:8.1f} ms after import")
+
+
+STORE_PROBE = '''
+import time
+from ml_model import CropRecommendationModel
+
+def rss_kb():
+    fields = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            fields[key] = value.strip()
+    return {key: int(fields.get(key, '0 kB').split()[0]) for key in ('VmRSS', 'RssAnon', 'RssFile')}
+
+model = CropRecommendationModel(model_format=MODEL_FORMAT)
+before = rss_kb()
+start = time.perf_counter()
+model.load_model()
+model.predict(25.0, 80.0, 6.5, 200.0)
+elapsed = time.perf_counter() - start
+after = rss_kb()
+print(elapsed, *(after[key] - before[key] for key in ('VmRSS', 'RssAnon', 'RssFile')))
+'''
+
+
+def bench_store(args):
+    """Compare load time and resident memory of the pickle and arrays formats"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    
+    # Make sure both formats exist on disk
+    for fmt in ('pickle', 'arrays'):
+        crop_model.model_format = fmt
+        crop_model.save_model()
+    crop_model.model_format = 'pickle'
+    
+    print(f"{'format':<10}{'load (ms)':>12}{'RSS (MB)':>12}{'anon (MB)':>12}{'file (MB)':>12}")
+    for fmt in ('pickle', 'arrays'):
+        samples = []
+        for _ in range(args.repeat):
+            result = subprocess.run(
+                [sys.executable, '-c', STORE_PROBE.replace('MODEL_FORMAT', repr(fmt))],
+                cwd=here, capture_output=True, text=True, check=True
+            )
+            samples.append([float(v) for v in result.stdout.strip().splitlines()[-1].split()])
+        load_s, rss, anon, file_backed = np.median(np.array(samples), axis=0)
+        print(f"{fmt:<10}{load_s * 1000:>12.1f}{rss / 1024:>12.1f}{anon / 1024:>12.1f}{file_backed / 1024:>12.1f}")
+    print("File-backed pages are shared between workers; anonymous pages are per process.")
+
+
+def bench_dataset(args):
+    """Training-data load time: pandas CSV parse vs the feature-store cache"""
+    import tempfile
+    from feature_store import FeatureStore
+    
+    feature_names = crop_model.feature_names
+    with tempfile.TemporaryDirectory() as tmp:
+        # Tile the training CSV up to the requested size
+        source = pd.read_csv('Crop_recommendation.csv')
+        csv_path = os.path.join(tmp, 'dataset.csv')
+        repeats = max(1, -(-args.rows // len(source)))
+        pd.concat([source] * repeats, ignore_index=True).iloc[:args.rows].to_csv(csv_path, index=False)
+        size_mb = os.path.getsize(csv_path) / 1e6
+        
+        def parse():
+            df = pd.read_csv(csv_path)
+            return df[feature_names].to_numpy(dtype=np.float64), df['label']
+        
+        store = FeatureStore(os.path.join(tmp, 'cache'))
+        start = time.perf_counter()
+        store.build(csv_path, feature_names)
+        build_s = time.perf_counter() - start
+        
+        def cached():
+            X, codes, _ = store.load(csv_path, feature_names)
+            return np.asarray(X).sum(), np.asarray(codes).sum()  # touch every page
+        
+        results = {}
+        for name, fn in (('pd.read_csv', parse), ('cache (mmap)', cached)):
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - start)
+            results[name] = np.median(samples)
+    
+    print(f"{args.rows} rows, {size_mb:.1f} MB CSV; cache build (chunked ingest) {build_s * 1000:.0f} ms")
+    print(f"{'loader':<16}{'load (ms)':>12}{'speedup':>10}")
+    for name, seconds in results.items():
+        print(f"{name:<16}{seconds * 1000:>12.1f}{results['pd.read_csv'] / seconds:>9.1f}x")
+
+
+def bench_ingest(args):
+    """Sensor ingest throughput in readings per second, single posts vs bulk uploads"""
+    from fastapi.testclient import TestClient
+    from sensor_ingest import BINARY_RECORD
+    server = import_server()
+    
+    client = TestClient(server.app)
+    rng = np.random.default_rng(42)
+    n = args.readings
+    now_ms = int(time.time() * 1000)
+    timestamps = now_ms - (n - np.arange(n)) * 1000
+    values = sensor_series(rng, n)
+    
+    start = time.perf_counter()
+    singles = min(n, args.single_posts)
+    for i in range(singles):
+        client.post('/api/sensors/data', json={
+            'deviceId': 'bench-single',
+            'temperature': values[i, 0], 'humidity': values[i, 1], 'soilMoisture': values[i, 2]
+        })
+    single_rate = singles / (time.perf_counter() - start)
+    
+    readings = [
+        {'timestamp': int(t), 'temperature': v[0], 'humidity': v[1], 'soilMoisture': v[2]}
+        for t, v in zip(timestamps.tolist(), values.tolist())
+    ]
+    json_body = json.dumps({'deviceId': 'bench-json', 'readings': readings})
+    csv_body = 'timestamp,temperature,humidity,soilMoisture\n' + '\n'.join(
+        f"{t},{v[0]:.2f},{v[1]:.2f},{v[2]:.2f}" for t, v in zip(timestamps.tolist(), values.tolist())
+    )
+    records = np.empty(n, dtype=BINARY_RECORD)
+    records['timestamp'] = timestamps
+    for i, field in enumerate(('temperature', 'humidity', 'soilMoisture')):
+        records[field] = values[:, i]
+    
+    bodies = {
+        'json': (json_body, 'application/json', None),
+        'csv': (csv_body, 'text/csv', 'bench-csv'),
+        'binary': (records.tobytes(), 'application/octet-stream', 'bench-binary'),
+    }
+    print(f"{'mode':<10}{'readings/s':>14}")
+    print(f"{'single':<10}{single_rate:>14,.0f}")
+    for mode, (body, content_type, device_id) in bodies.items():
+        params = {'device_id': device_id} if device_id else None
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            response = client.post('/api/sensors/bulk', content=body, params=params,
+                                   headers={'content-type': content_type})
+            response.raise_for_status()
+        rate = n * args.repeat / (time.perf_counter() - start)
+        print(f"{mode:<10}{rate:>14,.0f}")
+
+
+def bench_stream(args):
+    """Idle-subscriber memory and fan-out latency of the live stream broadcaster"""
+    import asyncio
+    import tracemalloc
+    from live_stream import LiveBroadcaster
+    
+    async def run():
+        broadcaster = LiveBroadcaster(max_queue=64, coalesce_ms=0)
+        received = 0
+        all_received = asyncio.Event()
+        target = args.subscribers * args.updates
+        
+        async def consume(subscriber):
+            nonlocal received
+            while await subscriber.get() is not None:
+                received += 1
+                if received == target:
+                    all_received.set()
+        
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        subscribers = [broadcaster.subscribe() for _ in range(args.subscribers)]
+        consumers = [asyncio.create_task(consume(sub)) for sub in subscribers]
+        await asyncio.sleep(0)  # let every consumer park on its queue
+        per_subscriber = (tracemalloc.get_traced_memory()[0] - before) / args.subscribers
+        tracemalloc.stop()
+        
+        start = time.perf_counter()
+        for i in range(args.updates):
+            broadcaster.publish('sensors', {'deviceId': 'bench', 'temperature': 20.0 + i}, key=i)
+            await asyncio.sleep(0)
+        await asyncio.wait_for(all_received.wait(), timeout=60)
+        elapsed = time.perf_counter() - start
+        
+        for sub in subscribers:
+            broadcaster.unsubscribe(sub)
+        await asyncio.gather(*consumers)
+        
+        print(f"subscribers:          {args.subscribers}")
+        print(f"memory per idle sub:  {per_subscriber / 1024:.2f} KiB (queue + consumer task)")
+        print(f"delivered messages:   {received}")
+        print(f"fan-out throughput:   {received / elapsed:,.0f} messages/s")
+        print(f"per update to all:    {elapsed / args.updates * 1000:.2f} ms")
+    
+    asyncio.run(run())
+
+
+def bench_rps(args):
+    """Requests per second of hot routes on the default and FAST_JSON response paths"""
+    import asyncio
+    import httpx
+    from fast_json import HAVE_ORJSON
+    server = import_server()
+    
+    corpus = load_corpus().tolist()
+    fields = ('temperature', 'humidity', 'ph', 'rainfall')
+    
+    def single_body(i):
+        return dict(zip(fields, corpus[i % len(corpus)]))
+    
+    def batch_body(i):
+        return {'readings': [single_body(i + j) for j in range(args.batch_size)]}
+    
+    routes = {
+        'sensors/current': ('GET', '/api/sensors/current', None),
+        'predict-crop': ('POST', '/api/ml/predict-crop', single_body),
+        'predict-crop/batch': ('POST', '/api/ml/predict-crop/batch', batch_body),
+    }
+    
+    async def measure(client, method, url, make_body):
+        deadline = time.perf_counter() + args.duration
+        
+        async def worker(offset):
+            done = 0
+            while time.perf_counter() < deadline:
+                body = make_body(offset + done) if make_body else None
+                response = await client.request(method, url, json=body)
+                response.raise_for_status()
+                done += 1
+            return done
+        
+        start = time.perf_counter()
+        counts = await asyncio.gather(*[worker(i * 7919) for i in range(args.concurrency)])
+        return sum(counts) / (time.perf_counter() - start)
+    
+    async def run():
+        await server.inference_batcher.start()
+        transport = httpx.ASGITransport(app=server.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                print(f"encoder: {'orjson' if HAVE_ORJSON else 'json (orjson not installed)'}")
+                print(f"{'route':<22}{'default (req/s)':>18}{'fast (req/s)':>16}{'speedup':>10}")
+                for name, (method, url, make_body) in routes.items():
+                    rates = []
+                    for fast in (False, True):
+                        server.FAST_JSON = fast
+                        rates.append(await measure(client, method, url, make_body))
+                    print(f"{name:<22}{rates[0]:>18,.0f}{rates[1]:>16,.0f}{rates[1] / rates[0]:>9.2f}x")
+        finally:
+            await server.inference_batcher.stop()
+    
+    asyncio.run(run())
+
+
+def percentiles_ms(timings):
+    """p50/p99/mean of a list of durations in seconds, in milliseconds"""
+    timings = np.asarray(timings, dtype=np.float64) * 1000.0
+    return {
+        'p50': float(np.percentile(timings, 50)),
+        'p99': float(np.percentile(timings, 99)),
+        'mean': float(timings.mean())
+    }
+
+
+def environment_info():
+    """Commit, versions and host details stored with suite results"""
+    import platform
+    import sklearn
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=here, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=here, capture_output=True, text=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'backend': crop_model.backend,
+        'model_format': crop_model.model_format
+    }
+
+
+def suite_micro(args, corpus):
+    """Model load, single/batch predict and crop-detail lookups on an uncached model"""
+    from ml_model import CropRecommendationModel
+    
+    results = {}
+    load_times = []
+    for _ in range(args.load_repeat):
+        model = CropRecommendationModel(backend=crop_model.backend, model_format=crop_model.model_format)
+        start = time.perf_counter()
+        model.load_model()
+        load_times.append(time.perf_counter() - start)
+    results['model_load_ms'] = percentiles_ms(load_times)
+    
+    single = []
+    for i in range(args.repeat):
+        row = corpus[i % len(corpus)]
+        start = time.perf_counter()
+        model.predict(*row)
+        single.append(time.perf_counter() - start)
+    results['predict_single_ms'] = percentiles_ms(single)
+    
+    for batch_size in args.batch_sizes:
+        timings = []
+        for i in range(max(5, args.repeat // 50)):
+            start_row = (i * batch_size) % max(1, len(corpus) - batch_size)
+            batch = corpus[start_row:start_row + batch_size]
+            start = time.perf_counter()
+            model.predict_batch(batch)
+            timings.append(time.perf_counter() - start)
+        results[f'predict_batch_{batch_size}_ms'] = percentiles_ms(timings)
+    
+    crops = list(model.class_labels) + ['unknown-crop']
+    timings = []
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        model.get_crop_details(crops[i % len(crops)])
+        timings.append(time.perf_counter() - start)
+    results['crop_details_ms'] = percentiles_ms(timings)
+    return results
+
+
+def suite_http(args, corpus):
+    """Mixed-traffic load against the app in process, through httpx's ASGI transport"""
+    import asyncio
+    import httpx
+    server = import_server()
+    
+    rng = np.random.default_rng(args.seed)
+    kinds = ('sensor_post', 'predict', 'settings_read')
+    weights = np.array(args.mix, dtype=np.float64)
+    plan = rng.choice(len(kinds), size=args.requests, p=weights / weights.sum()).tolist()
+    sensor_values = sensor_series(rng, args.requests).round(2).tolist()
+    fields = ('temperature', 'humidity', 'ph', 'rainfall')
+    
+    def build(i):
+        kind = kinds[plan[i]]
+        if kind == 'sensor_post':
+            temperature, humidity, soil = sensor_values[i]
+            return kind, 'POST', '/api/sensors/data', {
+                'deviceId': 'bench-load', 'temperature': temperature,
+                'humidity': humidity, 'soilMoisture': soil
+            }
+        if kind == 'predict':
+            return kind, 'POST', '/api/ml/predict-crop', dict(zip(fields, corpus[i % len(corpus)]))
+        return kind, 'GET', '/api/settings', None
+    
+    requests = [build(i) for i in range(args.requests)]
+    timings = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+    
+    async def run():
+        await server.inference_batcher.start()
+        transport = httpx.ASGITransport(app=server.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                next_request = iter(requests)
+                
+                async def worker():
+                    for kind, method, url, body in next_request:
+                        start = time.perf_counter()
+                        response = await client.request(method, url, json=body)
+                        timings[kind].append(time.perf_counter() - start)
+                        if response.status_code >= 400:
+                            errors[kind] += 1
+                
+                start = time.perf_counter()
+                await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+                return time.perf_counter() - start
+        finally:
+            await server.inference_batcher.stop()
+    
+    elapsed = asyncio.run(run())
+    results = {'http_throughput_rps': {'value': args.requests / elapsed}}
+    for kind in kinds:
+        if timings[kind]:
+            results[f'http_{kind}_ms'] = {**percentiles_ms(timings[kind]), 'count': len(timings[kind]),
+                                           'errors': errors[kind]}
+    return results
+
+
+def bench_suite(args):
+    """Run the micro-benchmarks and the HTTP load generator and write the results as JSON"""
+    corpus = load_corpus()
+    results = suite_micro(args, corpus)
+    if not args.skip_http:
+        results.update(suite_http(args, corpus.tolist()))
+    
+    report = {'environment': environment_info(), 'config': {
+        'repeat': args.repeat, 'load_repeat': args.load_repeat, 'batch_sizes': args.batch_sizes,
+        'requests': args.requests, 'concurrency': args.concurrency, 'mix': args.mix, 'seed': args.seed
+    }, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"{'benchmark':<32}{'p50 (ms)':>12}{'p99 (ms)':>12}{'mean (ms)':>12}")
+    for name, stats in results.items():
+        if 'p50' in stats:
+            print(f"{name:<32}{stats['p50']:>12.3f}{stats['p99']:>12.3f}{stats['mean']:>12.3f}")
+        else:
+            print(f"{name:<32}{stats['value']:>12,.1f}")
+    print(f"Results written to {args.output}")
+
+
+def bench_compare(args):
+    """Compare two suite result files; exit non-zero on regressions beyond the threshold"""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    
+    print(f"baseline:  {baseline['environment'].get('commit')}  candidate: {candidate['environment'].get('commit')}")
+    print(f"{'benchmark':<32}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    regressions = []
+    for name, stats in baseline['results'].items():
+        other = candidate['results'].get(name)
+        if other is None:
+            continue
+        # Latencies compare p50, throughput compares the value; higher throughput is better
+        key = 'p50' if 'p50' in stats else 'value'
+        before, after = stats[key], other[key]
+        change = (after - before) / before if before else 0.0
+        worse = change < -args.threshold if key == 'value' else change > args.threshold
+        flag = '  REGRESSION' if worse else ''
+        print(f"{name:<32}{before:>12.3f}{after:>12.3f}{change * 100:>9.1f}%{flag}")
+        if worse:
+            regressions.append(name)
+    
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold * 100:.0f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crop model micro-benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    predict_parser = subparsers.add_parser('predict', help="single-row predict latency")
+    predict_parser.add_argument('--repeat', type=int, default=500)
+    predict_parser.set_defaults(func=bench_predict)
+    
+    backends_parser = subparsers.add_parser('backends', help="sklearn vs compiled forest")
+    backends_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    backends_parser.add_argument('--repeat', type=int, default=50)
+    backends_parser.set_defaults(func=bench_backends)
+    
+    startup_parser = subparsers.add_parser('startup', help="server import and model load time")
+    startup_parser.add_argument('--repeat', type=int, default=5)
+    startup_parser.set_defaults(func=bench_startup)
+    
+    store_parser = subparsers.add_parser('store', help="pickle vs memory-mapped arrays format")
+    store_parser.add_argument('--repeat', type=int, default=5)
+    store_parser.set_defaults(func=bench_store)
+    
+    dataset_parser = subparsers.add_parser('dataset', help="CSV parse vs feature-store cache load")
+    dataset_parser.add_argument('--rows', type=int, default=1_000_000)
+    dataset_parser.add_argument('--repeat', type=int, default=3)
+    dataset_parser.set_defaults(func=bench_dataset)
+    
+    ingest_parser = subparsers.add_parser('ingest', help="sensor ingest throughput")
+    ingest_parser.add_argument('--readings', type=int, default=20000)
+    ingest_parser.add_argument('--single-posts', type=int, default=1000)
+    ingest_parser.add_argument('--repeat', type=int, default=5)
+    ingest_parser.set_defaults(func=bench_ingest)
+    
+    stream_parser = subparsers.add_parser('stream', help="live stream fan-out to idle subscribers")
+    stream_parser.add_argument('--subscribers', type=int, default=5000)
+    stream_parser.add_argument('--updates', type=int, default=20)
+    stream_parser.set_defaults(func=bench_stream)
+    
+    rps_parser = subparsers.add_parser('rps', help="hot route throughput, default vs FAST_JSON")
+    rps_parser.add_argument('--duration', type=float, default=3.0, help="seconds per route and mode")
+    rps_parser.add_argument('--concurrency', type=int, default=16)
+    rps_parser.add_argument('--batch-size', type=int, default=50)
+    rps_parser.set_defaults(func=bench_rps)
+    
+    suite_parser = subparsers.add_parser('suite', help="model micro-benchmarks + mixed HTTP load, saved as JSON")
+    suite_parser.add_argument('--output', default='benchmark_results.json')
+    suite_parser.add_argument('--repeat', type=int, default=1000, help="single-row predict / lookup samples")
+    suite_parser.add_argument('--load-repeat', type=int, default=3)
+    suite_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000])
+    suite_parser.add_argument('--requests', type=int, default=3000, help="HTTP requests in the load run")
+    suite_parser.add_argument('--concurrency', type=int, default=16)
+    suite_parser.add_argument('--mix', type=float, nargs=3, default=[0.4, 0.4, 0.2],
+                              metavar=('SENSOR_POSTS', 'PREDICTIONS', 'SETTINGS_READS'))
+    suite_parser.add_argument('--seed', type=int, default=42)
+    suite_parser.add_argument('--skip-http', action='store_true')
+    suite_parser.set_defaults(func=bench_suite)
+    
+    compare_parser = subparsers.add_parser('compare', help="compare two suite result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help="relative change that counts as a regression")
+    compare_parser.set_defaults(func=bench_compare)
+    
+    args = parser.parse_args()
+    if args.command not in ('startup', 'dataset', 'ingest', 'stream', 'compare'):
+        crop_model.load_or_train()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
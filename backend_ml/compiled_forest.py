@@ -0,0 +1,100 @@
+"""
+Flat array-based evaluator for a fitted RandomForestClassifier
+
+All trees are packed into shared node arrays so a batch is evaluated by
+walking every (tree, row) pair one level at a time with NumPy indexing,
+instead of going through sklearn's per-call validation and per-tree dispatch.
+"""
+import numpy as np
+
+# Bound on (trees x rows) node indices held in memory at once
+MAX_WALK_SIZE = 1 << 16
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.n_trees = len(roots)
+        self.n_classes = value.shape[1]
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Export the fitted trees of a sklearn forest into packed node arrays"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        depth = 0
+        offset = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            left = tree.children_left.astype(np.int64)
+            right = tree.children_right.astype(np.int64)
+            feature = tree.feature.astype(np.int64)
+            threshold = tree.threshold.astype(np.float64)
+
+            # Leaves loop back to themselves (always going "left"), so every
+            # row can take exactly `depth` steps without per-step masking
+            is_leaf = left == -1
+            node_ids = np.arange(n_nodes, dtype=np.int64)
+            left = np.where(is_leaf, node_ids, left) + offset
+            right = np.where(is_leaf, node_ids, right) + offset
+            feature = np.where(is_leaf, 0, feature)
+            threshold = np.where(is_leaf, np.inf, threshold)
+
+            # Normalise to class distributions, as DecisionTreeClassifier.predict_proba does
+            value = tree.value[:, 0, :].astype(np.float64)
+            totals = value.sum(axis=1, keepdims=True)
+            totals[totals == 0] = 1.0
+
+            features.append(feature)
+            thresholds.append(threshold)
+            lefts.append(left)
+            rights.append(right)
+            values.append(value / totals)
+            roots.append(offset)
+            depth = max(depth, tree.max_depth)
+            offset += n_nodes
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            children_left=np.concatenate(lefts),
+            children_right=np.concatenate(rights),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.int64),
+            depth=depth
+        )
+
+    def apply(self, X):
+        """Return the leaf node reached in every tree, shaped (n_trees, n_rows)"""
+        # sklearn compares float32 inputs against float64 thresholds
+        Xt = np.ascontiguousarray(np.asarray(X, dtype=np.float32).T)
+        columns = np.arange(Xt.shape[1])
+        nodes = np.repeat(self.roots[:, None], Xt.shape[1], axis=1)
+
+        for _ in range(self.depth):
+            go_left = Xt[self.feature[nodes], columns] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.children_left[nodes], self.children_right[nodes])
+
+        return nodes
+
+    def predict_proba(self, X):
+        """Average the leaf class distributions of every tree, like sklearn"""
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        probabilities = np.empty((len(X), self.n_classes), dtype=np.float64)
+        chunk = max(1, MAX_WALK_SIZE // max(1, self.n_trees))
+        for start in range(0, len(X), chunk):
+            leaves = self.apply(X[start:start + chunk])
+            probabilities[start:start + chunk] = self.value[leaves].sum(axis=0)
+
+        probabilities /= self.n_trees
+        return probabilities
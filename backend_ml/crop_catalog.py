@@ -0,0 +1,83 @@
+"""
+Crop metadata catalog
+
+Loaded once from crop_catalog.json. Lookups go through a lower-cased name
+index built at load time, and the JSON bodies of the catalog endpoints are
+encoded once, together with an ETag, instead of on every request.
+"""
+import hashlib
+import json
+import os
+import threading
+from types import MappingProxyType
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crop_catalog.json')
+
+# Fields listed per crop by /api/ml/available-crops, with their fallbacks
+SUMMARY_FIELDS = (('icon', '🌱'), ('season', 'varies'), ('water_requirement', 'medium'))
+
+
+def encode_json(content):
+    """Encode like FastAPI's JSONResponse and return (body, etag)"""
+    body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+    return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class CropCatalog:
+    def __init__(self, path=CATALOG_PATH):
+        with open(path, encoding='utf-8') as f:
+            catalog = json.load(f)
+
+        # Entries are shared by every caller and must not be modified
+        self.default = catalog['default']
+        self.crops = MappingProxyType({name.lower(): details for name, details in catalog['crops'].items()})
+        self.summaries = MappingProxyType({
+            name: {'name': name, **{field: details.get(field, fallback) for field, fallback in SUMMARY_FIELDS}}
+            for name, details in self.crops.items()
+        })
+
+        self._crop_info = {
+            name: encode_json({'success': True, 'data': {'crop_name': name, 'details': details}})
+            for name, details in self.crops.items()
+        }
+        self._available = None  # (class_labels, body, etag)
+        self._lock = threading.Lock()
+
+    def details(self, crop_name):
+        """Metadata for a crop, or the generic default entry"""
+        return self.crops.get(crop_name.lower(), self.default)
+
+    def summary(self, crop_name):
+        summary = self.summaries.get(crop_name.lower())
+        if summary is None:
+            summary = {'name': crop_name, **{field: fallback for field, fallback in SUMMARY_FIELDS}}
+        return summary
+
+    def crop_info_response(self, crop_name):
+        """(body, etag) for /api/ml/crop-info/{crop_name}"""
+        cached = self._crop_info.get(crop_name)
+        if cached is not None:
+            return cached
+        # Other spellings echo the requested name, so they are encoded per request
+        return encode_json({'success': True, 'data': {'crop_name': crop_name, 'details': self.details(crop_name)}})
+
+    def available_crops_response(self, class_labels):
+        """(body, etag) for /api/ml/available-crops, re-encoded only when the model's classes change"""
+        class_labels = tuple(class_labels)
+        cached = self._available
+        if cached is not None and cached[0] == class_labels:
+            return cached[1], cached[2]
+
+        with self._lock:
+            body, etag = encode_json({
+                'success': True,
+                'data': {
+                    'total_crops': len(class_labels),
+                    'crops': [self.summary(crop) for crop in class_labels]
+                }
+            })
+            self._available = (class_labels, body, etag)
+        return body, etag
+
+
+crop_catalog = CropCatalog()
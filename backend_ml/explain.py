@@ -0,0 +1,71 @@
+"""
+Per-feature attributions for random forest predictions
+
+Uses the tree-path (Saabas) decomposition: walking from a tree's root to
+a leaf, every split moves the class distribution from the parent's value
+to the child's, and that change is credited to the split feature. A
+prediction is then the forest's mean root distribution (the base value)
+plus one contribution per feature, summing to the predicted probabilities
+up to float64 rounding.
+
+The contribution of every root-to-node path is accumulated once per model.
+Explaining a batch is then the same tree walk as a prediction plus a
+gather-and-sum over the reached leaves.
+"""
+import numpy as np
+
+# Bound on (trees x rows x features x classes) values gathered at once
+MAX_GATHER_SIZE = 1 << 22
+
+
+def path_contributions(forest, n_features):
+    """Per-node (n_features, n_classes) sum of the split contributions from the root"""
+    n_nodes = len(forest.feature)
+    value = np.asarray(forest.value)
+    # float64, so base value plus contributions stays within rounding of the leaf values
+    contributions = np.zeros((n_nodes, n_features, value.shape[1]), dtype=np.float64)
+
+    # Leaves of a CompiledForest point to themselves; walk the trees level by level
+    internal = np.asarray(forest.children_left) != np.arange(n_nodes)
+    frontier = np.asarray(forest.roots)
+    while len(frontier):
+        parents = frontier[internal[frontier]]
+        features = forest.feature[parents]
+        children = []
+        for child in (forest.children_left[parents], forest.children_right[parents]):
+            contributions[child] = contributions[parents]
+            contributions[child, features] += value[child] - value[parents]
+            children.append(child)
+        frontier = np.concatenate(children)
+    return contributions
+
+
+class ForestExplainer:
+    def __init__(self, forest, n_features):
+        self.forest = forest
+        self.n_features = n_features
+        self.base_value = np.asarray(forest.value)[forest.roots].mean(axis=0)
+        self.contributions = path_contributions(forest, n_features)
+
+    def explain(self, X):
+        """Return (probabilities (n, classes), contributions (n, features, classes))
+
+        probabilities are the forest's own leaf-value averages, as from
+        CompiledForest.predict_proba, not the sum of the contributions.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        n_trees = self.forest.n_trees
+        value = self.forest.value
+        probabilities = np.empty((len(X), value.shape[1]), dtype=np.float64)
+        contributions = np.empty((len(X),) + self.contributions.shape[1:], dtype=np.float64)
+        chunk = max(1, MAX_GATHER_SIZE // (n_trees * self.contributions[0].size))
+        for start in range(0, len(X), chunk):
+            leaves = self.forest.apply(X[start:start + chunk])
+            probabilities[start:start + chunk] = value[leaves].sum(axis=0)
+            contributions[start:start + chunk] = self.contributions[leaves].sum(axis=0)
+        probabilities /= n_trees
+        contributions /= n_trees
+        return probabilities, contributions
@@ -0,0 +1,30 @@
+"""
+JSON encoding for hot API routes
+
+Uses orjson when it is installed and falls back to the stdlib json module
+with the same output settings FastAPI's JSONResponse uses.
+"""
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+HAVE_ORJSON = orjson is not None
+
+
+def dumps(content):
+    """Encode content to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse for content that is already plain JSON types; no jsonable_encoder pass"""
+
+    def render(self, content):
+        return dumps(content)
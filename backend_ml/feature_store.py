@@ -0,0 +1,198 @@
+"""
+Typed, memory-mapped cache of training datasets
+
+The first load of a CSV streams it in chunks into float32 feature and
+integer label-code .npy files plus a manifest, so even very large files
+never have to fit in memory. Later loads map those files read-only. The
+cache is keyed on the CSV's size and mtime, falling back to its SHA-256
+when only the mtime changed, and is rebuilt whenever the content differs.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from model_store import staging_dir, replace_dir
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+CHUNK_ROWS = 100_000
+
+
+def scan_csv(path):
+    """Return (sha256, newline count) from one pass over the raw bytes"""
+    digest = hashlib.sha256()
+    newlines = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+            newlines += block.count(b'\n')
+    return digest.hexdigest(), newlines
+
+
+def _write_manifest(manifest, path):
+    """Write a manifest through a temp file and os.replace, so readers never see it half written"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=MANIFEST_NAME + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class FeatureStore:
+    def __init__(self, cache_dir='feature_cache', chunk_rows=CHUNK_ROWS):
+        self.cache_dir = cache_dir
+        self.chunk_rows = chunk_rows
+
+    def _entry_dir(self, csv_path):
+        name = os.path.splitext(os.path.basename(csv_path))[0]
+        return os.path.join(self.cache_dir, name)
+
+    def load(self, csv_path, feature_names, label_column='label'):
+        """Return (features, label_codes, classes) for a CSV, building the cache if needed
+
+        features is a read-only (n, len(feature_names)) float32 memmap;
+        label_codes index into classes, which are sorted like LabelEncoder's.
+        With label_column=None only features are cached (codes None, classes []).
+        """
+        directory = self._entry_dir(csv_path)
+        manifest = self._valid_manifest(csv_path, directory, feature_names, label_column)
+        if manifest is None:
+            start = time.perf_counter()
+            manifest = self.build(csv_path, feature_names, label_column)
+            print(f"Feature cache for {csv_path} built in {time.perf_counter() - start:.2f}s "
+                  f"({manifest['rows']} rows)")
+
+        rows = manifest['rows']
+        features = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')[:rows]
+        label_codes = None
+        if label_column is not None:
+            label_codes = np.load(os.path.join(directory, 'labels.npy'), mmap_mode='r')[:rows]
+        return features, label_codes, manifest['classes']
+
+    def features_path(self, csv_path):
+        """Path of the cached feature matrix, for processes that map it themselves"""
+        return os.path.join(self._entry_dir(csv_path), 'features.npy')
+
+    def _valid_manifest(self, csv_path, directory, feature_names, label_column):
+        """The cached manifest if it still describes csv_path, else None"""
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if (manifest.get('format_version') != FORMAT_VERSION
+                or manifest['feature_names'] != list(feature_names)
+                or manifest['label_column'] != label_column):
+            return None
+
+        stat = os.stat(csv_path)
+        if stat.st_size != manifest['size']:
+            return None
+        if stat.st_mtime_ns != manifest['mtime_ns']:
+            # Touched or copied: only the content hash can tell
+            if scan_csv(csv_path)[0] != manifest['sha256']:
+                return None
+            manifest['mtime_ns'] = stat.st_mtime_ns
+            _write_manifest(manifest, manifest_path)
+        return manifest
+
+    def build(self, csv_path, feature_names, label_column='label'):
+        """Stream the CSV into the cache in chunks and return the new manifest"""
+        stat = os.stat(csv_path)
+        sha256, newlines = scan_csv(csv_path)
+        capacity = max(newlines, 1)  # upper bound on data rows; the manifest records the real count
+
+        # Each builder stages its own copy, so concurrent workers never share a tmp dir
+        directory = self._entry_dir(csv_path)
+        tmp_dir = staging_dir(directory)
+        try:
+            rows, classes = self._write(csv_path, feature_names, label_column, tmp_dir, capacity)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'source': os.path.abspath(csv_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256,
+            'rows': rows,
+            'feature_names': list(feature_names),
+            'label_column': label_column,
+            'classes': classes,
+            'created_at': time.time()
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        if not replace_dir(tmp_dir, directory):
+            # Another worker cached the same file first; use its copy if it is current
+            existing = self._valid_manifest(csv_path, directory, feature_names, label_column)
+            if existing is None:
+                raise RuntimeError(f"Feature cache for {csv_path} was replaced by a different build")
+            return existing
+        return manifest
+
+    def _write(self, csv_path, feature_names, label_column, tmp_dir, capacity):
+        """Write the feature and label-code arrays into tmp_dir; returns (rows, classes)"""
+        import pandas as pd
+
+        features = np.lib.format.open_memmap(
+            os.path.join(tmp_dir, 'features.npy'), mode='w+', dtype=np.float32,
+            shape=(capacity, len(feature_names))
+        )
+        codes = None
+        if label_column is not None:
+            codes = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, 'labels.npy'), mode='w+', dtype=np.uint16, shape=(capacity,)
+            )
+
+        # Codes are assigned in first-seen order and remapped to sorted order at the end
+        seen = {}
+        rows = 0
+        columns = list(feature_names)
+        dtypes = {name: np.float32 for name in feature_names}
+        if label_column is not None:
+            columns.append(label_column)
+            dtypes[label_column] = str
+        reader = pd.read_csv(csv_path, usecols=columns, dtype=dtypes, chunksize=self.chunk_rows)
+        for chunk in reader:
+            n = len(chunk)
+            features[rows:rows + n] = chunk[list(feature_names)].to_numpy(dtype=np.float32)
+            if codes is not None:
+                labels = pd.Categorical(chunk[label_column])
+                missing = np.flatnonzero(labels.codes < 0)
+                if len(missing):
+                    raise ValueError(
+                        f"{csv_path}: missing '{label_column}' in {len(missing)} row(s), "
+                        f"first at data row {rows + missing[0] + 1}"
+                    )
+                mapping = np.array([seen.setdefault(label, len(seen)) for label in labels.categories],
+                                   dtype=np.uint16)
+                codes[rows:rows + n] = mapping[labels.codes]
+            rows += n
+
+        classes = sorted(seen)
+        features.flush()
+        if codes is not None:
+            remap = np.empty(len(seen), dtype=np.uint16)
+            for label, code in seen.items():
+                remap[code] = classes.index(label)
+            for start in range(0, rows, self.chunk_rows):
+                codes[start:start + self.chunk_rows] = remap[codes[start:start + self.chunk_rows]]
+            codes.flush()
+        del features, codes
+
+        return rows, classes
+
+
+feature_store = FeatureStore(os.getenv('FEATURE_CACHE_DIR', 'feature_cache'))
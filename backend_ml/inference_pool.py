@@ -0,0 +1,135 @@
+"""
+Off-event-loop model inference with request micro-batching
+
+Prediction requests that arrive within `max_wait_ms` of each other are
+coalesced into a single forest call that runs in a bounded thread pool, so
+the asyncio event loop keeps serving sensor ingestion and pump control.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the inference queue is at max_queue_depth"""
+
+
+class MicroBatcher:
+    def __init__(self, model, max_batch_size=32, max_wait_ms=2.0, max_queue_depth=1024, workers=2):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_depth = max_queue_depth
+        self.workers = workers
+        self.executor = None
+
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._slots = None
+
+        self.requests = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.rejected = 0
+        self.largest_batch = 0
+        self.inference_seconds = 0.0
+        self.in_flight_batches = 0
+
+    def _ensure_started(self):
+        """Bind the queue and collector task to the running event loop"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._task = loop.create_task(self._collect())
+
+    async def start(self):
+        self._ensure_started()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    async def run(self, fn, *args):
+        """Run an arbitrary CPU-bound call on the inference pool"""
+        self._ensure_started()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def predict(self, temperature, humidity, ph, rainfall):
+        """Queue one reading and wait for its prediction"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        try:
+            self._queue.put_nowait(((temperature, humidity, ph, rainfall), future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Inference queue is full ({self.max_queue_depth} pending requests)")
+        self.requests += 1
+        return await future
+
+    async def _collect(self):
+        """Gather queued readings into batches and hand them to the pool"""
+        queue = self._queue
+        while True:
+            # Wait for a free worker first, so requests pile up into the
+            # next batch while all workers are busy
+            await self._slots.acquire()
+            batch = [await queue.get()]
+            if queue.empty() and self.max_wait > 0:
+                # Give concurrent requests a moment to join this batch
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            self._loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        readings = [reading for reading, _ in batch]
+        self.in_flight_batches += 1
+        start = time.perf_counter()
+        try:
+            results = await self._loop.run_in_executor(self.executor, self.model.predict_many, readings)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.inference_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.batched_requests += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.in_flight_batches -= 1
+            self._slots.release()
+
+    def stats(self):
+        """Queue and batching counters"""
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'workers': self.workers,
+            'in_flight_batches': self.in_flight_batches,
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'batches': self.batches,
+            'average_batch_size': round(self.batched_requests / self.batches, 2) if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'inference_seconds': round(self.inference_seconds, 6)
+        }
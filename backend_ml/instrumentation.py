@@ -0,0 +1,340 @@
+"""
+Lightweight metrics for the API service, exposed in Prometheus text format
+
+Histograms use fixed buckets and a lock per metric, so an observation costs
+a bisect and a few integer adds. Routes created with `InstrumentedRoute`
+record their total latency plus per-stage timings: validation (body parsing,
+dependencies), encoding (response validation and serialization) and any
+stage a handler marks with `stage()`, such as inference.
+"""
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+
+# Request/stage latency buckets in seconds, 100 us .. 10 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Rows per model call
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+# Seconds spent in stages of the request currently being handled
+_request_stages = ContextVar('request_stages', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time
+
+    The callback returns a number or, for labelled gauges, a dict of label
+    tuple -> number. Counters kept elsewhere (e.g. cache hits) are exposed
+    the same way with metric_type='counter'.
+    """
+
+    def __init__(self, name, help_text, callback, labelnames=(), metric_type='gauge'):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.metric_type}']
+        value = self.callback()
+        samples = value.items() if self.labelnames else [((), value)]
+        for labels, sample in samples:
+            if sample is not None:
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(sample)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self, *labels):
+        """(count, sum, per-bucket counts) for one label set"""
+        with self._lock:
+            series = list(self._series.get(labels, [0] * (len(self.buckets) + 1) + [0.0]))
+        return sum(series[:-1]), series[-1], series[:-1]
+
+    def quantile(self, q, *labels):
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        count, _, counts = self.snapshot(*labels)
+        if count == 0:
+            return None
+        rank = q * count
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                le = (('le', _format_value(float(bound))),)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(values[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.started_at = time.time()
+        self._started_monotonic = time.monotonic()
+
+    @property
+    def uptime(self):
+        return time.monotonic() - self._started_monotonic
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, callback, labelnames=(), metric_type='gauge'):
+        return self.register(Gauge(name, help_text, callback, labelnames, metric_type))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self.register(Histogram(name, help_text, buckets, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+REQUEST_LATENCY = metrics.histogram(
+    'http_request_duration_seconds', 'Request latency by route', labelnames=('method', 'route', 'status')
+)
+STAGE_LATENCY = metrics.histogram(
+    'http_request_stage_duration_seconds', 'Time spent per request stage', labelnames=('route', 'stage')
+)
+_in_flight = 0
+metrics.gauge('http_requests_in_flight', 'Requests currently being handled', lambda: _in_flight)
+LOOP_LAG = metrics.histogram(
+    'event_loop_lag_seconds', 'Delay of a periodic event-loop timer beyond its schedule'
+)
+MODEL_INFERENCE_LATENCY = metrics.histogram(
+    'model_inference_duration_seconds', 'Forest or grid evaluation time per model call', labelnames=('backend',)
+)
+MODEL_INFERENCE_ROWS = metrics.histogram(
+    'model_inference_batch_rows', 'Rows evaluated per model call', BATCH_SIZE_BUCKETS, labelnames=('backend',)
+)
+MODEL_INFERENCE_CALLS = metrics.counter(
+    'model_inference_calls_total', 'Model evaluation calls', labelnames=('backend',)
+)
+MODEL_INFERENCE_ROWS_TOTAL = metrics.counter(
+    'model_inference_rows_total', 'Rows evaluated by the model', labelnames=('backend',)
+)
+metrics.gauge('process_uptime_seconds', 'Seconds since the service started', lambda: metrics.uptime)
+
+
+class stage:
+    """Context manager adding elapsed time to a named stage of the current request"""
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+class InstrumentedRoute(APIRoute):
+    """APIRoute recording request latency and validation/handler/encoding stages
+
+    Use as `FastAPI(route_class=...)` or `APIRouter(route_class=...)`.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **kw):
+                stages = _request_stages.get()
+                if stages is not None:
+                    stages['_endpoint_start'] = time.perf_counter()
+                try:
+                    return await endpoint(*args, **kw)
+                finally:
+                    if stages is not None:
+                        stages['_endpoint_end'] = time.perf_counter()
+        else:
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **kw):
+                # Sync endpoints run in a worker thread with a copy of the context
+                stages = _request_stages.get()
+                if stages is not None:
+                    stages['_endpoint_start'] = time.perf_counter()
+                try:
+                    return endpoint(*args, **kw)
+                finally:
+                    if stages is not None:
+                        stages['_endpoint_end'] = time.perf_counter()
+        super().__init__(path, timed_endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def instrumented_handler(request):
+            global _in_flight
+            stages = {}
+            token = _request_stages.set(stages)
+            _in_flight += 1
+            status = 500
+            start = time.perf_counter()
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                status = 422
+                raise
+            finally:
+                end = time.perf_counter()
+                _in_flight -= 1
+                _request_stages.reset(token)
+                REQUEST_LATENCY.observe(end - start, request.method, route, status)
+
+                endpoint_start = stages.pop('_endpoint_start', None)
+                endpoint_end = stages.pop('_endpoint_end', None)
+                if endpoint_start is not None:
+                    stages['validation'] = endpoint_start - start
+                if endpoint_end is not None:
+                    stages['encoding'] = stages.get('encoding', 0.0) + end - endpoint_end
+                for name, seconds in stages.items():
+                    STAGE_LATENCY.observe(seconds, route, name)
+
+        return instrumented_handler
+
+
+def record_inference(model, rows, seconds):
+    """Inference hook for CropRecommendationModel.add_inference_hook"""
+    backend = model.backend
+    MODEL_INFERENCE_LATENCY.observe(seconds, backend)
+    MODEL_INFERENCE_ROWS.observe(rows, backend)
+    MODEL_INFERENCE_CALLS.inc(backend)
+    MODEL_INFERENCE_ROWS_TOTAL.inc(backend, amount=rows)
+
+
+class LoopLagMonitor:
+    """Measure how late a periodic timer fires; large values mean something blocked the loop"""
+
+    def __init__(self, interval=0.5, histogram=LOOP_LAG):
+        self.interval = interval
+        self.histogram = histogram
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.histogram.observe(lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,199 @@
+"""
+Predictive irrigation scheduling across many zones
+
+Each zone (sensor device) keeps its last `window` soil-moisture readings in
+one row of a 2-D array. A tick fits a least-squares drying trend for every
+zone at once, blends it with an evaporation estimate from temperature and
+humidity (vapour-pressure deficit) while a zone has too few readings, and
+predicts when each zone will cross the moisture threshold. Pumps start at
+(or `lead_seconds` before) the predicted crossing and stop once
+`irrigationDuration` has elapsed.
+"""
+import threading
+
+import numpy as np
+
+
+def vapour_pressure_deficit(temperature, humidity):
+    """VPD in kPa from air temperature (C) and relative humidity (%), Tetens formula"""
+    saturation = 0.6108 * np.exp(17.27 * temperature / (temperature + 237.3))
+    return saturation * (1.0 - np.clip(humidity, 0.0, 100.0) / 100.0)
+
+
+class IrrigationScheduler:
+    def __init__(self, window=32, trend_seconds=3600.0, min_trend_points=4, min_trend_span=300.0,
+                 drying_per_kpa_hour=0.5, lead_seconds=0.0, soak_seconds=600.0, capacity=64):
+        self.window = window
+        self.trend_seconds = trend_seconds
+        self.min_trend_points = min_trend_points
+        self.min_trend_span = min_trend_span
+        self.drying_per_kpa_second = drying_per_kpa_hour / 3600.0
+        self.lead_seconds = lead_seconds
+        self.soak_seconds = soak_seconds
+
+        self.zone_ids = []
+        self._index = {}
+        self._allocate(capacity)
+        self._lock = threading.Lock()
+
+    def _allocate(self, capacity):
+        """Create or grow the per-zone arrays to `capacity` rows"""
+        columns = {
+            'timestamps': (np.float64, np.nan, (self.window,)),
+            'moisture': (np.float64, np.nan, (self.window,)),
+            'temperature': (np.float64, np.nan, ()),
+            'humidity': (np.float64, np.nan, ()),
+            'written': (np.int64, 0, ()),
+            'pump_on': (bool, False, ()),
+            'pump_until': (np.float64, np.nan, ()),
+            'rest_until': (np.float64, -np.inf, ()),
+        }
+        for name, (dtype, fill, shape) in columns.items():
+            array = np.full((capacity,) + shape, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                array[:len(old)] = old
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def _zone(self, zone_id):
+        index = self._index.get(zone_id)
+        if index is None:
+            index = len(self.zone_ids)
+            if index == self.capacity:
+                self._allocate(self.capacity * 2)
+            self.zone_ids.append(zone_id)
+            self._index[zone_id] = index
+        return index
+
+    def observe(self, zone_id, timestamp, temperature, humidity, moisture):
+        """Record one reading; timestamp in epoch seconds"""
+        with self._lock:
+            i = self._zone(zone_id)
+            slot = self.written[i] % self.window
+            self.timestamps[i, slot] = timestamp
+            self.moisture[i, slot] = moisture
+            self.temperature[i] = temperature
+            self.humidity[i] = humidity
+            self.written[i] += 1
+
+    def observe_many(self, zone_id, timestamps, values):
+        """Record a batch of readings; values columns are temperature, humidity, soil moisture"""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(timestamps) == 0:
+            return
+        newest = np.argsort(timestamps, kind='stable')[-self.window:]
+        with self._lock:
+            i = self._zone(zone_id)
+            slots = (self.written[i] + np.arange(len(newest))) % self.window
+            self.timestamps[i, slots] = timestamps[newest]
+            self.moisture[i, slots] = values[newest, 2]
+            self.temperature[i] = values[newest[-1], 0]
+            self.humidity[i] = values[newest[-1], 1]
+            self.written[i] += len(newest)
+
+    def set_pump(self, zone_id, on, now, duration_seconds):
+        """Reflect a pump change made outside tick()
+
+        A pump switched on gets a duration_seconds deadline, but only tick()
+        acts on it, and the server ticks only in auto mode: a pump started
+        manually keeps running until it is switched off again.
+        """
+        with self._lock:
+            i = self._zone(zone_id)
+            self.pump_on[i] = on
+            self.pump_until[i] = now + duration_seconds if on else np.nan
+            if not on:
+                self.rest_until[i] = now + self.soak_seconds
+
+    def _rows(self, zone_ids):
+        if zone_ids is None:
+            return np.arange(len(self.zone_ids))
+        return np.array([self._index[z] for z in zone_ids if z in self._index], dtype=np.int64)
+
+    def forecast(self, now, threshold, rows):
+        """Current moisture, drying rate (%/s) and seconds until `threshold` for the given rows"""
+        timestamps = self.timestamps[rows]
+        moisture = self.moisture[rows]
+
+        # Least-squares slope over readings inside the trend window, all zones at once
+        valid = timestamps >= now - self.trend_seconds
+        count = valid.sum(axis=1)
+        t = np.where(valid, timestamps - now, 0.0)
+        y = np.where(valid, moisture, 0.0)
+        divisor = np.maximum(count, 1)
+        dt = np.where(valid, t - (t.sum(axis=1) / divisor)[:, None], 0.0)
+        dy = np.where(valid, y - (y.sum(axis=1) / divisor)[:, None], 0.0)
+        variance = (dt * dt).sum(axis=1)
+        slope = np.divide((dt * dy).sum(axis=1), variance, out=np.zeros(len(rows)), where=variance > 0)
+
+        # Trust the observed trend in proportion to how many readings back it; readings
+        # bunched closer together than min_trend_span say nothing about drying
+        span = np.where(valid, t, -np.inf).max(axis=1) - np.where(valid, t, np.inf).min(axis=1)
+        weight = np.clip((count - 1) / max(1, self.min_trend_points - 1), 0.0, 1.0)
+        weight[~(span >= self.min_trend_span)] = 0.0
+        evaporation = self.drying_per_kpa_second * vapour_pressure_deficit(self.temperature[rows], self.humidity[rows])
+        evaporation = np.nan_to_num(evaporation)
+        drying_rate = weight * -slope + (1.0 - weight) * evaporation
+
+        latest = moisture[np.arange(len(rows)), (self.written[rows] - 1) % self.window]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            seconds = np.where(drying_rate > 0, (latest - threshold) / drying_rate, np.inf)
+        seconds = np.where(latest < threshold, 0.0, np.maximum(seconds, 0.0))
+        seconds[np.isnan(latest)] = np.inf
+        return latest, drying_rate, seconds
+
+    def tick(self, now, threshold, duration_seconds, zone_ids=None):
+        """Switch pumps for the given zones (all by default); returns (turned_on, turned_off) ids"""
+        with self._lock:
+            rows = self._rows(zone_ids)
+            if len(rows) == 0:
+                return [], []
+            latest, _, seconds = self.forecast(now, threshold, rows)
+
+            pump_on = self.pump_on[rows]
+            stop = pump_on & (now >= self.pump_until[rows])
+            due = (latest < threshold) | ((self.lead_seconds > 0) & (seconds <= self.lead_seconds))
+            start = ~pump_on & due & (now >= self.rest_until[rows])
+
+            stopped, started = rows[stop], rows[start]
+            self.pump_on[stopped] = False
+            self.pump_until[stopped] = np.nan
+            self.rest_until[stopped] = now + self.soak_seconds
+            self.pump_on[started] = True
+            self.pump_until[started] = now + duration_seconds
+
+            return [self.zone_ids[i] for i in started], [self.zone_ids[i] for i in stopped]
+
+    def schedule(self, now, threshold, duration_seconds, horizon_seconds, zone_ids=None):
+        """Per-zone forecast and pump on/off timeline (epoch seconds) within the horizon"""
+        with self._lock:
+            rows = self._rows(zone_ids)
+            latest, drying_rate, seconds = self.forecast(now, threshold, rows)
+            pump_on = self.pump_on[rows].copy()
+            pump_until = self.pump_until[rows].copy()
+            rest_until = self.rest_until[rows].copy()
+            zone_ids = [self.zone_ids[i] for i in rows]
+
+        # Idle zones: next start at the predicted crossing, but not before the soak period ends
+        next_on = np.maximum(now + np.maximum(seconds - self.lead_seconds, 0.0), rest_until)
+        next_on = np.where(pump_on, np.nan, next_on)
+        in_horizon = next_on <= now + horizon_seconds
+
+        zones = []
+        for j, zone_id in enumerate(zone_ids):
+            timeline = []
+            if pump_on[j]:
+                timeline.append({'at': float(pump_until[j]), 'pump': 'off'})
+            elif in_horizon[j]:
+                timeline.append({'at': float(next_on[j]), 'pump': 'on'})
+                timeline.append({'at': float(next_on[j] + duration_seconds), 'pump': 'off'})
+            zones.append({
+                'zoneId': zone_id,
+                'soilMoisture': None if np.isnan(latest[j]) else round(float(latest[j]), 2),
+                'dryingRatePerHour': round(float(drying_rate[j]) * 3600.0, 3),
+                'secondsToThreshold': None if np.isinf(seconds[j]) else round(float(seconds[j]), 1),
+                'pumpStatus': bool(pump_on[j]),
+                'timeline': timeline
+            })
+        return zones
@@ -0,0 +1,109 @@
+"""
+Server-push fan-out of live sensor, pump and settings updates
+
+Updates published within `coalesce_ms` of each other are merged (the latest
+payload per topic wins) and encoded once, then pushed to every subscriber's
+bounded queue. A slow client only ever loses its own oldest messages.
+"""
+import asyncio
+import json
+from collections import deque
+
+
+class Subscriber:
+    __slots__ = ('queue', 'event', 'dropped', 'closed')
+
+    def __init__(self, max_queue):
+        self.queue = deque(maxlen=max_queue)
+        self.event = asyncio.Event()
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, message):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1  # deque(maxlen) discards the oldest entry
+        self.queue.append(message)
+        self.event.set()
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+
+    async def get(self):
+        """Next (json_text, sse_text) message, or None once closed"""
+        while not self.queue:
+            if self.closed:
+                return None
+            self.event.clear()
+            await self.event.wait()
+        return self.queue.popleft()
+
+
+class LiveBroadcaster:
+    def __init__(self, max_queue=64, coalesce_ms=50.0):
+        self.max_queue = max_queue
+        self.coalesce = coalesce_ms / 1000.0
+        self._subscribers = set()
+        self._pending = {}
+        self._flush_scheduled = False
+        self._loop = None
+
+        self.published = 0
+        self.flushes = 0
+        self.messages_sent = 0
+
+    def subscribe(self):
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(self.max_queue)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+        subscriber.close()
+
+    @staticmethod
+    def encode(message_type, data):
+        """Encode a message once for both WebSocket (JSON) and SSE clients"""
+        text = json.dumps({'type': message_type, 'data': data}, default=str)
+        return text, f"event: {message_type}\ndata: {text}\n\n"
+
+    def publish(self, message_type, data, key=None):
+        """Queue an update; bursts for the same (type, key) collapse to the latest"""
+        if not self._subscribers:
+            return
+        self.published += 1
+        self._pending[(message_type, key)] = (message_type, dict(data))
+        if self._flush_scheduled:
+            return
+
+        self._flush_scheduled = True
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._loop.call_later(self.coalesce, self._flush)
+        else:
+            self._loop.call_soon_threadsafe(self._loop.call_later, self.coalesce, self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, {}
+        self.flushes += 1
+        for message_type, data in pending.values():
+            message = self.encode(message_type, data)
+            for subscriber in self._subscribers:
+                subscriber.push(message)
+            self.messages_sent += len(self._subscribers)
+
+    def stats(self):
+        return {
+            'subscribers': len(self._subscribers),
+            'max_queue': self.max_queue,
+            'coalesce_ms': self.coalesce * 1000.0,
+            'published': self.published,
+            'flushes': self.flushes,
+            'messages_sent': self.messages_sent,
+            'dropped': sum(subscriber.dropped for subscriber in self._subscribers)
+        }
@@ -0,0 +1,172 @@
+"""
+Precomputed crop probabilities over a 4-D grid of the input domain
+
+The grid covers the ranges accepted by CropPredictionRequest and is stored
+as a plain .npy file, so every worker process can memory-map the same pages.
+Requests are then answered by index arithmetic instead of a forest walk.
+
+The .npy file is named after a digest of its metadata and the metadata file
+is swapped in last, so a reader can never pair a grid with another build's
+shape or fingerprint, even while several workers build at once.
+"""
+import glob
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# (min, max) per feature, matching CropPredictionRequest validation
+DEFAULT_BOUNDS = ((-10.0, 50.0), (0.0, 100.0), (0.0, 14.0), (0.0, 500.0))
+
+# Points per feature axis; 25 x 21 x 15 x 26 x 22 classes is ~18 MB of float32
+DEFAULT_SHAPE = (25, 21, 15, 26)
+
+# Rows sent to the forest at once while building
+BUILD_CHUNK_ROWS = 65536
+
+
+def model_fingerprint(forest):
+    """Digest of the fitted trees, used to tell whether a stored grid is stale
+
+    Accepts a sklearn forest or a CompiledForest.
+    """
+    digest = hashlib.sha1()
+    if not hasattr(forest, 'estimators_'):
+        digest.update(np.ascontiguousarray(forest.feature).tobytes())
+        digest.update(np.ascontiguousarray(forest.threshold).tobytes())
+        return digest.hexdigest()
+
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        digest.update(tree.feature.tobytes())
+        digest.update(tree.threshold.tobytes())
+    return digest.hexdigest()
+
+
+class PredictionGrid:
+    def __init__(self, probabilities, bounds, classes, fingerprint, interpolate=False):
+        self.probabilities = probabilities
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self.shape = probabilities.shape[:-1]
+        self.classes = list(classes)
+        self.fingerprint = fingerprint
+        self.interpolate = interpolate
+
+        self._low = self.bounds[:, 0]
+        self._high = self.bounds[:, 1]
+        self._scale = (np.asarray(self.shape, dtype=np.float64) - 1) / (self._high - self._low)
+        self._max_index = np.asarray(self.shape, dtype=np.int64) - 1
+        self._corners = np.array(list(itertools.product((0, 1), repeat=len(self.shape))))
+
+    @staticmethod
+    def metadata_path(path):
+        return os.path.splitext(path)[0] + '.json'
+
+    @staticmethod
+    def data_path(path, metadata):
+        """Where the probabilities described by metadata are stored"""
+        key = hashlib.sha1(json.dumps(metadata, sort_keys=True).encode()).hexdigest()[:16]
+        stem, ext = os.path.splitext(path)
+        return f'{stem}-{key}{ext}'
+
+    @staticmethod
+    def _replace_atomically(path, write):
+        """Call write(tmp_path) on a private temp file next to path, then rename it over path"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                        prefix=os.path.basename(path) + '.', suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def build(cls, predict_proba, path, classes, fingerprint, shape=DEFAULT_SHAPE,
+              bounds=DEFAULT_BOUNDS, interpolate=False):
+        """Evaluate predict_proba at every grid point and write the result next to path"""
+        axes = [np.linspace(low, high, points) for (low, high), points in zip(bounds, shape)]
+        n_points = int(np.prod(shape))
+        metadata = {
+            'shape': list(shape),
+            'bounds': [list(b) for b in bounds],
+            'classes': list(classes),
+            'fingerprint': fingerprint
+        }
+        data_path = cls.data_path(path, metadata)
+        mapped = []
+
+        def write_grid(tmp_path):
+            grid = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=np.float32, shape=(n_points, len(classes))
+            )
+            for start in range(0, n_points, BUILD_CHUNK_ROWS):
+                flat = np.arange(start, min(start + BUILD_CHUNK_ROWS, n_points))
+                indices = np.unravel_index(flat, shape)
+                X = np.column_stack([axis[index] for axis, index in zip(axes, indices)])
+                grid[start:start + len(flat)] = predict_proba(X)
+            grid.flush()
+            del grid
+            # Map before the rename so a concurrent build cannot unlink it from under us
+            mapped.append(np.load(tmp_path, mmap_mode='r'))
+
+        # Each builder writes its own temp files and renames them into place,
+        # the data first, so the metadata never names a file that is not complete
+        cls._replace_atomically(data_path, write_grid)
+
+        def write_metadata(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump(metadata, f)
+
+        cls._replace_atomically(cls.metadata_path(path), write_metadata)
+
+        # Grids from earlier builds; workers that mapped them keep their inodes
+        stem, ext = os.path.splitext(path)
+        for stale in glob.glob(f'{glob.escape(stem)}-*{ext}'):
+            if stale != data_path:
+                try:
+                    os.unlink(stale)
+                except FileNotFoundError:
+                    pass
+
+        return cls(mapped[0].reshape(tuple(shape) + (len(classes),)), bounds, classes, fingerprint,
+                   interpolate=interpolate)
+
+    @classmethod
+    def load(cls, path, interpolate=False):
+        """Memory-map a grid written by build, or return None if it is missing"""
+        try:
+            with open(cls.metadata_path(path)) as f:
+                metadata = json.load(f)
+            flat = np.load(cls.data_path(path, metadata), mmap_mode='r')
+        except FileNotFoundError:
+            # Not built yet, or replaced by a concurrent build since the metadata was read
+            return None
+        probabilities = flat.reshape(tuple(metadata['shape']) + (flat.shape[1],))
+        return cls(probabilities, metadata['bounds'], metadata['classes'],
+                   metadata['fingerprint'], interpolate=interpolate)
+
+    def contains(self, X):
+        """Mask of rows that fall inside the grid bounds"""
+        return np.all((X >= self._low) & (X <= self._high), axis=1)
+
+    def lookup(self, X):
+        """Class probabilities for in-bounds rows of X, shaped (n, n_classes)"""
+        position = (np.asarray(X, dtype=np.float64) - self._low) * self._scale
+
+        if not self.interpolate:
+            index = np.clip(np.rint(position).astype(np.int64), 0, self._max_index)
+            return self.probabilities[tuple(index.T)].astype(np.float64)
+
+        # Multilinear interpolation between the 16 surrounding grid points
+        base = np.clip(np.floor(position).astype(np.int64), 0, np.maximum(self._max_index - 1, 0))
+        frac = np.clip(position - base, 0.0, 1.0)
+        corners = self._corners
+        weights = np.prod(np.where(corners == 1, frac[:, None, :], 1.0 - frac[:, None, :]), axis=2)
+        index = np.minimum(base[:, None, :] + corners, self._max_index)
+        neighbours = self.probabilities[tuple(np.moveaxis(index, 2, 0))]
+        return np.einsum('nk,nkc->nc', weights, neighbours)
@@ -1,31 +1,88 @@
-import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
 import pickle
 import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from compiled_forest import CompiledForest
+from prediction_cache import PredictionCache, DEFAULT_RESOLUTION
+from lookup_grid import PredictionGrid, model_fingerprint, DEFAULT_SHAPE
+from model_store import save_arrays, load_arrays, has_arrays
+from feature_store import feature_store
+from crop_catalog import crop_catalog
+from explain import ForestExplainer
+
+# Inference backends: sklearn's own predict_proba, or the packed-array evaluator
+BACKENDS = ('sklearn', 'compiled')
+
+# Persistence formats: pickled sklearn objects, or memory-mapped node arrays
+MODEL_FORMATS = ('pickle', 'arrays')
+
+# Lifecycle states reported by CropRecommendationModel.state
+MODEL_STATES = ('not_loaded', 'loading', 'training', 'ready', 'failed')
+
+# Above this many rows sklearn's C tree walk overtakes the NumPy evaluator
+COMPILED_MAX_ROWS = 200
+
+# Random forest hyperparameters shared by training and retraining
+FOREST_PARAMS = {'n_estimators': 100, 'max_depth': 20, 'random_state': 42}
+
+def rank_classes(probabilities):
+    """Class indices by descending probability along the last axis
+
+    Ties keep the legacy `np.argsort(p)[::-1]` order, highest class index first.
+    """
+    order = np.argsort(-probabilities[..., ::-1], axis=-1, kind='stable')
+    return probabilities.shape[-1] - 1 - order
+
+# Everything a prediction reads, published as one object so a retrain can
+# swap models without a request ever mixing old trees with new labels
+ServingState = namedtuple('ServingState', 'model compiled_forest grid class_names class_labels')
 
 class CropRecommendationModel:
-    def __init__(self):
+    def __init__(self, backend='sklearn', model_format='pickle'):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        if model_format not in MODEL_FORMATS:
+            raise ValueError(f"Unknown model format '{model_format}', expected one of {MODEL_FORMATS}")
+        self.backend = backend
+        self.model_format = model_format
         self.model = None
+        self.compiled_forest = None
+        self.cache = None
+        self.explanation_cache = None
+        self.grid = None
+        self.grid_options = None
         self.label_encoder = None
         self.feature_names = ['temperature', 'humidity', 'ph', 'rainfall']
         self.model_path = 'crop_recommendation_model.pkl'
         self.encoder_path = 'label_encoder.pkl'
+        self.arrays_path = 'crop_recommendation_model'
+        self.grid_path = 'crop_recommendation_grid.npy'
+        self.class_names = None
+        self.class_labels = ()
+        self.state = 'not_loaded'
+        self.load_error = None
+        self._serving = None
+        self._inference_hooks = []
+        self._explainer = None
+        self._buffers = threading.local()
+        self._loader = None
         
     def train_model(self, csv_path='Crop_recommendation.csv'):
         """Train the crop recommendation model"""
-        # Load dataset
-        df = pd.read_csv(csv_path)
+        # Heavy imports are deferred so importing this module stays cheap
+        from sklearn.model_selection import train_test_split
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.preprocessing import LabelEncoder
         
-        # Prepare features and target
-        X = df[self.feature_names]
-        y = df['label']
+        # Load dataset from the typed cache; float32 is what the trees split on anyway
+        X, y_encoded, classes = feature_store.load(csv_path, self.feature_names)
         
-        # Encode labels
-        self.label_encoder = LabelEncoder()
-        y_encoded = self.label_encoder.fit_transform(y)
+        # Codes are already sorted-class indices, so fitting on the classes reproduces them
+        self.label_encoder = LabelEncoder().fit(classes)
+        y_encoded = np.asarray(y_encoded, dtype=np.intp)
         
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(
@@ -33,18 +90,15 @@ class CropRecommendationModel:
         )
         
         # Train Random Forest model
-        self.model = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=20,
-            random_state=42,
-            n_jobs=-1
-        )
+        self.model = RandomForestClassifier(**FOREST_PARAMS, n_jobs=-1)
         self.model.fit(X_train, y_train)
         
         # Calculate accuracy
         accuracy = self.model.score(X_test, y_test)
         print(f"Model trained with accuracy: {accuracy * 100:.2f}%")
         
+        self._prepare_for_inference()
+        
         # Save model and encoder
         self.save_model()
         
@@ -52,304 +106,455 @@ class CropRecommendationModel:
     
     def save_model(self):
         """Save the trained model and label encoder"""
-        with open(self.model_path, 'wb') as f:
-            pickle.dump(self.model, f)
-        with open(self.encoder_path, 'wb') as f:
-            pickle.dump(self.label_encoder, f)
+        if self.model_format == 'arrays':
+            forest = self.compiled_forest
+            if forest is None:
+                forest = CompiledForest.from_sklearn(self.model)
+            save_arrays(forest, self.class_labels, self.feature_names, self.arrays_path)
+            print("Model arrays and manifest saved successfully!")
+            return
+        
+        # Write both pickles beside their targets first, so a hot swap that
+        # crashes, or a loader in another worker, never sees a truncated file
+        staged = [(self._pickle_to_temp(obj, path), path)
+                  for obj, path in ((self.model, self.model_path), (self.label_encoder, self.encoder_path))]
+        for tmp_path, path in staged:
+            os.replace(tmp_path, path)
         print("Model and encoder saved successfully!")
     
+    @staticmethod
+    def _pickle_to_temp(obj, path):
+        """Pickle obj into a new temp file in path's directory and return its name"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                        prefix=os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(obj, f)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path
+    
     def load_model(self):
         """Load the trained model and label encoder"""
+        if self.model_format == 'arrays' and has_arrays(self.arrays_path):
+            forest, manifest = load_arrays(self.arrays_path)
+            self.model = None
+            self.label_encoder = None
+            self.compiled_forest = forest
+            self._prepare_for_inference(classes=manifest['classes'])
+            print("Model arrays memory-mapped successfully!")
+            return True
+        
         if os.path.exists(self.model_path) and os.path.exists(self.encoder_path):
             with open(self.model_path, 'rb') as f:
                 self.model = pickle.load(f)
             with open(self.encoder_path, 'rb') as f:
                 self.label_encoder = pickle.load(f)
+            self._prepare_for_inference()
             print("Model and encoder loaded successfully!")
+            if self.model_format == 'arrays':
+                # Migrate: next start maps the arrays instead of unpickling
+                self.save_model()
             return True
         else:
             print("Model files not found. Please train the model first.")
             return False
     
+    @property
+    def is_ready(self):
+        return self.state == 'ready'
+    
+    def load_or_train(self, csv_path='Crop_recommendation.csv'):
+        """Load the saved model, training a new one if none exists"""
+        self.state = 'loading'
+        self.load_error = None
+        try:
+            if not self.load_model():
+                self.state = 'training'
+                print("Training new model...")
+                # Make sure to place Crop_recommendation.csv in the same directory
+                self.train_model(csv_path)
+        except Exception as e:
+            self.state = 'failed'
+            self.load_error = str(e)
+            print(f"Model loading failed: {e}")
+            raise
+    
+    def start_background_load(self, csv_path='Crop_recommendation.csv'):
+        """Load or train the model on a daemon thread and return immediately"""
+        if self._loader is not None and self._loader.is_alive():
+            return self._loader
+        
+        def run():
+            try:
+                self.load_or_train(csv_path)
+            except Exception:
+                pass  # already recorded in state / load_error
+        
+        self._loader = threading.Thread(target=run, name='model-loader', daemon=True)
+        self._loader.start()
+        return self._loader
+    
+    def _prepare_for_inference(self, classes=None):
+        """Cache everything the prediction paths need after a train or load"""
+        if classes is None:
+            classes = self.label_encoder.classes_
+        self.class_names = np.asarray(classes)
+        self.class_labels = tuple(self.class_names.tolist())
+        
+        # Forests mapped from the arrays format have no sklearn object
+        if self.model is not None:
+            # Thread dispatch costs far more than walking 100 trees for a few rows
+            self.model.set_params(n_jobs=1)
+            
+            # Models pickled before training switched to arrays remember the
+            # DataFrame columns and would warn on every array input
+            if hasattr(self.model, 'feature_names_in_'):
+                del self.model.feature_names_in_
+            
+            self.compiled_forest = None
+            if self.backend == 'compiled':
+                self.compiled_forest = CompiledForest.from_sklearn(self.model)
+        
+        serving = ServingState(self.model, self.compiled_forest, None, self.class_names, self.class_labels)
+        if self.grid_options is not None:
+            serving = serving._replace(grid=self._prepare_grid(serving))
+        self.grid = serving.grid
+        
+        # Single reference assignment: requests already running keep the old state
+        self._serving = serving
+        
+        # Cached answers came from the previous model
+        if self.cache is not None:
+            self.cache.clear()
+        if self.explanation_cache is not None:
+            self.explanation_cache.clear()
+        
+        self.state = 'ready'
+    
+    def install_model(self, model, label_encoder):
+        """Hot-swap a newly fitted sklearn forest and persist it"""
+        self.model = model
+        self.label_encoder = label_encoder
+        self._prepare_for_inference()
+        self.save_model()
+    
+    def install_forest(self, forest, classes):
+        """Hot-swap a CompiledForest that has no sklearn object (e.g. from the arrays format)"""
+        if self.model_format != 'arrays':
+            raise ValueError("A forest without its sklearn object can only be persisted in the arrays format")
+        self.model = None
+        self.label_encoder = None
+        self.compiled_forest = forest
+        self._prepare_for_inference(classes=classes)
+        self.save_model()
+    
+    def enable_cache(self, max_size=4096, ttl=300.0, resolution=DEFAULT_RESOLUTION):
+        """Serve repeated, nearly identical predictions from a quantized LRU cache"""
+        self.cache = PredictionCache(max_size=max_size, ttl=ttl, resolution=resolution)
+        self.explanation_cache = PredictionCache(max_size=max_size, ttl=ttl, resolution=resolution)
+        return self.cache
+    
+    def enable_grid(self, shape=DEFAULT_SHAPE, interpolate=False):
+        """Answer in-range requests from a precomputed probability grid"""
+        self.grid_options = {'shape': tuple(shape), 'interpolate': interpolate}
+        if self.is_ready:
+            serving = self._serving
+            self._serving = serving._replace(grid=self._prepare_grid(serving))
+            self.grid = self._serving.grid
+    
+    def _prepare_grid(self, serving):
+        """Memory-map the stored grid, rebuilding it if it belongs to another model"""
+        forest = serving.model if serving.model is not None else serving.compiled_forest
+        fingerprint = model_fingerprint(forest)
+        shape = self.grid_options['shape']
+        interpolate = self.grid_options['interpolate']
+        
+        grid = PredictionGrid.load(self.grid_path, interpolate=interpolate)
+        if (grid is None or grid.fingerprint != fingerprint
+                or grid.shape != shape or grid.classes != list(serving.class_labels)):
+            print(f"Building prediction grid {shape}...")
+            grid = PredictionGrid.build(
+                lambda X: self._forest_proba(X, serving), self.grid_path, serving.class_labels,
+                fingerprint, shape=shape, interpolate=interpolate
+            )
+        return grid
+    
+    def _forest_proba(self, X, serving):
+        """Class probabilities for an (n, 4) float array from the active backend"""
+        forest = serving.compiled_forest
+        if forest is not None and (serving.model is None or len(X) <= COMPILED_MAX_ROWS):
+            return forest.predict_proba(X)
+        return serving.model.predict_proba(X)
+    
+    def add_inference_hook(self, hook):
+        """Call hook(model, rows, seconds) after every grid/forest evaluation"""
+        self._inference_hooks.append(hook)
+    
+    def _predict_proba(self, X, serving):
+        """Class probabilities for X, timed for the inference hooks"""
+        hooks = self._inference_hooks
+        if not hooks:
+            return self._lookup_proba(X, serving)
+        
+        start = time.perf_counter()
+        probabilities = self._lookup_proba(X, serving)
+        elapsed = time.perf_counter() - start
+        for hook in hooks:
+            hook(self, len(X), elapsed)
+        return probabilities
+    
+    def _lookup_proba(self, X, serving):
+        """Class probabilities, from the grid where it covers the input"""
+        grid = serving.grid
+        if grid is None:
+            return self._forest_proba(X, serving)
+        
+        inside = grid.contains(X)
+        if inside.all():
+            return grid.lookup(X)
+        
+        probabilities = np.empty((len(X), len(serving.class_labels)), dtype=np.float64)
+        probabilities[inside] = grid.lookup(X[inside])
+        probabilities[~inside] = self._forest_proba(X[~inside], serving)
+        return probabilities
+    
+    def _input_row(self):
+        """Return this thread's preallocated (1, 4) input buffer"""
+        row = getattr(self._buffers, 'row', None)
+        if row is None:
+            row = np.empty((1, len(self.feature_names)), dtype=np.float64)
+            self._buffers.row = row
+        return row
+    
     def predict(self, temperature, humidity, ph, rainfall):
         """Predict crop recommendation"""
-        if self.model is None or self.label_encoder is None:
+        if self._serving is None:
             raise ValueError("Model not loaded. Please load or train the model first.")
         
-        # Prepare input data
-        input_data = pd.DataFrame({
-            'temperature': [temperature],
-            'humidity': [humidity],
-            'ph': [ph],
-            'rainfall': [rainfall]
-        })
-        
-        # Make prediction
-        prediction = self.model.predict(input_data)
-        predicted_crop = self.label_encoder.inverse_transform(prediction)[0]
-        
-        # Get prediction probabilities
-        probabilities = self.model.predict_proba(input_data)[0]
-        
-        # Get top 5 recommendations
-        top_indices = np.argsort(probabilities)[::-1][:5]
-        recommendations = []
-        
-        for idx in top_indices:
-            crop_name = self.label_encoder.inverse_transform([idx])[0]
-            confidence = float(probabilities[idx] * 100)
-            recommendations.append({
-                'crop': crop_name,
-                'confidence': round(confidence, 2)
-            })
+        cache = self.cache
+        if cache is None:
+            return self._predict_row(temperature, humidity, ph, rainfall)
+        
+        # Predict on the grid point itself so every input in a cell gets the same answer
+        key = cache.key(temperature, humidity, ph, rainfall)
+        prediction = cache.get(key)
+        if prediction is None:
+            generation = cache.generation
+            prediction = self._predict_row(*cache.snap(key))
+            cache.put(key, prediction, generation)
+        return prediction
+    
+    def _predict_row(self, temperature, humidity, ph, rainfall):
+        """Run the forest for a single reading"""
+        # Fill the contiguous input row in place instead of building a DataFrame
+        row = self._input_row()
+        row[0, 0] = temperature
+        row[0, 1] = humidity
+        row[0, 2] = ph
+        row[0, 3] = rainfall
+        
+        # Single forest pass; the predicted class is the argmax of its probabilities
+        serving = self._serving
+        probabilities = self._predict_proba(row, serving)[0]
+        return self._format_prediction(probabilities, serving.class_labels)
+    
+    def _format_prediction(self, probabilities, labels, top_k=5):
+        """Build the prediction result for one row of class probabilities"""
+        top_indices = rank_classes(probabilities)[:top_k].tolist()
+        confidences = np.round(probabilities * 100, 2)
         
+        recommendations = [
+            {'crop': labels[idx], 'confidence': float(confidences[idx])}
+            for idx in top_indices
+        ]
+        
+        # The recommended crop is the forest's argmax (lowest index on ties), as before
+        best = int(np.argmax(probabilities))
         return {
-            'recommended_crop': predicted_crop,
-            'confidence': round(float(probabilities[prediction[0]] * 100), 2),
+            'recommended_crop': labels[best],
+            'confidence': float(confidences[best]),
             'all_recommendations': recommendations
         }
     
+    def predict_many(self, readings):
+        """Predict a list of (temperature, humidity, ph, rainfall) tuples
+        
+        Uses the prediction cache like `predict`, but scores all misses in a
+        single `predict_batch` call.
+        """
+        cache = self.cache
+        if cache is None:
+            return self.predict_batch(readings)
+        
+        generation = cache.generation
+        keys = [cache.key(*reading) for reading in readings]
+        results = [cache.get(key) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            computed = self.predict_batch([cache.snap(keys[i]) for i in misses])
+            for i, prediction in zip(misses, computed):
+                results[i] = prediction
+                cache.put(keys[i], prediction, generation)
+        return results
+    
+    def predict_batch(self, readings, top_k=5):
+        """Predict crop recommendations for many readings in a single forest pass
+        
+        `readings` is an (n, 4) array-like with columns ordered as
+        `feature_names`. Returns one result per row, shaped like `predict`.
+        """
+        serving = self._serving
+        if serving is None:
+            raise ValueError("Model not loaded. Please load or train the model first.")
+        
+        X = np.asarray(readings, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise ValueError(f"Expected readings of shape (n, {len(self.feature_names)}), got {X.shape}")
+        if len(X) == 0:
+            return []
+        
+        # One predict_proba call for the whole batch
+        probabilities = self._predict_proba(X, serving)
+        n_rows, n_classes = probabilities.shape
+        k = max(1, min(top_k, n_classes))
+        
+        # Same ranking and argmax as predict, so ties come out identically
+        top_indices = rank_classes(probabilities)[:, :k]
+        rows = np.arange(n_rows)[:, None]
+        best = probabilities.argmax(axis=1)
+        
+        top_names = serving.class_names[top_indices].tolist()
+        top_confidences = np.round(probabilities[rows, top_indices] * 100, 2).tolist()
+        best_names = serving.class_names[best].tolist()
+        best_confidences = np.round(probabilities[np.arange(n_rows), best] * 100, 2).tolist()
+        
+        results = []
+        for names, confidences, best_name, best_confidence in zip(
+                top_names, top_confidences, best_names, best_confidences):
+            results.append({
+                'recommended_crop': best_name,
+                'confidence': best_confidence,
+                'all_recommendations': [
+                    {'crop': crop, 'confidence': confidence}
+                    for crop, confidence in zip(names, confidences)
+                ]
+            })
+        
+        return results
+    
+    def _get_explainer(self, serving):
+        """Tree-path explainer for the serving forest, built once per model"""
+        forest = serving.model if serving.model is not None else serving.compiled_forest
+        cached = self._explainer
+        if cached is None or cached[0] is not forest:
+            compiled = serving.compiled_forest
+            if compiled is None:
+                compiled = CompiledForest.from_sklearn(serving.model)
+            cached = (forest, ForestExplainer(compiled, len(self.feature_names)))
+            self._explainer = cached
+        return cached[1]
+    
+    def explain_batch(self, readings, top_k=3):
+        """Per-feature contributions behind the top_k crops of each reading
+        
+        Each crop's base value (the forest's average) plus one contribution
+        per feature gives its forest probability, all in percentage points.
+        Ranking and confidences come from the same probabilities as
+        `predict_batch`, so both name the same crops in the same order.
+        Quantized inputs are served from the explanation cache like `predict_many`.
+        """
+        serving = self._serving
+        if serving is None:
+            raise ValueError("Model not loaded. Please load or train the model first.")
+        
+        X = np.asarray(readings, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise ValueError(f"Expected readings of shape (n, {len(self.feature_names)}), got {X.shape}")
+        explainer = self._get_explainer(serving)
+        
+        cache = self.explanation_cache
+        if cache is None:
+            probabilities = self._predict_proba(X, serving)
+            contributions = explainer.explain(X)[1]
+        else:
+            # Cache the raw arrays so any top_k can be served from one entry
+            generation = cache.generation
+            keys = [cache.key(*row) for row in X.tolist()]
+            entries = [cache.get(key) for key in keys]
+            misses = [i for i, entry in enumerate(entries) if entry is None]
+            if misses:
+                snapped = np.array([cache.snap(keys[i]) for i in misses], dtype=np.float64)
+                computed = (self._predict_proba(snapped, serving), explainer.explain(snapped)[1])
+                for j, i in enumerate(misses):
+                    entries[i] = (computed[0][j], computed[1][j])
+                    cache.put(keys[i], entries[i], generation)
+            probabilities = np.array([entry[0] for entry in entries])
+            contributions = np.array([entry[1] for entry in entries])
+        
+        k = max(1, min(top_k, len(serving.class_labels)))
+        top_indices = rank_classes(probabilities)[:, :k]
+        best = probabilities.argmax(axis=1)
+        base_values = np.round(explainer.base_value * 100, 2)
+        results = []
+        for row, indices in enumerate(top_indices.tolist()):
+            confidences = np.round(probabilities[row, indices] * 100, 2).tolist()
+            shares = np.round(contributions[row][:, indices].T * 100, 2).tolist()
+            explanations = [
+                {
+                    'crop': serving.class_labels[idx],
+                    'confidence': confidence,
+                    'base_value': float(base_values[idx]),
+                    'contributions': dict(zip(self.feature_names, share))
+                }
+                for idx, confidence, share in zip(indices, confidences, shares)
+            ]
+            results.append({
+                'recommended_crop': serving.class_labels[best[row]],
+                'confidence': float(np.round(probabilities[row, best[row]] * 100, 2)),
+                'explanations': explanations
+            })
+        return results
+    
     def get_crop_details(self, crop_name):
         """Get detailed information about a specific crop"""
-        crop_info = {
-            'rice': {
-                'icon': '🌾',
-                'season': 'monsoon',
-                'water_requirement': 'very_high',
-                'growth_period': '90-120 days',
-                'optimal_temp': {'min': 20, 'max': 35},
-                'optimal_humidity': {'min': 80, 'max': 95},
-                'benefits': ['Staple food crop', 'High yield', 'MSP guarantee'],
-                'description': 'Traditional paddy crop requiring flood irrigation.'
-            },
-            'maize': {
-                'icon': '🌽',
-                'season': 'summer',
-                'water_requirement': 'medium',
-                'growth_period': '60-90 days',
-                'optimal_temp': {'min': 18, 'max': 27},
-                'optimal_humidity': {'min': 55, 'max': 75},
-                'benefits': ['Versatile crop', 'Good market demand', 'Drought resistant'],
-                'description': 'Versatile cereal crop suitable for various climates.'
-            },
-            'chickpea': {
-                'icon': '🫘',
-                'season': 'winter',
-                'water_requirement': 'low',
-                'growth_period': '100-120 days',
-                'optimal_temp': {'min': 17, 'max': 21},
-                'optimal_humidity': {'min': 14, 'max': 20},
-                'benefits': ['High protein', 'Nitrogen fixing', 'Premium prices'],
-                'description': 'Protein-rich legume with excellent market value.'
-            },
-            'kidneybeans': {
-                'icon': '🫘',
-                'season': 'winter',
-                'water_requirement': 'medium',
-                'growth_period': '90-110 days',
-                'optimal_temp': {'min': 15, 'max': 25},
-                'optimal_humidity': {'min': 18, 'max': 25},
-                'benefits': ['High nutrition', 'Good yield', 'Export potential'],
-                'description': 'Nutritious legume with good export opportunities.'
-            },
-            'pigeonpeas': {
-                'icon': '🫛',
-                'season': 'monsoon',
-                'water_requirement': 'medium',
-                'growth_period': '120-180 days',
-                'optimal_temp': {'min': 18, 'max': 37},
-                'optimal_humidity': {'min': 30, 'max': 70},
-                'benefits': ['Drought tolerant', 'Soil enriching', 'Multiple uses'],
-                'description': 'Versatile pulse crop suitable for dry regions.'
-            },
-            'mothbeans': {
-                'icon': '🫘',
-                'season': 'summer',
-                'water_requirement': 'low',
-                'growth_period': '70-90 days',
-                'optimal_temp': {'min': 24, 'max': 32},
-                'optimal_humidity': {'min': 40, 'max': 65},
-                'benefits': ['Drought resistant', 'Short duration', 'Nutritious'],
-                'description': 'Drought-resistant legume ideal for arid regions.'
-            },
-            'mungbean': {
-                'icon': '🫛',
-                'season': 'summer',
-                'water_requirement': 'medium',
-                'growth_period': '60-75 days',
-                'optimal_temp': {'min': 27, 'max': 30},
-                'optimal_humidity': {'min': 80, 'max': 90},
-                'benefits': ['Short duration', 'High protein', 'Easy to digest'],
-                'description': 'Fast-growing pulse with excellent nutritional value.'
-            },
-            'blackgram': {
-                'icon': '⚫',
-                'season': 'summer/winter',
-                'water_requirement': 'medium',
-                'growth_period': '75-90 days',
-                'optimal_temp': {'min': 25, 'max': 35},
-                'optimal_humidity': {'min': 60, 'max': 70},
-                'benefits': ['High protein', 'Multiple cropping', 'Good prices'],
-                'description': 'Protein-rich pulse suitable for multiple seasons.'
-            },
-            'lentil': {
-                'icon': '🫘',
-                'season': 'winter',
-                'water_requirement': 'low',
-                'growth_period': '110-130 days',
-                'optimal_temp': {'min': 18, 'max': 30},
-                'optimal_humidity': {'min': 60, 'max': 70},
-                'benefits': ['High protein', 'Good prices', 'Export quality'],
-                'description': 'Premium pulse crop with excellent export potential.'
-            },
-            'pomegranate': {
-                'icon': '🍎',
-                'season': 'all season',
-                'water_requirement': 'medium',
-                'growth_period': '180-240 days',
-                'optimal_temp': {'min': 18, 'max': 25},
-                'optimal_humidity': {'min': 85, 'max': 95},
-                'benefits': ['High value', 'Export demand', 'Medicinal properties'],
-                'description': 'Premium fruit with excellent health benefits.'
-            },
-            'banana': {
-                'icon': '🍌',
-                'season': 'all season',
-                'water_requirement': 'high',
-                'growth_period': '300-365 days',
-                'optimal_temp': {'min': 25, 'max': 30},
-                'optimal_humidity': {'min': 75, 'max': 85},
-                'benefits': ['Year-round production', 'High demand', 'Good returns'],
-                'description': 'Tropical fruit crop with consistent market demand.'
-            },
-            'mango': {
-                'icon': '🥭',
-                'season': 'summer',
-                'water_requirement': 'medium',
-                'growth_period': '100-150 days',
-                'optimal_temp': {'min': 27, 'max': 36},
-                'optimal_humidity': {'min': 45, 'max': 55},
-                'benefits': ['King of fruits', 'Export quality', 'Premium prices'],
-                'description': 'Premium tropical fruit with excellent market value.'
-            },
-            'grapes': {
-                'icon': '🍇',
-                'season': 'summer/winter',
-                'water_requirement': 'medium',
-                'growth_period': '150-180 days',
-                'optimal_temp': {'min': 9, 'max': 42},
-                'optimal_humidity': {'min': 80, 'max': 84},
-                'benefits': ['High value', 'Wine production', 'Export potential'],
-                'description': 'Premium fruit with multiple commercial uses.'
-            },
-            'watermelon': {
-                'icon': '🍉',
-                'season': 'summer',
-                'water_requirement': 'high',
-                'growth_period': '70-100 days',
-                'optimal_temp': {'min': 24, 'max': 27},
-                'optimal_humidity': {'min': 80, 'max': 90},
-                'benefits': ['High yield', 'Short duration', 'Good market'],
-                'description': 'Refreshing summer fruit with quick returns.'
-            },
-            'muskmelon': {
-                'icon': '🍈',
-                'season': 'summer',
-                'water_requirement': 'medium',
-                'growth_period': '80-100 days',
-                'optimal_temp': {'min': 27, 'max': 30},
-                'optimal_humidity': {'min': 90, 'max': 95},
-                'benefits': ['Premium prices', 'Aromatic', 'Export quality'],
-                'description': 'Sweet aromatic fruit with good market value.'
-            },
-            'apple': {
-                'icon': '🍎',
-                'season': 'winter',
-                'water_requirement': 'medium',
-                'growth_period': '150-180 days',
-                'optimal_temp': {'min': 21, 'max': 24},
-                'optimal_humidity': {'min': 90, 'max': 95},
-                'benefits': ['High value', 'Health benefits', 'Premium market'],
-                'description': 'Premium temperate fruit with excellent health benefits.'
-            },
-            'orange': {
-                'icon': '🍊',
-                'season': 'winter',
-                'water_requirement': 'medium',
-                'growth_period': '240-300 days',
-                'optimal_temp': {'min': 10, 'max': 35},
-                'optimal_humidity': {'min': 90, 'max': 95},
-                'benefits': ['Vitamin C rich', 'Long shelf life', 'Good prices'],
-                'description': 'Citrus fruit with excellent nutritional value.'
-            },
-            'papaya': {
-                'icon': '🍈',
-                'season': 'all season',
-                'water_requirement': 'medium',
-                'growth_period': '270-365 days',
-                'optimal_temp': {'min': 23, 'max': 44},
-                'optimal_humidity': {'min': 90, 'max': 95},
-                'benefits': ['Fast growing', 'Medicinal value', 'Good yield'],
-                'description': 'Tropical fruit with medicinal properties.'
-            },
-            'coconut': {
-                'icon': '🥥',
-                'season': 'all season',
-                'water_requirement': 'medium',
-                'growth_period': '365+ days',
-                'optimal_temp': {'min': 25, 'max': 30},
-                'optimal_humidity': {'min': 90, 'max': 100},
-                'benefits': ['Multiple products', 'Sustainable income', 'Long-term crop'],
-                'description': 'Multi-purpose crop with diverse commercial applications.'
-            },
-            'cotton': {
-                'icon': '☁️',
-                'season': 'summer',
-                'water_requirement': 'medium',
-                'growth_period': '150-180 days',
-                'optimal_temp': {'min': 22, 'max': 26},
-                'optimal_humidity': {'min': 75, 'max': 85},
-                'benefits': ['Cash crop', 'Textile industry', 'MSP support'],
-                'description': 'Major cash crop with government support.'
-            },
-            'jute': {
-                'icon': '🌿',
-                'season': 'monsoon',
-                'water_requirement': 'high',
-                'growth_period': '120-150 days',
-                'optimal_temp': {'min': 23, 'max': 27},
-                'optimal_humidity': {'min': 70, 'max': 90},
-                'benefits': ['Fiber crop', 'Eco-friendly', 'Good market'],
-                'description': 'Natural fiber crop with sustainable applications.'
-            },
-            'coffee': {
-                'icon': '☕',
-                'season': 'monsoon',
-                'water_requirement': 'medium',
-                'growth_period': '180-240 days',
-                'optimal_temp': {'min': 23, 'max': 28},
-                'optimal_humidity': {'min': 50, 'max': 70},
-                'benefits': ['Export crop', 'Premium prices', 'Aromatic'],
-                'description': 'Premium plantation crop with excellent export value.'
-            }
-        }
-        
-        return crop_info.get(crop_name.lower(), {
-            'icon': '🌱',
-            'season': 'varies',
-            'water_requirement': 'medium',
-            'growth_period': 'varies',
-            'optimal_temp': {'min': 20, 'max': 30},
-            'optimal_humidity': {'min': 60, 'max': 80},
-            'benefits': ['Agricultural crop', 'Market available'],
-            'description': 'Agricultural crop suitable for farming.'
-        })
+        return crop_catalog.details(crop_name)
+
+def _cache_resolution(value):
+    """Parse PREDICTION_CACHE_RESOLUTION: one step for all features or four comma-separated steps"""
+    if not value:
+        return DEFAULT_RESOLUTION
+    steps = tuple(float(step) for step in value.split(','))
+    return steps[0] if len(steps) == 1 else steps
 
 # Initialize model instance
-crop_model = CropRecommendationModel()
+crop_model = CropRecommendationModel(
+    backend=os.getenv('CROP_MODEL_BACKEND', 'sklearn'),
+    model_format=os.getenv('CROP_MODEL_FORMAT', 'pickle')
+)
+
+# Precomputed lookup grid (CROP_MODEL_GRID=1 enables it)
+if os.getenv('CROP_MODEL_GRID', '0') == '1':
+    grid_shape = os.getenv('CROP_MODEL_GRID_SHAPE')
+    crop_model.enable_grid(
+        shape=tuple(int(n) for n in grid_shape.split(',')) if grid_shape else DEFAULT_SHAPE,
+        interpolate=os.getenv('CROP_MODEL_GRID_INTERPOLATE', '0') == '1'
+    )
+
+# Quantized prediction cache (PREDICTION_CACHE_SIZE=4096 enables it). Off by
+# default: cached predictions are made on inputs snapped to the resolution grid,
+# so answers can differ slightly from the exact model output.
+if int(os.getenv('PREDICTION_CACHE_SIZE', '0')) > 0:
+    crop_model.enable_cache(
+        max_size=int(os.getenv('PREDICTION_CACHE_SIZE')),
+        ttl=float(os.getenv('PREDICTION_CACHE_TTL', '300')),
+        resolution=_cache_resolution(os.getenv('PREDICTION_CACHE_RESOLUTION'))
+    )
 
-# Try to load existing model, if not found, train new one
-if not crop_model.load_model():
-    print("Training new model...")
-    # Make sure to place Crop_recommendation.csv in the same directory
-    crop_model.train_model()
\ No newline at end of file
+# The model is loaded by the caller: server.py starts it in the background
+# with start_background_load(), scripts call load_or_train() directly
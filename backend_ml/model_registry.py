@@ -0,0 +1,231 @@
+"""
+Side-by-side serving of crop model variants
+
+The registry holds the production model plus candidates loaded from
+`<directory>/<name>/`, which contains the files a CropRecommendationModel
+saves: crop_recommendation_model.pkl and label_encoder.pkl, or an
+arrays-format manifest.json with its .npy files. For /api/ml/predict-crop
+one candidate at a time can be:
+
+    split   serving a random `fraction` of requests instead of production
+    shadow  scoring every request in the background after production has
+            answered, recording how often the two recommend the same crop
+
+Every model's evaluation time goes into a per-model histogram through its
+inference hook, whether it served or shadowed. Candidates run on the
+production backend but without its prediction cache or lookup grid, so
+their latencies are those of the forest itself. Promoting a candidate
+installs its forest into the production model, which persists it like a
+retrain would.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+
+from instrumentation import metrics, BATCH_SIZE_BUCKETS
+from ml_model import CropRecommendationModel
+from model_store import has_arrays
+
+REGISTRY_MODES = ('off', 'split', 'shadow')
+PRODUCTION = 'production'
+MODEL_NAME_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+MODEL_LATENCY = metrics.histogram(
+    'registry_model_inference_duration_seconds', 'Forest or grid evaluation time per registered model',
+    labelnames=('model',)
+)
+MODEL_ROWS = metrics.histogram(
+    'registry_model_inference_batch_rows', 'Rows per model call per registered model', BATCH_SIZE_BUCKETS,
+    labelnames=('model',)
+)
+MODEL_REQUESTS = metrics.counter(
+    'registry_model_requests_total', 'Predictions per registered model, served or shadowed', labelnames=('model', 'role')
+)
+
+
+class ModelRegistry:
+    def __init__(self, production, directory='model_registry', max_shadow_in_flight=8, seed=None):
+        self.directory = directory
+        self.max_shadow_in_flight = max_shadow_in_flight
+        self.models = {PRODUCTION: production}
+        self.candidate = None
+        self.mode = 'off'
+        self.fraction = 0.0
+        self.shadow_in_flight = 0
+        self.shadow_dropped = 0
+        self.shadow_errors = 0
+        self.agreement = {}  # candidate -> {'compared', 'agreed', 'confidence_delta'}
+        self._names = {id(production): PRODUCTION}
+        self._random = random.Random(seed)
+        self._tasks = set()
+        self._lock = threading.Lock()
+        production.add_inference_hook(self._record_inference)
+
+    def _record_inference(self, model, rows, seconds):
+        name = self._names.get(id(model))
+        if name is not None:
+            MODEL_LATENCY.observe(seconds, name)
+            MODEL_ROWS.observe(rows, name)
+
+    def available(self):
+        """Model directories that could be registered"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if MODEL_NAME_PATTERN.fullmatch(name) and os.path.isdir(os.path.join(self.directory, name))
+        )
+
+    def register(self, name):
+        """Load (or reload) the candidate stored in <directory>/<name>/"""
+        if not MODEL_NAME_PATTERN.fullmatch(name) or name == PRODUCTION:
+            raise ValueError(f"Invalid model name '{name}'")
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No model directory '{path}'")
+
+        production = self.models[PRODUCTION]
+        model = CropRecommendationModel(
+            backend=production.backend, model_format='arrays' if has_arrays(path) else 'pickle'
+        )
+        model.model_path = os.path.join(path, os.path.basename(production.model_path))
+        model.encoder_path = os.path.join(path, os.path.basename(production.encoder_path))
+        model.arrays_path = path
+        if not model.load_model():
+            raise FileNotFoundError(f"No saved model in '{path}'")
+        if list(model.feature_names) != list(production.feature_names):
+            raise ValueError(f"Model '{name}' expects features {model.feature_names}")
+
+        model.add_inference_hook(self._record_inference)
+        with self._lock:
+            old = self.models.get(name)
+            if old is not None:
+                self._names.pop(id(old), None)
+            self.models[name] = model
+            self._names[id(model)] = name
+            self.agreement.pop(name, None)
+        return model
+
+    def configure(self, candidate=None, mode='off', fraction=0.0):
+        """Choose the candidate and how it sees traffic"""
+        if mode not in REGISTRY_MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {REGISTRY_MODES}")
+        if not 0.0 <= fraction <= 1.0:
+            raise ValueError("fraction must be between 0 and 1")
+        if mode != 'off' and (candidate not in self.models or candidate == PRODUCTION):
+            raise ValueError(f"Model '{candidate}' is not a registered candidate")
+        self.candidate = candidate if mode != 'off' else None
+        self.mode = mode
+        self.fraction = fraction if mode == 'split' else 0.0
+
+    def choose(self):
+        """Name of the model that should serve the next request"""
+        if self.mode == 'split' and self.candidate is not None and self._random.random() < self.fraction:
+            return self.candidate
+        return PRODUCTION
+
+    def record_served(self, name):
+        MODEL_REQUESTS.inc(name, 'served')
+
+    def shadow(self, reading, served_prediction, run):
+        """Score reading with the candidate in the background and compare with what was served
+
+        run(fn, *args) is an awaitable executor call, such as MicroBatcher.run.
+        """
+        name = self.candidate
+        if self.mode != 'shadow' or name is None:
+            return
+        if self.shadow_in_flight >= self.max_shadow_in_flight:
+            # Never let shadow traffic queue up behind (or in front of) production
+            self.shadow_dropped += 1
+            return
+        self.shadow_in_flight += 1
+        task = asyncio.get_running_loop().create_task(
+            self._shadow(name, self.models[name], reading, served_prediction, run)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _shadow(self, name, model, reading, served_prediction, run):
+        try:
+            prediction = await run(model.predict, *reading)
+            MODEL_REQUESTS.inc(name, 'shadow')
+            with self._lock:
+                stats = self.agreement.setdefault(name, {'compared': 0, 'agreed': 0, 'confidence_delta': 0.0})
+                stats['compared'] += 1
+                stats['agreed'] += prediction['recommended_crop'] == served_prediction['recommended_crop']
+                stats['confidence_delta'] += abs(prediction['confidence'] - served_prediction['confidence'])
+        except Exception as e:
+            self.shadow_errors += 1
+            print(f"Shadow prediction with '{name}' failed: {e}")
+        finally:
+            self.shadow_in_flight -= 1
+
+    def agreement_rate(self, name):
+        stats = self.agreement.get(name)
+        if not stats or not stats['compared']:
+            return None
+        return stats['agreed'] / stats['compared']
+
+    def promote(self, name):
+        """Install a candidate's forest as production; routing is switched off afterwards"""
+        if name not in self.models or name == PRODUCTION:
+            raise ValueError(f"Model '{name}' is not a registered candidate")
+        candidate = self.models[name]
+        production = self.models[PRODUCTION]
+        if candidate.model is not None:
+            production.install_model(candidate.model, candidate.label_encoder)
+        else:
+            production.install_forest(candidate.compiled_forest, candidate.class_labels)
+        self.configure(mode='off')
+        with self._lock:
+            self.agreement.pop(name, None)
+
+    def stats(self):
+        models = {}
+        for name, model in list(self.models.items()):
+            latency = {
+                f'p{int(q * 100)}_ms': None if value is None else round(value * 1000, 3)
+                for q in (0.5, 0.99)
+                for value in [MODEL_LATENCY.quantile(q, name)]
+            }
+            agreement = self.agreement.get(name)
+            models[name] = {
+                'state': model.state,
+                'format': model.model_format,
+                'backend': model.backend,
+                'classes': len(model.class_labels),
+                'trees': _tree_count(model),
+                'served': MODEL_REQUESTS.value(name, 'served'),
+                'shadowed': MODEL_REQUESTS.value(name, 'shadow'),
+                'inference_calls': MODEL_LATENCY.snapshot(name)[0],
+                'inference_latency': latency,
+                'agreement_rate': self.agreement_rate(name),
+                'mean_confidence_delta': (
+                    round(agreement['confidence_delta'] / agreement['compared'], 3)
+                    if agreement and agreement['compared'] else None
+                )
+            }
+        return {
+            'production': PRODUCTION,
+            'candidate': self.candidate,
+            'mode': self.mode,
+            'fraction': self.fraction,
+            'models': models,
+            'available': self.available(),
+            'shadow': {
+                'in_flight': self.shadow_in_flight,
+                'dropped': self.shadow_dropped,
+                'errors': self.shadow_errors
+            }
+        }
+
+
+def _tree_count(model):
+    if model.model is not None:
+        return len(model.model.estimators_)
+    if model.compiled_forest is not None:
+        return model.compiled_forest.n_trees
+    return None
@@ -0,0 +1,256 @@
+"""
+Cross-validated hyperparameter search for the crop model
+
+Every candidate (random forest, extra trees or histogram gradient boosting)
+is cross-validated and refitted in a process pool. Latency is then measured
+one candidate at a time in this process, so timings are not skewed by the
+other workers. The output is a table of accuracy vs. latency with the
+Pareto-optimal candidates marked.
+
+Run from the backend_ml directory, e.g.:
+    python model_search.py --target-accuracy 0.97 --output search.json
+"""
+import argparse
+import itertools
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from compiled_forest import CompiledForest
+from ml_model import crop_model, FOREST_PARAMS
+
+FAMILIES = ('random_forest', 'extra_trees', 'hist_gradient_boosting')
+FAMILY_ALIASES = {'rf': 'random_forest', 'et': 'extra_trees', 'hgb': 'hist_gradient_boosting'}
+
+
+def build_estimator(family, params):
+    from sklearn.ensemble import (
+        ExtraTreesClassifier, HistGradientBoostingClassifier, RandomForestClassifier
+    )
+
+    if family == 'random_forest':
+        return RandomForestClassifier(random_state=42, n_jobs=1, **params)
+    if family == 'extra_trees':
+        return ExtraTreesClassifier(random_state=42, n_jobs=1, **params)
+    if family == 'hist_gradient_boosting':
+        return HistGradientBoostingClassifier(random_state=42, **params)
+    raise ValueError(f"Unknown estimator family '{family}', expected one of {FAMILIES}")
+
+
+def candidate_grid(args):
+    """Yield (family, params) pairs; the production settings always come first"""
+    current = {key: value for key, value in FOREST_PARAMS.items() if key != 'random_state'}
+    yield 'random_forest', current
+
+    for family in args.families:
+        if family == 'hist_gradient_boosting':
+            for max_iter, max_depth in itertools.product(args.max_iter, args.max_depth):
+                yield family, {'max_iter': max_iter, 'max_depth': max_depth, 'early_stopping': False}
+            continue
+        for n_estimators, max_depth, max_features in itertools.product(
+                args.n_estimators, args.max_depth, args.max_features):
+            params = {'n_estimators': n_estimators, 'max_depth': max_depth, 'max_features': max_features}
+            if family == 'random_forest' and params == {**current, 'max_features': 'sqrt'}:
+                continue  # same as the production candidate
+            yield family, params
+
+
+def evaluate_candidate(family, params, X, y, folds):
+    """Runs in a worker: cross-validate, refit on all rows and return the pickled model"""
+    from sklearn.model_selection import StratifiedKFold, cross_validate
+
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    scores = cross_validate(build_estimator(family, params), X, y, cv=splitter)
+
+    estimator = build_estimator(family, params)
+    estimator.fit(X, y)
+    return {
+        'family': family,
+        'params': params,
+        'accuracy': float(scores['test_score'].mean()),
+        'accuracy_std': float(scores['test_score'].std()),
+        'fit_seconds': float(scores['fit_time'].mean()),
+        'model': pickle.dumps(estimator, protocol=pickle.HIGHEST_PROTOCOL)
+    }
+
+
+def latency_percentiles(fn, batches):
+    """p50/p99 of fn(batch) in microseconds"""
+    timings = np.empty(len(batches), dtype=np.float64)
+    for i, batch in enumerate(batches):
+        start = time.perf_counter()
+        fn(batch)
+        timings[i] = time.perf_counter() - start
+    timings *= 1e6
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def measure_latency(result, X, args):
+    """Add size on disk and single-row/batch latency to an evaluated candidate"""
+    payload = result.pop('model')
+    estimator = pickle.loads(payload)
+    result['size_kb'] = len(payload) / 1024
+
+    predict_proba = estimator.predict_proba
+    result['backend'] = 'sklearn'
+    if args.backend == 'compiled' and hasattr(estimator, 'estimators_'):
+        compiled = CompiledForest.from_sklearn(estimator)
+        predict_proba = compiled.predict_proba
+        result['backend'] = 'compiled'
+        result['size_kb'] = sum(
+            getattr(compiled, name).nbytes
+            for name in ('feature', 'threshold', 'children_left', 'children_right', 'value', 'roots')
+        ) / 1024
+
+    rng = np.random.default_rng(0)
+    rows = X[rng.integers(0, len(X), args.repeat)]
+    singles = [rows[i:i + 1] for i in range(args.repeat)]
+    predict_proba(singles[0])  # warm-up
+    result['single_p50_us'], result['single_p99_us'] = latency_percentiles(predict_proba, singles)
+
+    batch_repeat = max(5, args.repeat // 20)
+    batches = [X[rng.integers(0, len(X), args.batch_size)] for _ in range(batch_repeat)]
+    result['batch_p50_us'], result['batch_p99_us'] = latency_percentiles(predict_proba, batches)
+    return result
+
+
+def pareto_front(results):
+    """Indices of candidates no other candidate beats on both accuracy and single-row p50"""
+    front = []
+    for i, a in enumerate(results):
+        dominated = any(
+            b['accuracy'] >= a['accuracy'] and b['single_p50_us'] <= a['single_p50_us']
+            and (b['accuracy'] > a['accuracy'] or b['single_p50_us'] < a['single_p50_us'])
+            for j, b in enumerate(results) if j != i
+        )
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def describe(result):
+    params = ', '.join(f"{key}={value}" for key, value in result['params'].items() if key != 'early_stopping')
+    return f"{result['family']}({params})"
+
+
+def print_table(results, batch_size):
+    header = (
+        f"{'':2}{'candidate':<72}{'accuracy':>10}{'fit (s)':>9}{'size (KB)':>11}"
+        f"{'1-row p50':>11}{'1-row p99':>11}{f'{batch_size}-row p50':>13}{f'{batch_size}-row p99':>13}"
+    )
+    print(header)
+    for result in results:
+        mark = '*' if result['pareto'] else ' '
+        print(
+            f"{mark:2}{describe(result):<72}{result['accuracy'] * 100:>9.2f}%{result['fit_seconds']:>9.2f}"
+            f"{result['size_kb']:>11.0f}{result['single_p50_us']:>9.0f}us{result['single_p99_us']:>9.0f}us"
+            f"{result['batch_p50_us']:>11.0f}us{result['batch_p99_us']:>11.0f}us"
+        )
+
+
+def parse_list(cast):
+    def parse(text):
+        values = []
+        for item in text.split(','):
+            item = item.strip()
+            values.append(None if item.lower() == 'none' else cast(item))
+        return values
+    return parse
+
+
+def parse_max_features(item):
+    try:
+        return float(item) if '.' in item else int(item)
+    except ValueError:
+        return item  # 'sqrt' / 'log2'
+
+
+def parse_families(text):
+    families = [FAMILY_ALIASES.get(item.strip(), item.strip()) for item in text.split(',')]
+    unknown = [family for family in families if family not in FAMILIES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown estimator families {unknown}, expected {FAMILIES}")
+    return families
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validated search over crop model candidates")
+    parser.add_argument('--csv', default='Crop_recommendation.csv')
+    parser.add_argument('--families', type=parse_families, default=list(FAMILIES),
+                        help="comma-separated: rf, et, hgb")
+    parser.add_argument('--n-estimators', type=parse_list(int), default=[25, 50, 100, 200])
+    parser.add_argument('--max-depth', type=parse_list(int), default=[10, 20, None])
+    parser.add_argument('--max-features', type=parse_list(parse_max_features), default=['sqrt', 1.0])
+    parser.add_argument('--max-iter', type=parse_list(int), default=[50, 100],
+                        help="boosting rounds for hist_gradient_boosting")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--backend', choices=('sklearn', 'compiled'), default='sklearn',
+                        help="evaluator used for latency and size of tree ensembles")
+    parser.add_argument('--repeat', type=int, default=300, help="single-row latency samples")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--target-accuracy', type=float, default=None,
+                        help="report the fastest candidate at or above this accuracy (0-1)")
+    parser.add_argument('--all', action='store_true', help="print every candidate, not just the Pareto front")
+    parser.add_argument('--output', help="write all results as JSON to this path")
+    args = parser.parse_args()
+
+    import pandas as pd
+    from sklearn.preprocessing import LabelEncoder
+
+    df = pd.read_csv(args.csv)
+    X = df[crop_model.feature_names].to_numpy(dtype=np.float64)
+    y = LabelEncoder().fit_transform(df['label'])
+
+    candidates = list(candidate_grid(args))
+    print(f"Evaluating {len(candidates)} candidates with {args.folds}-fold CV on {args.workers} workers...")
+    started = time.perf_counter()
+    evaluated = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(evaluate_candidate, family, params, X, y, args.folds)
+                   for family, params in candidates]
+        for done, future in enumerate(as_completed(futures), 1):
+            evaluated.append(future.result())
+            print(f"  [{done}/{len(futures)}] {describe(evaluated[-1])}: {evaluated[-1]['accuracy'] * 100:.2f}%")
+    print(f"Search finished in {time.perf_counter() - started:.1f}s, measuring latency...")
+
+    results = [measure_latency(result, X, args) for result in evaluated]
+    for i in pareto_front(results):
+        results[i]['pareto'] = True
+    for result in results:
+        result.setdefault('pareto', False)
+        result['current'] = result['family'] == 'random_forest' and result['params'] == {
+            key: value for key, value in FOREST_PARAMS.items() if key != 'random_state'
+        }
+    results.sort(key=lambda result: result['single_p50_us'])
+
+    print()
+    print_table([r for r in results if args.all or r['pareto'] or r['current']], args.batch_size)
+    print("* = Pareto-optimal (no candidate is both more accurate and faster for single rows)")
+
+    current = next(result for result in results if result['current'])
+    print(f"\nCurrent model: {describe(current)} {current['accuracy'] * 100:.2f}%, "
+          f"{current['single_p50_us']:.0f}us per row")
+    if args.target_accuracy is not None:
+        eligible = [result for result in results if result['accuracy'] >= args.target_accuracy]
+        if eligible:
+            best = eligible[0]
+            print(f"Fastest at >= {args.target_accuracy * 100:.1f}%: {describe(best)} "
+                  f"{best['accuracy'] * 100:.2f}%, {best['single_p50_us']:.0f}us per row, "
+                  f"{best['size_kb']:.0f} KB")
+        else:
+            print(f"No candidate reached {args.target_accuracy * 100:.1f}% accuracy")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'folds': args.folds, 'backend': args.backend, 'batch_size': args.batch_size,
+                       'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Memory-mappable model persistence
+
+A compiled forest is saved as one raw .npy file per node array plus a
+manifest.json holding the format version, class labels and a SHA-256 per
+file. Loading maps the arrays read-only, so every worker process shares the
+same page-cache pages instead of unpickling its own copy of the forest.
+
+Each save goes into a new `<directory>.v-*` version directory and the
+`directory` symlink is switched to it with os.replace, so a reader always
+finds a complete model, even while another process saves a new one.
+"""
+import errno
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from compiled_forest import CompiledForest
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+ARRAY_NAMES = ('feature', 'threshold', 'children_left', 'children_right', 'value', 'roots')
+
+# Superseded versions are deleted once they are this old; readers resolve the
+# link once and finish mapping long before
+PRUNE_AFTER_SECONDS = 60.0
+
+# Attempts at reading a version that a concurrent save may be pruning
+LOAD_ATTEMPTS = 3
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def has_arrays(directory):
+    return os.path.exists(os.path.join(directory, MANIFEST_NAME))
+
+
+def staging_dir(directory):
+    """A fresh, private directory next to directory to build its replacement in"""
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(dir=parent, prefix=os.path.basename(directory) + '.tmp-')
+
+
+def replace_dir(tmp_dir, directory):
+    """Swap a fully written tmp_dir in as directory
+
+    Readers that already mapped the old files keep their inodes. Returns False
+    (and discards tmp_dir) when a concurrent writer's directory landed first.
+    """
+    head, tail = os.path.split(tmp_dir)
+    old_dir = os.path.join(head, tail.replace('.tmp-', '.old-', 1))
+    try:
+        os.rename(directory, old_dir)
+    except FileNotFoundError:
+        old_dir = None
+    try:
+        while True:
+            try:
+                os.rename(tmp_dir, directory)
+                return True
+            except OSError as exc:
+                if exc.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+                # Another writer's complete directory is in place; a missing one
+                # means it is mid-swap, so try again
+                if os.path.isdir(directory):
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    return False
+    finally:
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _version_dir(directory):
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(dir=parent, prefix=os.path.basename(directory) + '.v-')
+
+
+def _publish(version_dir, directory):
+    """Point the directory symlink at version_dir in one atomic rename"""
+    if os.path.isdir(directory) and not os.path.islink(directory):
+        # Saved before versioning: keep it as a version of its own so the link can take its name
+        try:
+            os.rename(directory, _version_dir(directory))
+        except FileNotFoundError:
+            pass  # another writer moved it first
+    head, tail = os.path.split(version_dir)
+    link_tmp = os.path.join(head, tail.replace('.v-', '.link-', 1))
+    os.symlink(os.path.basename(version_dir), link_tmp)
+    os.replace(link_tmp, directory)
+
+
+def _prune(directory):
+    """Delete versions other than the current one once no reader can still be opening them"""
+    current = os.path.realpath(directory)
+    cutoff = time.time() - PRUNE_AFTER_SECONDS
+    prefix = os.path.join(os.path.dirname(os.path.abspath(directory)), os.path.basename(directory) + '.v-')
+    for version in glob.glob(glob.escape(prefix) + '*'):
+        try:
+            if os.path.realpath(version) != current and os.path.getmtime(version) < cutoff:
+                shutil.rmtree(version, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+
+def save_arrays(forest, classes, feature_names, directory):
+    """Write a CompiledForest and its manifest as a new version and switch directory to it
+
+    Safe to call from several workers at once: every save is complete on its
+    own and the last one to switch the link is served.
+    """
+    tmp_dir = _version_dir(directory)
+
+    files = {}
+    for name in ARRAY_NAMES:
+        filename = f'{name}.npy'
+        path = os.path.join(tmp_dir, filename)
+        array = np.ascontiguousarray(getattr(forest, name))
+        np.save(path, array)
+        files[name] = {
+            'file': filename,
+            'dtype': str(array.dtype),
+            'shape': list(array.shape),
+            'sha256': _sha256(path)
+        }
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created_at': time.time(),
+        'classes': list(classes),
+        'feature_names': list(feature_names),
+        'n_trees': forest.n_trees,
+        'depth': forest.depth,
+        'arrays': files
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    _publish(tmp_dir, directory)
+    _prune(directory)
+    return manifest
+
+
+def load_arrays(directory, verify=True):
+    """Map a saved forest read-only and return (CompiledForest, manifest)"""
+    for attempt in range(LOAD_ATTEMPTS):
+        try:
+            # Resolve the link once so the manifest and arrays come from the same version
+            return _load_version(os.path.realpath(directory), verify)
+        except FileNotFoundError:
+            if attempt == LOAD_ATTEMPTS - 1:
+                raise
+
+
+def _load_version(directory, verify):
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported model format version {manifest.get('format_version')} "
+            f"(expected {FORMAT_VERSION})"
+        )
+
+    arrays = {}
+    for name in ARRAY_NAMES:
+        entry = manifest['arrays'][name]
+        path = os.path.join(directory, entry['file'])
+        if verify and _sha256(path) != entry['sha256']:
+            raise ValueError(f"Checksum mismatch for {path}")
+        arrays[name] = np.load(path, mmap_mode='r')
+
+    forest = CompiledForest(depth=manifest['depth'], **arrays)
+    return forest, manifest
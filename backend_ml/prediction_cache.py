@@ -0,0 +1,104 @@
+"""
+Bounded LRU + TTL cache for crop predictions keyed on quantized inputs
+
+Sensor readings drift slowly, so inputs are snapped to a grid of
+`resolution` per feature and nearby readings share one cached answer.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Default quantization step for (temperature, humidity, ph, rainfall)
+DEFAULT_RESOLUTION = (0.1, 0.1, 0.01, 0.1)
+
+
+class PredictionCache:
+    def __init__(self, max_size=4096, ttl=300.0, resolution=DEFAULT_RESOLUTION):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if isinstance(resolution, (int, float)):
+            resolution = (float(resolution),) * len(DEFAULT_RESOLUTION)
+        if any(step <= 0 for step in resolution):
+            raise ValueError("resolution steps must be positive")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.resolution = tuple(float(step) for step in resolution)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def key(self, *values):
+        """Quantize raw inputs to integer grid coordinates"""
+        return tuple(round(value / step) for value, step in zip(values, self.resolution))
+
+    def snap(self, key):
+        """Grid point represented by a key, used as the model input on a miss"""
+        return tuple(index * step for index, step in zip(key, self.resolution))
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if self.ttl and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    @property
+    def generation(self):
+        """Changes whenever the cache is cleared"""
+        return self.invalidations
+
+    def put(self, key, value, generation=None):
+        """Store value under key, evicting the least recently used entries
+
+        Passing the `generation` read before computing value drops results
+        that were computed by a model replaced in the meantime.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self.invalidations:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, e.g. after the model was retrained or reloaded"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """Counters for tuning size, TTL and resolution"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'resolution': dict(zip(('temperature', 'humidity', 'ph', 'rainfall'), self.resolution)),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,195 @@
+"""
+Offline crop recommendations for whole regions
+
+Inputs are gridded maps of the model features: one .npy raster per feature
+(--rasters, in feature order), a single stacked .npy whose last axis holds
+the features (--stack), or a CSV of cells (--csv, streamed once into the
+feature-store cache). The job splits the cells into blocks and hands them to
+a process pool. Every worker maps the inputs and the two outputs itself, so
+the parent never holds the data and memory stays flat whatever the region
+size. Blocks are scored by the pickled sklearn forest, whose C tree walk is
+several times faster than the NumPy evaluator at these batch sizes; the
+arrays model is only used when no matching pickle exists:
+
+    crop_index.npy   uint8, index into manifest.json "classes" (255 = no data)
+    confidence.npy   float32, probability of the recommended crop (NaN = no data)
+
+Cells with a non-finite feature are written as no data.
+
+Run from the backend_ml directory, e.g.:
+    python regional_job.py --rasters temp.npy hum.npy ph.npy rain.npy --output-dir region
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from compiled_forest import CompiledForest
+from feature_store import FeatureStore
+from ml_model import crop_model
+from model_store import has_arrays, load_arrays
+
+NODATA = 255
+
+# Forest loaded once per worker by _init_worker
+_forest = None
+
+
+def _init_worker(model_dir, model_path):
+    global _forest
+    if model_path is not None:
+        with open(model_path, 'rb') as f:
+            _forest = pickle.load(f)
+        # The pool already runs one worker per core
+        _forest.n_jobs = 1
+        return
+    # The parent verified the checksums; workers only map the files
+    _forest, _ = load_arrays(model_dir, verify=False)
+
+
+def sklearn_model_path(model_path, forest):
+    """model_path if it holds the sklearn forest the arrays were exported from, else None"""
+    if not os.path.exists(model_path):
+        return None
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    exported = CompiledForest.from_sklearn(model)
+    if not (np.array_equal(exported.feature, forest.feature)
+            and np.array_equal(exported.threshold, forest.threshold)
+            and np.allclose(exported.value, forest.value)):
+        return None
+    return model_path
+
+
+def _open_column(path, column):
+    """Flat read-only view of one feature; column None means the file is a single-feature raster"""
+    array = np.load(path, mmap_mode='r')
+    if column is None:
+        return array.reshape(-1)
+    return array.reshape(-1, array.shape[-1])[:, column]
+
+
+def _run_block(sources, output_dir, start, stop, chunk_rows):
+    """Recommend crops for cells [start, stop) and write them into the output maps"""
+    columns = [_open_column(path, column) for path, column in sources]
+    crop_index = np.load(os.path.join(output_dir, 'crop_index.npy'), mmap_mode='r+').reshape(-1)
+    confidence = np.load(os.path.join(output_dir, 'confidence.npy'), mmap_mode='r+').reshape(-1)
+
+    for a in range(start, stop, chunk_rows):
+        b = min(stop, a + chunk_rows)
+        X = np.empty((b - a, len(columns)), dtype=np.float32)
+        for j, column in enumerate(columns):
+            X[:, j] = column[a:b]
+        valid = np.isfinite(X).all(axis=1)
+
+        index = np.full(b - a, NODATA, dtype=np.uint8)
+        best = np.full(b - a, np.nan, dtype=np.float32)
+        if valid.any():
+            probabilities = _forest.predict_proba(X[valid])
+            top = probabilities.argmax(axis=1)
+            index[valid] = top
+            best[valid] = probabilities[np.arange(len(top)), top]
+        crop_index[a:b] = index
+        confidence[a:b] = best
+
+    crop_index.flush()
+    confidence.flush()
+    return stop - start
+
+
+def resolve_inputs(args, feature_names):
+    """Return ([(path, column)] per feature, output shape)"""
+    if args.rasters:
+        if len(args.rasters) != len(feature_names):
+            raise SystemExit(f"--rasters needs {len(feature_names)} files, in order: {', '.join(feature_names)}")
+        shapes = {np.load(path, mmap_mode='r').shape for path in args.rasters}
+        if len(shapes) != 1:
+            raise SystemExit(f"Rasters differ in shape: {sorted(shapes)}")
+        return [(path, None) for path in args.rasters], shapes.pop()
+
+    if args.stack:
+        shape = np.load(args.stack, mmap_mode='r').shape
+        if shape[-1] != len(feature_names):
+            raise SystemExit(f"--stack must end in an axis of {len(feature_names)} features, got {shape}")
+        return [(args.stack, j) for j in range(len(feature_names))], shape[:-1]
+
+    store = FeatureStore(args.cache_dir)
+    X, _, _ = store.load(args.csv, feature_names, label_column=None)
+    return [(store.features_path(args.csv), j) for j in range(len(feature_names))], (len(X),)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch crop recommendations over gridded regional inputs")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('--rasters', nargs='+', metavar='NPY', help="one .npy per feature, in feature order")
+    inputs.add_argument('--stack', metavar='NPY', help=".npy with the features along the last axis")
+    inputs.add_argument('--csv', help="CSV with one column per feature")
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--model-dir', default=crop_model.arrays_path, help="arrays-format model directory")
+    parser.add_argument('--model-path', default=crop_model.model_path,
+                        help="pickled sklearn forest used for scoring when it matches --model-dir")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--block-rows', type=int, default=1 << 18, help="cells per pool task")
+    parser.add_argument('--chunk-rows', type=int, default=1 << 15, help="cells evaluated at once inside a task")
+    parser.add_argument('--cache-dir', default='feature_cache', help="feature-store cache for --csv inputs")
+    args = parser.parse_args()
+
+    if not has_arrays(args.model_dir):
+        # Produce the arrays format from the pickled model (or a fresh training run)
+        crop_model.model_format = 'arrays'
+        crop_model.arrays_path = args.model_dir
+        crop_model.load_or_train()
+    forest, model_manifest = load_arrays(args.model_dir)
+    model_path = sklearn_model_path(args.model_path, forest)
+    if model_path is None:
+        print(f"No sklearn forest matching {args.model_dir} at {args.model_path}; "
+              f"scoring with the slower arrays evaluator")
+    classes = model_manifest['classes']
+    if len(classes) >= NODATA:
+        raise SystemExit(f"{len(classes)} classes do not fit a uint8 map with {NODATA} as no data")
+
+    feature_names = model_manifest['feature_names']
+    sources, shape = resolve_inputs(args, feature_names)
+    cells = int(np.prod(shape))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, dtype in (('crop_index.npy', np.uint8), ('confidence.npy', np.float32)):
+        np.lib.format.open_memmap(os.path.join(args.output_dir, name), mode='w+', dtype=dtype, shape=shape).flush()
+
+    blocks = [(start, min(cells, start + args.block_rows)) for start in range(0, cells, args.block_rows)]
+    print(f"Scoring {cells} cells {tuple(shape)} in {len(blocks)} blocks on {args.workers} workers...")
+    started = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.model_dir, model_path)) as pool:
+        futures = [pool.submit(_run_block, sources, args.output_dir, start, stop, args.chunk_rows)
+                   for start, stop in blocks]
+        for future in as_completed(futures):
+            done += future.result()
+            print(f"  {done}/{cells} cells ({done / (time.perf_counter() - started):,.0f} cells/s)")
+    seconds = time.perf_counter() - started
+
+    manifest = {
+        'shape': list(shape),
+        'classes': classes,
+        'nodata': NODATA,
+        'feature_names': feature_names,
+        'inputs': sorted({path for path, _ in sources}),
+        'model_dir': os.path.abspath(args.model_dir),
+        'scored_with': 'sklearn' if model_path is not None else 'arrays',
+        'model_created_at': model_manifest['created_at'],
+        'cells': cells,
+        'seconds': round(seconds, 3),
+        'created_at': time.time()
+    }
+    with open(os.path.join(args.output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Done in {seconds:.1f}s ({cells / seconds:,.0f} cells/s), maps written to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
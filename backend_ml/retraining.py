@@ -0,0 +1,241 @@
+"""
+Incremental retraining from labeled field observations
+
+New observations are appended to a CSV next to the base dataset. A retrain
+fits in a separate process, so the API keeps its own cores and GIL, and the
+result is hot-swapped into the live model with a single reference
+assignment. When the label set is unchanged and the live model is an sklearn
+forest, the retrain warm-starts it: the existing trees are kept and
+`extra_trees` new ones are fitted on the combined data.
+"""
+import csv
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from crop_catalog import crop_catalog
+from feature_store import feature_store
+from ml_model import FOREST_PARAMS
+
+OBSERVATION_COLUMNS = ('temperature', 'humidity', 'ph', 'rainfall', 'label')
+RETRAIN_MODES = ('auto', 'warm_start', 'full')
+HISTORY_SIZE = 20
+
+
+def _fit_forest(X_train, y_train, X_test, y_test, base_forest, extra_trees):
+    """Runs in the worker process; returns (forest, accuracy, fit_seconds)"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    start = time.perf_counter()
+    if base_forest is None:
+        forest = RandomForestClassifier(**FOREST_PARAMS, n_jobs=-1)
+    else:
+        # The worker got its own unpickled copy, so the live forest is untouched
+        forest = base_forest
+        forest.set_params(warm_start=True, n_estimators=len(forest.estimators_) + extra_trees, n_jobs=-1)
+    forest.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    forest.set_params(warm_start=False)
+    return forest, forest.score(X_test, y_test), fit_seconds
+
+
+class RetrainingPipeline:
+    def __init__(self, model, base_csv='Crop_recommendation.csv',
+                 observations_path='field_observations.csv', extra_trees=20, max_trees=300):
+        self.model = model
+        self.base_csv = base_csv
+        self.observations_path = observations_path
+        self.extra_trees = extra_trees
+        self.max_trees = max_trees
+
+        self.state = 'idle'
+        self.last_error = None
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.observation_count = self._count_observations()
+        self.trained_observations = 0
+
+        self._file_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def pending(self):
+        """Observations appended since the last successful retrain"""
+        return self.observation_count - self.trained_observations
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _count_observations(self):
+        if not os.path.exists(self.observations_path):
+            return 0
+        with open(self.observations_path) as f:
+            return max(0, sum(1 for _ in f) - 1)
+
+    def add_observations(self, observations, allow_new_classes=False):
+        """Append labeled readings (dicts keyed by OBSERVATION_COLUMNS); returns how many
+
+        Labels must be crops the live model or the crop catalog already knows,
+        since a new one forces a full refit; pass allow_new_classes=True to add one.
+        """
+        known = set(self.model.class_labels) | set(crop_catalog.crops)
+        rows = []
+        for observation in observations:
+            values = [float(observation[column]) for column in OBSERVATION_COLUMNS[:-1]]
+            if not all(math.isfinite(value) for value in values):
+                raise ValueError(f"Non-finite feature value in {observation}")
+            label = str(observation['label']).strip().lower()
+            if not label:
+                raise ValueError("Observation label must not be empty")
+            if label not in known and not allow_new_classes:
+                raise ValueError(
+                    f"Unknown crop label '{label}'; set allow_new_classes to add it as a new class"
+                )
+            rows.append(values + [label])
+
+        with self._file_lock:
+            new_file = not os.path.exists(self.observations_path)
+            with open(self.observations_path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(OBSERVATION_COLUMNS)
+                writer.writerows(rows)
+            self.observation_count += len(rows)
+        return len(rows)
+
+    def _load_dataset(self):
+        """Base dataset plus every observation so far, as (X, labels, observation_count)"""
+        import pandas as pd
+
+        # The base CSV never changes between retrains, so it comes from the typed cache
+        feature_names = list(OBSERVATION_COLUMNS[:-1])
+        base_X, base_codes, classes = feature_store.load(self.base_csv, feature_names)
+        X_parts = [base_X]
+        label_parts = [np.asarray(classes, dtype=str)[base_codes]]
+
+        with self._file_lock:
+            observation_count = self.observation_count
+            if observation_count:
+                df = pd.read_csv(self.observations_path, usecols=OBSERVATION_COLUMNS)
+                X_parts.append(df[feature_names].to_numpy(dtype=np.float64))
+                label_parts.append(df['label'].to_numpy(dtype=str))
+
+        return np.concatenate(X_parts).astype(np.float64), np.concatenate(label_parts), observation_count
+
+    def retrain(self, mode='auto'):
+        """Refit on all data, hot-swap the result and return a timing/accuracy report
+
+        Warm-started trees keep what they learned from the previous split, so
+        their holdout accuracy is somewhat optimistic; use mode='full' for an
+        unbiased figure.
+        """
+        if mode not in RETRAIN_MODES:
+            raise ValueError(f"Unknown retrain mode '{mode}', expected one of {RETRAIN_MODES}")
+        if not self.model.is_ready:
+            raise RuntimeError("Live model is not loaded yet")
+
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import LabelEncoder
+
+        with self._run_lock:
+            started = time.perf_counter()
+            X, labels, observation_count = self._load_dataset()
+            load_seconds = time.perf_counter() - started
+
+            label_encoder = LabelEncoder()
+            y = label_encoder.fit_transform(labels)
+            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+            # Warm start needs the sklearn trees and an unchanged label encoding
+            live_forest = self.model.model
+            live_encoder = self.model.label_encoder
+            fallback = None
+            if mode == 'full':
+                fallback = 'full refit requested'
+            elif live_forest is None or live_encoder is None:
+                fallback = 'live model was loaded from arrays'
+            elif list(live_encoder.classes_) != list(label_encoder.classes_):
+                fallback = 'label set changed'
+            elif len(live_forest.estimators_) + self.extra_trees > self.max_trees:
+                fallback = f'forest would exceed {self.max_trees} trees'
+            warm_start = fallback is None
+            if mode == 'warm_start' and not warm_start:
+                print(f"Warm start not possible ({fallback}), refitting from scratch")
+
+            # The live model scored on the same holdout, as it is currently served
+            served = self.model.predict_batch(X_test, top_k=1)
+            truth = label_encoder.classes_[y_test]
+            previous_accuracy = float(np.mean([p['recommended_crop'] == t for p, t in zip(served, truth)]))
+
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                forest, accuracy, fit_seconds = pool.submit(
+                    _fit_forest, X_train, y_train, X_test, y_test,
+                    live_forest if warm_start else None, self.extra_trees
+                ).result()
+
+            swap_started = time.perf_counter()
+            self.model.install_model(forest, label_encoder)
+            swap_seconds = time.perf_counter() - swap_started
+
+            self.trained_observations = observation_count
+            report = {
+                'finished_at': time.time(),
+                'mode': 'warm_start' if warm_start else 'full',
+                'fallback_reason': fallback if mode != 'full' else None,
+                'samples': len(X),
+                'observations': observation_count,
+                'n_estimators': len(forest.estimators_),
+                'accuracy': round(float(accuracy), 4),
+                'previous_accuracy': round(previous_accuracy, 4),
+                'load_seconds': round(load_seconds, 3),
+                'fit_seconds': round(fit_seconds, 3),
+                'swap_seconds': round(swap_seconds, 3),
+                'total_seconds': round(time.perf_counter() - started, 3)
+            }
+            self.history.append(report)
+            print(
+                f"Retrained ({report['mode']}, {report['n_estimators']} trees, {report['samples']} samples) "
+                f"in {report['total_seconds']:.2f}s with accuracy: {accuracy * 100:.2f}%"
+            )
+            return report
+
+    def start(self, mode='auto'):
+        """Retrain on a daemon thread; returns False if one is already running"""
+        if mode not in RETRAIN_MODES:
+            raise ValueError(f"Unknown retrain mode '{mode}', expected one of {RETRAIN_MODES}")
+        if self.running:
+            return False
+
+        def run():
+            self.state = 'running'
+            self.last_error = None
+            try:
+                self.retrain(mode)
+                self.state = 'idle'
+            except Exception as e:
+                self.state = 'failed'
+                self.last_error = str(e)
+                print(f"Retraining failed: {e}")
+
+        self._thread = threading.Thread(target=run, name='model-retrain', daemon=True)
+        self._thread.start()
+        return True
+
+    def status(self):
+        return {
+            'state': 'running' if self.running else self.state,
+            'error': self.last_error,
+            'observations': self.observation_count,
+            'pending_observations': self.pending,
+            'last_run': self.history[-1] if self.history else None,
+            'history': list(self.history)
+        }
@@ -0,0 +1,164 @@
+"""
+Streaming windowed aggregates for sensor telemetry
+
+Every reading updates per-device, per-metric sliding windows in O(1)
+amortized time: a running mean/variance (Welford, with removal), min/max
+via monotonic deques and a time-aware EWMA. Queries read the current state
+and never rescan raw readings.
+"""
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+from sensor_store import SENSOR_FIELDS
+
+# Window name -> length in milliseconds
+DEFAULT_WINDOWS = {'1m': 60_000, '15m': 900_000, '1h': 3_600_000}
+
+
+class WindowStats:
+    def __init__(self, window_ms):
+        self.window_ms = window_ms
+        self.readings = deque()  # (timestamp_ms, value)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+        self.last_ms = None
+        self._min = deque()
+        self._max = deque()
+
+    def add(self, timestamp_ms, value):
+        self.readings.append((timestamp_ms, value))
+
+        # Welford update
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        # Monotonic deques: front is always the window min / max
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((timestamp_ms, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((timestamp_ms, value))
+
+        # EWMA with a time constant equal to the window length
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            alpha = 1.0 - math.exp(-max(0, timestamp_ms - self.last_ms) / self.window_ms)
+            self.ewma += alpha * (value - self.ewma)
+        self.last_ms = timestamp_ms
+
+        self.evict(timestamp_ms)
+
+    def evict(self, now_ms):
+        """Drop readings older than the window, reversing their Welford update"""
+        cutoff = now_ms - self.window_ms
+        readings = self.readings
+        while readings and readings[0][0] <= cutoff:
+            _, value = readings.popleft()
+            self.count -= 1
+            if self.count == 0:
+                self.mean = 0.0
+                self.m2 = 0.0
+            else:
+                delta = value - self.mean
+                self.mean -= delta / self.count
+                self.m2 -= delta * (value - self.mean)
+        while self._min and self._min[0][0] <= cutoff:
+            self._min.popleft()
+        while self._max and self._max[0][0] <= cutoff:
+            self._max.popleft()
+
+    def snapshot(self):
+        if self.count == 0:
+            return {'count': 0, 'mean': None, 'variance': None, 'min': None, 'max': None, 'ewma': self.ewma}
+        variance = max(0.0, self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+        return {
+            'count': self.count,
+            'mean': round(self.mean, 4),
+            'variance': round(variance, 4),
+            'min': self._min[0][1],
+            'max': self._max[0][1],
+            'ewma': round(self.ewma, 4)
+        }
+
+
+class AggregationEngine:
+    def __init__(self, windows=DEFAULT_WINDOWS, fields=SENSOR_FIELDS):
+        self.windows = dict(windows)
+        self.fields = tuple(fields)
+        self._devices = {}  # device_id -> {field: {window: WindowStats}}
+        self._latest_ms = {}
+        self._lock = threading.Lock()
+
+    def _device(self, device_id):
+        stats = self._devices.get(device_id)
+        if stats is None:
+            stats = {
+                field: {name: WindowStats(length) for name, length in self.windows.items()}
+                for field in self.fields
+            }
+            self._devices[device_id] = stats
+        return stats
+
+    def add(self, device_id, timestamp_ms, values):
+        """Feed one reading; values are ordered like `fields`
+
+        Readings older than the newest one already seen for the device are
+        skipped, since they cannot change a trailing window.
+        """
+        with self._lock:
+            latest = self._latest_ms.get(device_id)
+            if latest is not None and timestamp_ms < latest:
+                return
+            self._latest_ms[device_id] = timestamp_ms
+            stats = self._device(device_id)
+            for field, value in zip(self.fields, values):
+                for window in stats[field].values():
+                    window.add(timestamp_ms, float(value))
+
+    def add_many(self, device_id, timestamps_ms, values):
+        """Feed a batch of readings with shape (n, len(fields))"""
+        timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+        if len(timestamps_ms) == 0:
+            return
+        order = np.argsort(timestamps_ms, kind='stable')
+        # Anything older than the longest window before the newest reading would be evicted at once
+        horizon = timestamps_ms[order[-1]] - max(self.windows.values())
+        order = order[timestamps_ms[order] > horizon]
+        values = np.asarray(values, dtype=np.float64)
+        for timestamp_ms, row in zip(timestamps_ms[order].tolist(), values[order].tolist()):
+            self.add(device_id, timestamp_ms, row)
+
+    def snapshot(self, device_id, window=None, now_ms=None):
+        """Aggregates per field and window, evicted up to now_ms if given"""
+        with self._lock:
+            stats = self._devices.get(device_id)
+            if stats is None:
+                return None
+            names = [window] if window else list(self.windows)
+            result = {}
+            for name in names:
+                result[name] = {}
+                for field in self.fields:
+                    window_stats = stats[field][name]
+                    if now_ms is not None:
+                        window_stats.evict(now_ms)
+                    result[name][field] = window_stats.snapshot()
+            return result
+
+
+def parse_windows(spec):
+    """Parse '1m=60,15m=900' (seconds) into a window dict"""
+    windows = {}
+    for item in spec.split(','):
+        name, _, seconds = item.partition('=')
+        windows[name.strip()] = int(float(seconds) * 1000)
+    return windows
@@ -0,0 +1,93 @@
+"""
+Parsing and vectorized validation of bulk sensor uploads
+
+Devices that buffer readings while offline upload them in one request as
+JSON, CSV or packed binary records. Every format is decoded straight into
+NumPy arrays so validation is a handful of array comparisons, not a loop.
+"""
+import io
+import json
+
+import numpy as np
+
+from sensor_store import SENSOR_FIELDS
+
+# Packed little-endian record: int64 epoch milliseconds + one float32 per field
+BINARY_RECORD = np.dtype([('timestamp', '<i8')] + [(field, '<f4') for field in SENSOR_FIELDS])
+
+# Physically plausible ranges (DHT22 and capacitive soil probe)
+FIELD_LIMITS = {
+    'temperature': (-40.0, 85.0),
+    'humidity': (0.0, 100.0),
+    'soilMoisture': (0.0, 100.0)
+}
+
+# Readings stamped further than this in the future are rejected
+MAX_CLOCK_SKEW_MS = 24 * 3600 * 1000
+
+
+class BulkFormatError(ValueError):
+    """Raised when a bulk upload body cannot be decoded"""
+
+
+def parse_bulk_body(body, content_type):
+    """Decode a bulk upload into (device_id or None, timestamps, values)
+
+    values has shape (n, len(SENSOR_FIELDS)). JSON bodies look like
+    {"deviceId": "...", "readings": [{"timestamp": ms, "temperature": ...}, ...]};
+    CSV bodies have a `timestamp,temperature,humidity,soilMoisture` header.
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+
+    if content_type == 'application/octet-stream':
+        if len(body) % BINARY_RECORD.itemsize:
+            raise BulkFormatError(f"Binary body must be a multiple of {BINARY_RECORD.itemsize} bytes")
+        records = np.frombuffer(body, dtype=BINARY_RECORD)
+        values = np.column_stack([records[field] for field in SENSOR_FIELDS]).astype(np.float64)
+        return None, records['timestamp'].astype(np.int64), values
+
+    if content_type in ('text/csv', 'text/plain'):
+        columns = ('timestamp',) + SENSOR_FIELDS
+        try:
+            text = body.decode('utf-8')
+            header = text.split('\n', 1)[0].strip().split(',')
+            order = [header.index(column) for column in columns]
+            table = np.loadtxt(io.StringIO(text), delimiter=',', skiprows=1,
+                               usecols=order, dtype=np.float64, ndmin=2)
+        except (UnicodeDecodeError, ValueError) as e:
+            raise BulkFormatError(f"Invalid CSV body: {e}")
+        return None, table[:, 0].astype(np.int64), table[:, 1:]
+
+    try:
+        payload = json.loads(body)
+        readings = payload['readings']
+        timestamps = np.fromiter((r['timestamp'] for r in readings), dtype=np.int64, count=len(readings))
+        values = np.array(
+            [[r.get(field, np.nan) for field in SENSOR_FIELDS] for r in readings], dtype=np.float64
+        ).reshape(len(readings), len(SENSOR_FIELDS))
+    except (ValueError, KeyError, TypeError) as e:
+        raise BulkFormatError(f"Invalid JSON body: {e}")
+    device_id = payload.get('deviceId')
+    if device_id is not None and not isinstance(device_id, str):
+        raise BulkFormatError(f"Invalid JSON body: deviceId must be a string, got {type(device_id).__name__}")
+    return device_id, timestamps, values
+
+
+def validate_readings(timestamps, values, now_ms):
+    """Return (valid_mask, rejection_counts) for a batch of readings"""
+    rejections = {}
+    valid = np.ones(len(timestamps), dtype=bool)
+
+    bad = (timestamps <= 0) | (timestamps > now_ms + MAX_CLOCK_SKEW_MS)
+    rejections['timestamp'] = int(bad.sum())
+    valid &= ~bad
+
+    for i, field in enumerate(SENSOR_FIELDS):
+        low, high = FIELD_LIMITS[field]
+        column = values[:, i]
+        # NaN fails both comparisons, so missing values are rejected too
+        bad = ~((column >= low) & (column <= high))
+        rejections[field] = int(bad.sum())
+        valid &= ~bad
+
+    return valid, {reason: count for reason, count in rejections.items() if count}
@@ -0,0 +1,223 @@
+"""
+On-box time-series store for sensor readings
+
+Each device gets an append-only columnar ring buffer (int64 millisecond
+timestamps plus one float32 column per metric). When a spill directory is
+configured, the oldest segment is written out as memory-mapped .npy files
+before the ring overwrites it, so history outlives the in-memory window.
+"""
+import os
+import re
+import threading
+
+import numpy as np
+
+SENSOR_FIELDS = ('temperature', 'humidity', 'soilMoisture')
+
+# Device IDs double as spill directory names
+DEVICE_ID_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,63}')
+
+
+class DeviceRingBuffer:
+    def __init__(self, capacity=86400, fields=SENSOR_FIELDS, spill_dir=None, segment_rows=None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.columns = np.zeros((len(self.fields), capacity), dtype=np.float32)
+        self.total_written = 0
+
+        self.spill_dir = spill_dir
+        self.segment_rows = segment_rows or max(1, capacity // 4)
+        self.segments = []  # (first_ts, last_ts, timestamps_path, columns_path)
+        self._spilled_upto = 0
+        self._segment_offset = 0  # rows spilled by earlier processes, keeps file names unique
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._load_segments()
+
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.total_written, self.capacity)
+
+    def append(self, timestamp_ms, values):
+        """Append one reading; values are ordered like `fields`"""
+        with self.lock:
+            self._make_room(1)
+            slot = self.total_written % self.capacity
+            self.timestamps[slot] = timestamp_ms
+            self.columns[:, slot] = values
+            self.total_written += 1
+
+    def extend(self, timestamps_ms, values):
+        """Append many readings at once; values has shape (n, len(fields))"""
+        timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32).reshape(len(timestamps_ms), len(self.fields))
+
+        with self.lock:
+            # Chunks no larger than a segment keep spilling and wraparound simple
+            for start in range(0, len(timestamps_ms), self.segment_rows):
+                ts = timestamps_ms[start:start + self.segment_rows]
+                n = len(ts)
+                self._make_room(n)
+                slots = (self.total_written + np.arange(n)) % self.capacity
+                self.timestamps[slots] = ts
+                self.columns[:, slots] = values[start:start + n].T
+                self.total_written += n
+
+    def _make_room(self, n):
+        """Spill whole segments that the next n writes would overwrite"""
+        if not self.spill_dir:
+            return
+        oldest_kept = self.total_written + n - self.capacity
+        while self._spilled_upto < oldest_kept:
+            first = self._spilled_upto
+            rows = min(self.segment_rows, self.total_written - first)
+            slots = (first + np.arange(rows)) % self.capacity
+            self._write_segment(first, self.timestamps[slots], self.columns[:, slots])
+            self._spilled_upto = first + rows
+
+    def _write_segment(self, first_row, timestamps, columns):
+        base = os.path.join(self.spill_dir, f'segment_{self._segment_offset + first_row:012d}')
+        ts_path, columns_path = base + '.ts.npy', base + '.values.npy'
+        np.save(ts_path, timestamps)
+        np.save(columns_path, columns)
+        self.segments.append((int(timestamps.min()), int(timestamps.max()), ts_path, columns_path))
+
+    def _load_segments(self):
+        """Pick up segments spilled by a previous process"""
+        for name in sorted(os.listdir(self.spill_dir)):
+            if not name.endswith('.ts.npy'):
+                continue
+            ts_path = os.path.join(self.spill_dir, name)
+            columns_path = ts_path[:-len('.ts.npy')] + '.values.npy'
+            if not os.path.exists(columns_path):
+                continue
+            timestamps = np.load(ts_path, mmap_mode='r')
+            first_row = int(name[len('segment_'):-len('.ts.npy')])
+            self._segment_offset = max(self._segment_offset, first_row + len(timestamps))
+            if len(timestamps):
+                self.segments.append((int(timestamps.min()), int(timestamps.max()), ts_path, columns_path))
+
+    def snapshot(self, start_ms=None, end_ms=None):
+        """Readings in [start_ms, end_ms), ordered by timestamp
+
+        Returns (timestamps, columns) with columns shaped (len(fields), n).
+        """
+        low = np.iinfo(np.int64).min if start_ms is None else start_ms
+        high = np.iinfo(np.int64).max if end_ms is None else end_ms
+
+        parts_ts, parts_columns = [], []
+        with self.lock:
+            for first_ts, last_ts, ts_path, columns_path in self.segments:
+                if last_ts < low or first_ts >= high:
+                    continue
+                timestamps = np.load(ts_path, mmap_mode='r')
+                mask = (timestamps >= low) & (timestamps < high)
+                parts_ts.append(np.asarray(timestamps[mask]))
+                parts_columns.append(np.asarray(np.load(columns_path, mmap_mode='r')[:, mask]))
+
+            count = len(self)
+            timestamps = self.timestamps[:count]
+            mask = (timestamps >= low) & (timestamps < high)
+            # Skip rows that are also in a spilled segment
+            if self.spill_dir and self.total_written > self.capacity:
+                slot_rows = self._slot_rows()
+                mask &= slot_rows >= self._spilled_upto
+            parts_ts.append(timestamps[mask])
+            parts_columns.append(self.columns[:, :count][:, mask])
+
+        timestamps = np.concatenate(parts_ts)
+        columns = np.concatenate(parts_columns, axis=1)
+        order = np.argsort(timestamps, kind='stable')
+        return timestamps[order], columns[:, order]
+
+    def _slot_rows(self):
+        """Global row number currently held by each slot of a full ring"""
+        slots = np.arange(self.capacity)
+        newest_slot = (self.total_written - 1) % self.capacity
+        return self.total_written - 1 - ((newest_slot - slots) % self.capacity)
+
+
+class SensorStore:
+    def __init__(self, capacity=86400, fields=SENSOR_FIELDS, spill_dir=None):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.spill_dir = spill_dir
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def device(self, device_id):
+        """Ring buffer for device_id, created on first use"""
+        buffer = self._devices.get(device_id)
+        if buffer is None:
+            if not DEVICE_ID_PATTERN.fullmatch(device_id):
+                raise ValueError(f"Invalid device id '{device_id}'")
+            with self._lock:
+                buffer = self._devices.get(device_id)
+                if buffer is None:
+                    spill_dir = os.path.join(self.spill_dir, device_id) if self.spill_dir else None
+                    buffer = DeviceRingBuffer(self.capacity, self.fields, spill_dir=spill_dir)
+                    self._devices[device_id] = buffer
+        return buffer
+
+    def device_ids(self):
+        return sorted(self._devices)
+
+    def append(self, device_id, timestamp_ms, reading):
+        """Append one reading given as a dict keyed by field name"""
+        self.device(device_id).append(timestamp_ms, [reading[field] for field in self.fields])
+
+    def extend(self, device_id, timestamps_ms, values):
+        self.device(device_id).extend(timestamps_ms, values)
+
+    def query(self, device_id, start_ms=None, end_ms=None, bucket_ms=None):
+        """Readings for a device, optionally averaged into fixed time buckets
+
+        Returns a list of dicts with `timestamp` (ms), one key per field and,
+        when downsampling, min/max per field and the number of raw readings.
+        """
+        buffer = self._devices.get(device_id)
+        if buffer is None:
+            return []
+
+        timestamps, columns = buffer.snapshot(start_ms, end_ms)
+        if len(timestamps) == 0:
+            return []
+
+        if not bucket_ms:
+            rows = {'timestamp': timestamps.tolist()}
+            for field, column in zip(self.fields, columns):
+                rows[field] = column.tolist()
+            return [dict(zip(rows, values)) for values in zip(*rows.values())]
+
+        # Buckets are aligned to multiples of bucket_ms; timestamps are sorted,
+        # so each bucket is one contiguous run
+        origin = int(timestamps[0])
+        origin -= origin % bucket_ms
+        buckets = (timestamps - origin) // bucket_ms
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        counts = np.diff(np.r_[starts, len(timestamps)])
+
+        result = {
+            'timestamp': (origin + buckets[starts] * bucket_ms).tolist(),
+            'count': counts.tolist()
+        }
+        for field, column in zip(self.fields, columns):
+            column = column.astype(np.float64)
+            result[field] = np.round(np.add.reduceat(column, starts) / counts, 3).tolist()
+            result[f'{field}_min'] = np.minimum.reduceat(column, starts).tolist()
+            result[f'{field}_max'] = np.maximum.reduceat(column, starts).tolist()
+        return [dict(zip(result, values)) for values in zip(*result.values())]
+
+    def stats(self):
+        return {
+            device_id: {
+                'readings': len(buffer),
+                'total_written': buffer.total_written,
+                'spilled_segments': len(buffer.segments)
+            }
+            for device_id, buffer in sorted(self._devices.items())
+        }
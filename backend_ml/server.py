@@ -1,15 +1,96 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse, Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 import uvicorn
+import numpy as np
 from ml_model import crop_model
+from crop_catalog import crop_catalog
+from fast_json import FastJSONResponse
+from instrumentation import metrics, stage, InstrumentedRoute, LoopLagMonitor, record_inference
+from inference_pool import MicroBatcher, QueueFullError
+from retraining import RetrainingPipeline, RETRAIN_MODES
+from sensor_store import SensorStore, SENSOR_FIELDS, DEVICE_ID_PATTERN
+from sensor_aggregates import AggregationEngine, DEFAULT_WINDOWS, parse_windows
+from live_stream import LiveBroadcaster
+from irrigation_scheduler import IrrigationScheduler
+from sensor_ingest import parse_bulk_body, validate_readings, BulkFormatError
+from anomaly_filter import AnomalyFilter
+from state_backend import create_state_backend
+from model_registry import ModelRegistry, REGISTRY_MODES
+from datetime import datetime, timezone
+import asyncio
+import time
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="Smart Irrigation API", version="2.0")
+# Model inference runs off the event loop; concurrent requests are micro-batched
+inference_batcher = MicroBatcher(
+    crop_model,
+    max_batch_size=int(os.getenv('INFERENCE_MAX_BATCH_SIZE', '32')),
+    max_wait_ms=float(os.getenv('INFERENCE_MAX_WAIT_MS', '2')),
+    max_queue_depth=int(os.getenv('INFERENCE_MAX_QUEUE_DEPTH', '1024')),
+    workers=int(os.getenv('INFERENCE_WORKERS', '2'))
+)
+
+# Labeled field observations are folded into the model by background retrains
+retraining = RetrainingPipeline(
+    crop_model,
+    observations_path=os.getenv('FIELD_OBSERVATIONS_PATH', 'field_observations.csv'),
+    extra_trees=int(os.getenv('RETRAIN_EXTRA_TREES', '20')),
+    max_trees=int(os.getenv('RETRAIN_MAX_TREES', '300'))
+)
+RETRAIN_INTERVAL_MINUTES = float(os.getenv('RETRAIN_INTERVAL_MINUTES', '0'))
+
+# Candidate models can take a share of predict-crop traffic or shadow it
+model_registry = ModelRegistry(
+    crop_model,
+    directory=os.getenv('MODEL_REGISTRY_DIR', 'model_registry'),
+    max_shadow_in_flight=int(os.getenv('MODEL_SHADOW_MAX_IN_FLIGHT', '8'))
+)
+
+async def retrain_periodically(interval_seconds):
+    """Start a retrain whenever new observations arrived during the last interval"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        if crop_model.is_ready and retraining.pending > 0:
+            retraining.start()
+
+# Per-route/per-stage latency, model call and event-loop lag metrics on /metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+loop_lag_monitor = LoopLagMonitor(interval=float(os.getenv('LOOP_LAG_INTERVAL_SECONDS', '0.5')))
+if METRICS_ENABLED:
+    crop_model.add_inference_hook(record_inference)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Bind the port right away; the model loads (or trains) in the background
+    crop_model.start_background_load()
+    await inference_batcher.start()
+    if METRICS_ENABLED:
+        loop_lag_monitor.start()
+    irrigation_task = asyncio.create_task(irrigation_ticks(IRRIGATION_TICK_SECONDS))
+    state_task = asyncio.create_task(sync_state(STATE_SYNC_SECONDS))
+    scheduler = None
+    if RETRAIN_INTERVAL_MINUTES > 0:
+        scheduler = asyncio.create_task(retrain_periodically(RETRAIN_INTERVAL_MINUTES * 60))
+    yield
+    if scheduler is not None:
+        scheduler.cancel()
+    irrigation_task.cancel()
+    state_task.cancel()
+    state_backend.flush()
+    await loop_lag_monitor.stop()
+    await inference_batcher.stop()
+
+app = FastAPI(title="Smart Irrigation API", version="2.0", lifespan=lifespan)
+if METRICS_ENABLED:
+    # Must be set before any route is declared
+    app.router.route_class = InstrumentedRoute
 
 # CORS middleware
 app.add_middleware(
@@ -27,17 +108,51 @@ class CropPredictionRequest(BaseModel):
     ph: float = Field(..., ge=0, le=14, description="Soil pH level")
     rainfall: float = Field(..., ge=0, le=500, description="Rainfall in mm")
 
+class ObservationRequest(CropPredictionRequest):
+    label: str = Field(..., min_length=1, max_length=64, description="Crop actually grown under these conditions")
+
+class ObservationBatchRequest(BaseModel):
+    observations: List[ObservationRequest] = Field(..., min_length=1, max_length=10000)
+    allow_new_classes: bool = Field(False, description="Accept labels the model and crop catalog do not know")
+
+class RetrainRequest(BaseModel):
+    mode: str = Field('auto', description=f"One of {', '.join(RETRAIN_MODES)}")
+
 class CropPredictionResponse(BaseModel):
     recommended_crop: str
     confidence: float
     all_recommendations: List[Dict[str, Any]]
     crop_details: Dict[str, Any]
     input_parameters: Dict[str, float]
+    model: Optional[str] = None
+
+class BatchCropPredictionRequest(BaseModel):
+    readings: List[CropPredictionRequest]
+    top_k: int = Field(5, ge=1, le=22, description="Number of recommendations per reading")
+
+class ExplainRequest(CropPredictionRequest):
+    top_k: int = Field(3, ge=1, le=22, description="Number of top crops to explain")
+
+class BatchExplainRequest(BaseModel):
+    readings: List[CropPredictionRequest]
+    top_k: int = Field(3, ge=1, le=22, description="Number of top crops to explain per reading")
+
+class RegisterModelRequest(BaseModel):
+    name: str = Field(..., description="Directory under the model registry holding the saved model")
+
+class ModelRoutingRequest(BaseModel):
+    candidate: Optional[str] = None
+    mode: str = Field('off', description=f"One of {', '.join(REGISTRY_MODES)}")
+    fraction: float = Field(0.0, ge=0, le=1, description="Share of requests the candidate serves in split mode")
+
+class PromoteModelRequest(BaseModel):
+    name: str
 
 class SensorDataRequest(BaseModel):
     temperature: float
     humidity: float
     soilMoisture: float
+    deviceId: Optional[str] = None
 
 class SettingsRequest(BaseModel):
     autoMode: Optional[bool] = None
@@ -45,6 +160,61 @@ class SettingsRequest(BaseModel):
     irrigationDuration: Optional[int] = None
     temperatureAlert: Optional[int] = None
 
+def require_model_ready():
+    """Reject model-backed requests until the model has finished loading"""
+    if not crop_model.is_ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model not ready (state: {crop_model.state})",
+            headers={'Retry-After': '5'}
+        )
+
+# On-box sensor history: one columnar ring buffer per device
+DEFAULT_DEVICE_ID = 'default'
+sensor_store = SensorStore(
+    capacity=int(os.getenv('SENSOR_STORE_CAPACITY', '86400')),
+    spill_dir=os.getenv('SENSOR_STORE_SPILL_DIR') or None
+)
+
+# Rolling per-device aggregates, e.g. SENSOR_AGGREGATE_WINDOWS="1m=60,15m=900,1h=3600"
+sensor_aggregates = AggregationEngine(
+    windows=parse_windows(os.getenv('SENSOR_AGGREGATE_WINDOWS')) if os.getenv('SENSOR_AGGREGATE_WINDOWS') else DEFAULT_WINDOWS
+)
+
+# Readings failing the range, spike (rolling median/MAD) or rate-of-change checks
+# are kept out of the store, aggregates and auto-irrigation
+ANOMALY_FILTER_ENABLED = os.getenv('ANOMALY_FILTER_ENABLED', '1') == '1'
+anomaly_filter = AnomalyFilter(
+    window=int(os.getenv('ANOMALY_WINDOW', '31')),
+    z_limit=float(os.getenv('ANOMALY_Z_LIMIT', '5'))
+)
+
+# Server push of sensor, pump and settings updates to WebSocket / SSE clients
+live_updates = LiveBroadcaster(
+    max_queue=int(os.getenv('LIVE_STREAM_QUEUE_SIZE', '64')),
+    coalesce_ms=float(os.getenv('LIVE_STREAM_COALESCE_MS', '50'))
+)
+
+# Seconds between SSE keep-alive comments on an idle stream
+SSE_KEEPALIVE_SECONDS = 15
+
+# Upper bound on readings accepted by a single batch prediction request
+MAX_BATCH_SIZE = 1000
+
+# Upper bound on readings accepted by a single bulk sensor upload
+MAX_BULK_READINGS = 100000
+
+# Opt-in fast path for hot routes: encode with orjson (when installed) and
+# skip response_model validation of payloads the handlers build themselves
+FAST_JSON = os.getenv('FAST_JSON', '0') == '1'
+
+def hot_response(content):
+    """Return a hot route's payload, pre-encoded when FAST_JSON is on"""
+    if not FAST_JSON:
+        return content
+    with stage('encoding'):
+        return FastJSONResponse(content)
+
 # In-memory storage (in production, use a database)
 latest_sensor_data = {
     'temperature': 28.5,
@@ -63,25 +233,131 @@ system_settings = {
     'temperatureAlert': 35
 }
 
+# Latest state per device; the default device is latest_sensor_data itself
+device_states = {DEFAULT_DEVICE_ID: latest_sensor_data}
+
+def get_device_state(device_id):
+    """State dict for a device, created on its first reading"""
+    state = device_states.get(device_id)
+    if state is None:
+        if not DEVICE_ID_PATTERN.fullmatch(device_id):
+            raise HTTPException(status_code=400, detail=f"Invalid device id '{device_id}'")
+        state = {
+            'temperature': None,
+            'humidity': None,
+            'soilMoisture': None,
+            'pumpStatus': False,
+            'timestamp': None,
+            'wifiConnected': True,
+            'thingSpeakConnected': False
+        }
+        device_states[device_id] = state
+        persist_device(device_id)
+    return state
+
+# Settings and device state survive restarts and are shared by every worker on
+# the host. Reads stay on the dicts above; changes are written in batches
+state_backend = create_state_backend(
+    os.getenv('STATE_BACKEND', 'sqlite'),
+    os.getenv('STATE_DB_PATH', 'irrigation_state.db')
+)
+STATE_SYNC_SECONDS = float(os.getenv('STATE_SYNC_SECONDS', '0.1'))
+
+def persist_device(device_id):
+    """Queue a device's state for the next batched write"""
+    state_backend.write('devices', device_id, device_states[device_id])
+
+def persist_settings():
+    state_backend.write('settings', 'system', system_settings)
+
+def apply_stored_state(entries, publish=True):
+    """Merge entries loaded at startup or written by other workers into the in-memory state"""
+    now = time.time()
+    for (namespace, key), value in entries.items():
+        if namespace == 'settings' and key == 'system':
+            system_settings.update(value)
+            if publish:
+                live_updates.publish('settings', system_settings)
+        elif namespace == 'devices':
+            state = device_states.setdefault(key, {})
+            pump_changed = state.get('pumpStatus') != value.get('pumpStatus')
+            state.update(value)
+            if pump_changed or (not publish and state.get('pumpStatus')):
+                # Let this worker's scheduler stop a pump another worker (or run) started
+                irrigation_scheduler.set_pump(
+                    key, bool(state.get('pumpStatus')), now, system_settings['irrigationDuration'] * 60
+                )
+            if publish:
+                live_updates.publish('sensors', {'deviceId': key, **state}, key=key)
+
+async def sync_state(interval_seconds):
+    """Write queued changes in one transaction per interval and pick up other workers' changes"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            rows = state_backend.take_dirty()
+            if rows:
+                await asyncio.to_thread(state_backend.write_rows, rows)
+            apply_stored_state(state_backend.poll())
+        except Exception as e:
+            print(f"State sync failed: {e}")
+
+# Every device is an irrigation zone; pumps start at the predicted threshold
+# crossing and stop after irrigationDuration minutes
+irrigation_scheduler = IrrigationScheduler(
+    lead_seconds=float(os.getenv('IRRIGATION_LEAD_SECONDS', '0')),
+    soak_seconds=float(os.getenv('IRRIGATION_SOAK_SECONDS', '600'))
+)
+IRRIGATION_TICK_SECONDS = float(os.getenv('IRRIGATION_TICK_SECONDS', '5'))
+
+apply_stored_state(state_backend.load(), publish=False)
+
+def run_irrigation_tick(zone_ids=None):
+    """Apply the scheduler's pump decisions in auto mode; returns the zones switched on"""
+    if not system_settings['autoMode']:
+        return []
+    turned_on, turned_off = irrigation_scheduler.tick(
+        time.time(), system_settings['moistureThreshold'], system_settings['irrigationDuration'] * 60, zone_ids
+    )
+    for device_id, pump_status in [(z, True) for z in turned_on] + [(z, False) for z in turned_off]:
+        state = get_device_state(device_id)
+        state['pumpStatus'] = pump_status
+        persist_device(device_id)
+        live_updates.publish('pump', {'deviceId': device_id, 'pumpStatus': pump_status}, key=device_id)
+    return turned_on
+
+async def irrigation_ticks(interval_seconds):
+    """Re-evaluate every zone periodically, so pumps stop on time without new readings"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            run_irrigation_tick()
+        except Exception as e:
+            print(f"Irrigation tick failed: {e}")
+
 # ML Model endpoints
-@app.post("/api/ml/predict-crop", response_model=CropPredictionResponse)
+@app.post("/api/ml/predict-crop", response_model=CropPredictionResponse, dependencies=[Depends(require_model_ready)])
 async def predict_crop(request: CropPredictionRequest):
     """
     Predict the best crop based on environmental conditions
     """
     try:
         # Make prediction
-        prediction = crop_model.predict(
-            temperature=request.temperature,
-            humidity=request.humidity,
-            ph=request.ph,
-            rainfall=request.rainfall
-        )
+        served = model_registry.choose()
+        reading = (request.temperature, request.humidity, request.ph, request.rainfall)
+        with stage('inference'):
+            if served == 'production':
+                prediction = await inference_batcher.predict(*reading)
+            else:
+                prediction = await inference_batcher.run(model_registry.models[served].predict, *reading)
+        model_registry.record_served(served)
+        model_registry.shadow(reading, prediction, inference_batcher.run)
         
         # Get crop details
-        crop_details = crop_model.get_crop_details(prediction['recommended_crop'])
+        with stage('crop_details'):
+            crop_details = crop_model.get_crop_details(prediction['recommended_crop'])
         
-        return {
+        return hot_response({
             'recommended_crop': prediction['recommended_crop'],
             'confidence': prediction['confidence'],
             'all_recommendations': prediction['all_recommendations'],
@@ -91,12 +367,66 @@ async def predict_crop(request: CropPredictionRequest):
                 'humidity': request.humidity,
                 'ph': request.ph,
                 'rainfall': request.rainfall
-            }
-        }
+            },
+            'model': served
+        })
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
-@app.get("/api/ml/predict-with-sensors")
+@app.post("/api/ml/predict-crop/batch", dependencies=[Depends(require_model_ready)])
+async def predict_crop_batch(request: BatchCropPredictionRequest):
+    """
+    Predict the best crops for many readings (e.g. field plots) at once
+    """
+    if not request.readings:
+        raise HTTPException(status_code=400, detail="At least one reading is required")
+    if len(request.readings) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(request.readings)} readings (max {MAX_BATCH_SIZE})"
+        )
+    
+    try:
+        readings = np.array([
+            [r.temperature, r.humidity, r.ph, r.rainfall] for r in request.readings
+        ], dtype=np.float64)
+        with stage('inference'):
+            predictions = await inference_batcher.run(crop_model.predict_batch, readings, request.top_k)
+        
+        # Batches repeat a handful of crops, so look each one up only once
+        details_by_crop = {}
+        results = []
+        for reading, prediction in zip(request.readings, predictions):
+            crop = prediction['recommended_crop']
+            if crop not in details_by_crop:
+                with stage('crop_details'):
+                    details_by_crop[crop] = crop_model.get_crop_details(crop)
+            results.append({
+                'recommended_crop': crop,
+                'confidence': prediction['confidence'],
+                'all_recommendations': prediction['all_recommendations'],
+                'crop_details': details_by_crop[crop],
+                'input_parameters': {
+                    'temperature': reading.temperature,
+                    'humidity': reading.humidity,
+                    'ph': reading.ph,
+                    'rainfall': reading.rainfall
+                }
+            })
+        
+        return hot_response({
+            'success': True,
+            'data': {
+                'count': len(results),
+                'predictions': results
+            }
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch prediction failed: {str(e)}")
+
+@app.get("/api/ml/predict-with-sensors", dependencies=[Depends(require_model_ready)])
 async def predict_with_current_sensors(ph: float = 6.5, rainfall: float = 100):
     """
     Predict crop using current sensor data from IoT system
@@ -104,16 +434,18 @@ async def predict_with_current_sensors(ph: float = 6.5, rainfall: float = 100):
     """
     try:
         # Use current sensor data
-        prediction = crop_model.predict(
-            temperature=latest_sensor_data['temperature'],
-            humidity=latest_sensor_data['humidity'],
-            ph=ph,
-            rainfall=rainfall
-        )
+        with stage('inference'):
+            prediction = await inference_batcher.predict(
+                temperature=latest_sensor_data['temperature'],
+                humidity=latest_sensor_data['humidity'],
+                ph=ph,
+                rainfall=rainfall
+            )
         
-        crop_details = crop_model.get_crop_details(prediction['recommended_crop'])
+        with stage('crop_details'):
+            crop_details = crop_model.get_crop_details(prediction['recommended_crop'])
         
-        return {
+        return hot_response({
             'success': True,
             'data': {
                 'recommended_crop': prediction['recommended_crop'],
@@ -127,95 +459,434 @@ async def predict_with_current_sensors(ph: float = 6.5, rainfall: float = 100):
                     'rainfall': rainfall
                 }
             }
-        }
+        })
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/ml/crop-info/{crop_name}")
-async def get_crop_info(crop_name: str):
+@app.post("/api/ml/explain", dependencies=[Depends(require_model_ready)])
+async def explain_crop(request: ExplainRequest):
     """
-    Get detailed information about a specific crop
+    Explain a prediction: how much each input moved each top crop's confidence
+    away from the model's average (base value), in percentage points
     """
+    reading = [request.temperature, request.humidity, request.ph, request.rainfall]
     try:
-        crop_details = crop_model.get_crop_details(crop_name)
-        if not crop_details:
-            raise HTTPException(status_code=404, detail="Crop not found")
-        
-        return {
-            'success': True,
-            'data': {
-                'crop_name': crop_name,
-                'details': crop_details
-            }
+        with stage('inference'):
+            explanation = (await inference_batcher.run(crop_model.explain_batch, [reading], request.top_k))[0]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
+    
+    return hot_response({
+        'success': True,
+        'data': {
+            **explanation,
+            'input_parameters': dict(zip(crop_model.feature_names, reading))
         }
+    })
+
+@app.post("/api/ml/explain/batch", dependencies=[Depends(require_model_ready)])
+async def explain_crop_batch(request: BatchExplainRequest):
+    """
+    Explain predictions for many readings in one vectorized pass
+    """
+    if not request.readings:
+        raise HTTPException(status_code=400, detail="At least one reading is required")
+    if len(request.readings) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(request.readings)} readings (max {MAX_BATCH_SIZE})"
+        )
+    
+    readings = [[r.temperature, r.humidity, r.ph, r.rainfall] for r in request.readings]
+    try:
+        with stage('inference'):
+            explanations = await inference_batcher.run(crop_model.explain_batch, readings, request.top_k)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Batch explanation failed: {str(e)}")
+    
+    return hot_response({
+        'success': True,
+        'data': {
+            'count': len(explanations),
+            'explanations': [
+                {**explanation, 'input_parameters': dict(zip(crop_model.feature_names, reading))}
+                for explanation, reading in zip(explanations, readings)
+            ]
+        }
+    })
+
+def cached_json_response(request: Request, body: bytes, etag: str, cache_control: str):
+    """Serve pre-encoded JSON, or 304 when the client already holds this ETag"""
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        if '*' in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
 
-@app.get("/api/ml/available-crops")
-async def get_available_crops():
+@app.get("/api/ml/crop-info/{crop_name}")
+async def get_crop_info(crop_name: str, request: Request):
+    """
+    Get detailed information about a specific crop
+    """
+    body, etag = crop_catalog.crop_info_response(crop_name)
+    # The catalog only changes with a deploy
+    return cached_json_response(request, body, etag, 'public, max-age=3600')
+
+@app.get("/api/ml/available-crops", dependencies=[Depends(require_model_ready)])
+async def get_available_crops(request: Request):
     """
     Get list of all crops the model can predict
     """
-    try:
-        if crop_model.label_encoder is None:
-            raise HTTPException(status_code=500, detail="Model not loaded")
-        
-        crops = crop_model.label_encoder.classes_.tolist()
-        crop_list = []
-        
-        for crop in crops:
-            details = crop_model.get_crop_details(crop)
-            crop_list.append({
-                'name': crop,
-                'icon': details.get('icon', '🌱'),
-                'season': details.get('season', 'varies'),
-                'water_requirement': details.get('water_requirement', 'medium')
-            })
-        
-        return {
-            'success': True,
+    body, etag = crop_catalog.available_crops_response(crop_model.class_labels)
+    # A retrain can change the class list, so clients revalidate every time
+    return cached_json_response(request, body, etag, 'no-cache')
+
+@app.get("/api/ml/ready")
+async def get_model_readiness():
+    """
+    Readiness probe: 200 once the model is loaded, 503 while loading or after a failure
+    """
+    return JSONResponse(
+        status_code=200 if crop_model.is_ready else 503,
+        content={
+            'success': crop_model.is_ready,
             'data': {
-                'total_crops': len(crops),
-                'crops': crop_list
+                'ready': crop_model.is_ready,
+                'state': crop_model.state,
+                'error': crop_model.load_error
             }
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    )
+
+@app.get("/api/ml/cache/stats")
+async def get_prediction_cache_stats():
+    """
+    Get hit/miss/eviction counters of the prediction cache
+    """
+    if crop_model.cache is None:
+        return {'success': True, 'data': {'enabled': False}}
+    
+    return {
+        'success': True,
+        'data': {'enabled': True, **crop_model.cache.stats()}
+    }
+
+@app.get("/api/ml/inference/stats")
+async def get_inference_stats():
+    """
+    Get queue depth and micro-batching counters of the inference pool
+    """
+    return {
+        'success': True,
+        'data': inference_batcher.stats()
+    }
+
+@app.post("/api/ml/observations")
+async def add_observations(request: ObservationBatchRequest):
+    """
+    Record labeled field observations for the next retrain
+    """
+    try:
+        accepted = retraining.add_observations(
+            [observation.model_dump() for observation in request.observations],
+            allow_new_classes=request.allow_new_classes
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        'success': True,
+        'data': {
+            'accepted': accepted,
+            'pending_observations': retraining.pending
+        }
+    }
+
+@app.post("/api/ml/retrain", status_code=202, dependencies=[Depends(require_model_ready)])
+async def start_retrain(request: RetrainRequest = RetrainRequest()):
+    """
+    Retrain on the base dataset plus all observations in the background, then hot-swap the model
+    """
+    if request.mode not in RETRAIN_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(RETRAIN_MODES)}")
+    if not retraining.start(request.mode):
+        raise HTTPException(status_code=409, detail="A retrain is already running")
+    
+    return {
+        'success': True,
+        'message': f"Retraining started ({request.mode})",
+        'data': retraining.status()
+    }
+
+@app.get("/api/ml/retrain/status")
+async def get_retrain_status():
+    """
+    Get the state of the retraining pipeline and timing/accuracy of recent runs
+    """
+    return {
+        'success': True,
+        'data': retraining.status()
+    }
+
+@app.get("/api/ml/models")
+async def get_models():
+    """
+    Get the registered models, their routing, latency percentiles and agreement with production
+    """
+    return {
+        'success': True,
+        'data': model_registry.stats()
+    }
+
+@app.post("/api/ml/models", dependencies=[Depends(require_model_ready)])
+async def register_model(request: RegisterModelRequest):
+    """
+    Load (or reload) a candidate model from the registry directory
+    """
+    try:
+        model = await asyncio.to_thread(model_registry.register, request.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    return {
+        'success': True,
+        'message': f"Model '{request.name}' registered",
+        'data': {'name': request.name, 'classes': list(model.class_labels)}
+    }
+
+@app.post("/api/ml/models/routing")
+async def set_model_routing(request: ModelRoutingRequest):
+    """
+    Split traffic with a candidate, shadow-score it, or switch routing off
+    """
+    try:
+        model_registry.configure(request.candidate, request.mode, request.fraction)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        'success': True,
+        'data': model_registry.stats()
+    }
+
+@app.post("/api/ml/models/promote", dependencies=[Depends(require_model_ready)])
+async def promote_model(request: PromoteModelRequest):
+    """
+    Make a candidate the production model and persist it
+    """
+    if retraining.running:
+        raise HTTPException(status_code=409, detail="A retrain is running")
+    try:
+        await asyncio.to_thread(model_registry.promote, request.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        'success': True,
+        'message': f"Model '{request.name}' promoted to production",
+        'data': model_registry.stats()
+    }
 
 # Original sensor endpoints
 @app.get("/api/sensors/current")
-async def get_current_sensors():
+async def get_current_sensors(device_id: str = DEFAULT_DEVICE_ID):
     """Get current sensor data"""
+    if device_id not in device_states:
+        raise HTTPException(status_code=404, detail=f"Unknown device '{device_id}'")
+    return hot_response({
+        'success': True,
+        'data': device_states[device_id]
+    })
+
+@app.get("/api/sensors/devices")
+async def get_sensor_devices():
+    """List devices that have reported readings"""
     return {
         'success': True,
-        'data': latest_sensor_data
+        'data': {
+            'devices': sorted(device_states),
+            'history': sensor_store.stats()
+        }
     }
 
 @app.post("/api/sensors/data")
 async def update_sensor_data(data: SensorDataRequest):
     """Update sensor data from ESP8266"""
-    global latest_sensor_data
+    device_id = data.deviceId or DEFAULT_DEVICE_ID
+    state = get_device_state(device_id)
     
-    latest_sensor_data.update({
+    now = datetime.now(timezone.utc)
+    now_ms = int(now.timestamp() * 1000)
+    if ANOMALY_FILTER_ENABLED:
+        reasons = anomaly_filter.check(device_id, now_ms, [data.temperature, data.humidity, data.soilMoisture])
+        if reasons:
+            return {
+                'success': True,
+                'message': 'Sensor reading rejected',
+                'accepted': False,
+                'rejectionReasons': reasons,
+                'autoIrrigationTriggered': False
+            }
+    
+    state.update({
         'temperature': data.temperature,
         'humidity': data.humidity,
         'soilMoisture': data.soilMoisture,
-        'timestamp': None  # Will be set by timestamp library
+        'timestamp': now.isoformat()
     })
+    persist_device(device_id)
+    sensor_store.append(device_id, now_ms, state)
+    sensor_aggregates.add(device_id, now_ms, [data.temperature, data.humidity, data.soilMoisture])
+    irrigation_scheduler.observe(device_id, now_ms / 1000, data.temperature, data.humidity, data.soilMoisture)
     
     # Auto irrigation logic
-    auto_irrigation = False
-    if system_settings['autoMode'] and data.soilMoisture < system_settings['moistureThreshold']:
-        if not latest_sensor_data['pumpStatus']:
-            latest_sensor_data['pumpStatus'] = True
-            auto_irrigation = True
+    auto_irrigation = bool(run_irrigation_tick([device_id]))
+    live_updates.publish('sensors', {'deviceId': device_id, **state}, key=device_id)
     
     return {
         'success': True,
         'message': 'Sensor data received',
+        'accepted': True,
         'autoIrrigationTriggered': auto_irrigation
     }
 
+@app.post("/api/sensors/bulk")
+async def upload_sensor_bulk(request: Request, device_id: Optional[str] = None):
+    """
+    Bulk upload of buffered, timestamped readings from one device
+    Accepts JSON, CSV (text/csv) or packed binary records (application/octet-stream);
+    for CSV and binary bodies the device is given by the device_id query parameter
+    """
+    body = await request.body()
+    try:
+        body_device_id, timestamps, values = parse_bulk_body(body, request.headers.get('content-type'))
+    except BulkFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    device_id = device_id or body_device_id or DEFAULT_DEVICE_ID
+    if len(timestamps) == 0:
+        # Nothing to store, so don't create state for a device that never reported
+        raise HTTPException(status_code=400, detail="Bulk upload contains no readings")
+    if len(timestamps) > MAX_BULK_READINGS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many readings: {len(timestamps)} (max {MAX_BULK_READINGS})"
+        )
+    state = get_device_state(device_id)
+    
+    now_ms = int(time.time() * 1000)
+    valid, rejections = validate_readings(timestamps, values, now_ms)
+    if ANOMALY_FILTER_ENABLED and valid.any():
+        plausible, anomalies = anomaly_filter.check_many(device_id, timestamps[valid], values[valid])
+        valid[valid] = plausible
+        rejections.update(anomalies)
+    timestamps, values = timestamps[valid], values[valid]
+    
+    auto_irrigation = False
+    if len(timestamps):
+        sensor_store.extend(device_id, timestamps, values)
+        sensor_aggregates.add_many(device_id, timestamps, values)
+        irrigation_scheduler.observe_many(device_id, timestamps / 1000, values)
+        
+        # The newest reading becomes the device's current state
+        newest = int(np.argmax(timestamps))
+        newest_ms = int(timestamps[newest])
+        current_ms = None
+        if state['timestamp'] is not None:
+            current_ms = int(datetime.fromisoformat(state['timestamp']).timestamp() * 1000)
+        if current_ms is None or newest_ms >= current_ms:
+            reading = dict(zip(SENSOR_FIELDS, values[newest].tolist()))
+            state.update(reading)
+            state['timestamp'] = datetime.fromtimestamp(newest_ms / 1000, tz=timezone.utc).isoformat()
+            persist_device(device_id)
+            auto_irrigation = bool(run_irrigation_tick([device_id]))
+            live_updates.publish('sensors', {'deviceId': device_id, **state}, key=device_id)
+    
+    return {
+        'success': True,
+        'data': {
+            'deviceId': device_id,
+            'accepted': int(valid.sum()),
+            'rejected': int(len(valid) - valid.sum()),
+            'rejectionReasons': rejections,
+            'autoIrrigationTriggered': auto_irrigation
+        }
+    }
+
+@app.get("/api/sensors/anomalies")
+async def get_sensor_anomalies(device_id: str = DEFAULT_DEVICE_ID):
+    """
+    Get the latest readings rejected by the anomaly filter for a device, with reasons
+    """
+    return {
+        'success': True,
+        'data': {
+            'deviceId': device_id,
+            'enabled': ANOMALY_FILTER_ENABLED,
+            'rejected': anomaly_filter.recent_rejections(device_id),
+            'totals': anomaly_filter.stats()
+        }
+    }
+
+@app.get("/api/sensors/aggregates")
+async def get_sensor_aggregates(device_id: str = DEFAULT_DEVICE_ID, window: Optional[str] = None):
+    """
+    Get rolling mean/variance/min/max/EWMA per metric for the configured time windows
+    """
+    if window is not None and window not in sensor_aggregates.windows:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown window '{window}', expected one of {list(sensor_aggregates.windows)}"
+        )
+    
+    aggregates = sensor_aggregates.snapshot(device_id, window, now_ms=int(time.time() * 1000))
+    if aggregates is None:
+        raise HTTPException(status_code=404, detail=f"No readings for device '{device_id}'")
+    
+    return {
+        'success': True,
+        'data': {
+            'deviceId': device_id,
+            'windows': aggregates
+        }
+    }
+
+@app.get("/api/sensors/history")
+async def get_sensor_history(
+    days: float = 1,
+    device_id: str = DEFAULT_DEVICE_ID,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    bucket_seconds: int = 900
+):
+    """
+    Get downsampled sensor history from the on-box store
+    Defaults to the last `days` days in 15-minute buckets; bucket_seconds=0 returns raw readings
+    """
+    if end_ms is None:
+        end_ms = int(time.time() * 1000) + 1
+    if start_ms is None:
+        start_ms = end_ms - int(days * 86400 * 1000)
+    if bucket_seconds < 0 or start_ms >= end_ms:
+        raise HTTPException(status_code=400, detail="Invalid history range")
+    
+    rows = sensor_store.query(device_id, start_ms, end_ms, bucket_ms=bucket_seconds * 1000)
+    for row in rows:
+        moment = datetime.fromtimestamp(row['timestamp'] / 1000, tz=timezone.utc)
+        row['time'] = moment.strftime('%H:%M')
+        row['timestamp'] = moment.isoformat()
+    
+    return {
+        'success': True,
+        'data': rows
+    }
+
 @app.get("/api/settings")
 async def get_settings():
     """Get system settings"""
@@ -231,6 +902,8 @@ async def update_settings(settings: SettingsRequest):
     
     update_dict = settings.dict(exclude_unset=True)
     system_settings.update(update_dict)
+    persist_settings()
+    live_updates.publish('settings', system_settings)
     
     return {
         'success': True,
@@ -248,6 +921,14 @@ async def toggle_pump():
         )
     
     latest_sensor_data['pumpStatus'] = not latest_sensor_data['pumpStatus']
+    persist_device(DEFAULT_DEVICE_ID)
+    irrigation_scheduler.set_pump(
+        DEFAULT_DEVICE_ID, latest_sensor_data['pumpStatus'], time.time(), system_settings['irrigationDuration'] * 60
+    )
+    live_updates.publish(
+        'pump', {'deviceId': DEFAULT_DEVICE_ID, 'pumpStatus': latest_sensor_data['pumpStatus']},
+        key=DEFAULT_DEVICE_ID
+    )
     
     return {
         'success': True,
@@ -257,6 +938,117 @@ async def toggle_pump():
         }
     }
 
+@app.get("/api/irrigation/schedule")
+async def get_irrigation_schedule(device_id: Optional[str] = None, horizon_hours: float = 24):
+    """
+    Predicted threshold crossings and pump on/off timeline for every zone (or one device)
+    """
+    if horizon_hours <= 0 or horizon_hours > 24 * 7:
+        raise HTTPException(status_code=400, detail="horizon_hours must be in (0, 168]")
+    
+    now = time.time()
+    start = time.perf_counter()
+    zones = irrigation_scheduler.schedule(
+        now, system_settings['moistureThreshold'], system_settings['irrigationDuration'] * 60,
+        horizon_hours * 3600, zone_ids=[device_id] if device_id else None
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    for zone in zones:
+        for event in zone['timeline']:
+            event['at'] = datetime.fromtimestamp(event['at'], tz=timezone.utc).isoformat()
+    
+    return {
+        'success': True,
+        'data': {
+            'generatedAt': datetime.fromtimestamp(now, tz=timezone.utc).isoformat(),
+            'autoMode': system_settings['autoMode'],
+            'moistureThreshold': system_settings['moistureThreshold'],
+            'irrigationDuration': system_settings['irrigationDuration'],
+            'evaluatedInMs': round(elapsed_ms, 3),
+            'zones': zones
+        }
+    }
+
+def live_snapshot():
+    """Initial messages for a new live-stream subscriber"""
+    messages = [LiveBroadcaster.encode('settings', system_settings)]
+    for device_id, state in device_states.items():
+        messages.append(LiveBroadcaster.encode('sensors', {'deviceId': device_id, **state}))
+    return messages
+
+@app.get("/api/stream/sse")
+async def stream_sse(request: Request):
+    """
+    Server-Sent Events stream of sensor, pump and settings updates
+    """
+    subscriber = live_updates.subscribe()
+    
+    async def events():
+        try:
+            for _, sse in live_snapshot():
+                yield sse
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message[1]
+        finally:
+            live_updates.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.websocket("/api/stream/ws")
+async def stream_websocket(websocket: WebSocket):
+    """
+    WebSocket stream of sensor, pump and settings updates
+    """
+    await websocket.accept()
+    subscriber = live_updates.subscribe()
+    
+    async def watch_disconnect():
+        # Clients do not send anything; this only notices when they go away
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            subscriber.close()
+    
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        for text, _ in live_snapshot():
+            await websocket.send_text(text)
+        while True:
+            message = await subscriber.get()
+            if message is None:
+                break
+            await websocket.send_text(message[0])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watcher.cancel()
+        live_updates.unsubscribe(subscriber)
+
+@app.get("/api/stream/stats")
+async def get_stream_stats():
+    """Get subscriber and fan-out counters of the live stream"""
+    return {
+        'success': True,
+        'data': live_updates.stats()
+    }
+
 @app.get("/api/system/status")
 async def get_system_status():
     """Get system status"""
@@ -266,10 +1058,53 @@ async def get_system_status():
             'wifiConnected': latest_sensor_data['wifiConnected'],
             'thingSpeakConnected': latest_sensor_data['thingSpeakConnected'],
             'lastUpdate': latest_sensor_data.get('timestamp'),
-            'uptime': 0  # Calculate actual uptime
+            'uptime': round(metrics.uptime, 3),
+            'startedAt': datetime.fromtimestamp(metrics.started_at, timezone.utc).isoformat()
         }
     }
 
+def _cache_stat(name):
+    cache = crop_model.cache
+    return cache.stats()[name] if cache is not None else None
+
+metrics.gauge('model_ready', 'Whether the crop model is loaded (1) or not (0)', lambda: int(crop_model.is_ready))
+metrics.gauge('inference_queue_depth', 'Predictions waiting for the micro-batcher',
+              lambda: inference_batcher.stats()['queue_depth'])
+metrics.gauge('inference_requests_total', 'Single predictions submitted to the micro-batcher',
+              lambda: inference_batcher.requests, metric_type='counter')
+metrics.gauge('inference_rejected_total', 'Predictions rejected because the queue was full',
+              lambda: inference_batcher.rejected, metric_type='counter')
+metrics.gauge('prediction_cache_hits_total', 'Prediction cache hits',
+              lambda: _cache_stat('hits'), metric_type='counter')
+metrics.gauge('prediction_cache_misses_total', 'Prediction cache misses',
+              lambda: _cache_stat('misses'), metric_type='counter')
+metrics.gauge('prediction_cache_entries', 'Entries in the prediction cache', lambda: _cache_stat('size'))
+metrics.gauge('model_agreement_ratio', 'Share of shadow predictions where the candidate recommended the served crop',
+              lambda: {(name,): model_registry.agreement_rate(name) for name in list(model_registry.agreement)},
+              labelnames=('model',))
+metrics.gauge('model_shadow_dropped_total', 'Shadow predictions skipped because too many were in flight',
+              lambda: model_registry.shadow_dropped, metric_type='counter')
+metrics.gauge('sensor_readings_checked_total', 'Readings checked by the anomaly filter',
+              lambda: anomaly_filter.checked, metric_type='counter')
+metrics.gauge('sensor_readings_rejected_total', 'Readings rejected by the anomaly filter, by field:check',
+              lambda: {(reason,): count for reason, count in anomaly_filter.rejection_counts.items() if count},
+              labelnames=('reason',), metric_type='counter')
+metrics.gauge('state_pending_writes', 'Settings/device entries waiting for the next batched write',
+              lambda: state_backend.pending)
+metrics.gauge('state_flushes_total', 'Batched state writes committed', lambda: state_backend.flushes,
+              metric_type='counter')
+metrics.gauge('live_stream_subscribers', 'Connected WebSocket/SSE clients',
+              lambda: live_updates.stats()['subscribers'])
+metrics.gauge('event_loop_lag_max_seconds', 'Largest event-loop lag seen since start',
+              lambda: loop_lag_monitor.max_lag)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus text-format metrics
+    """
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
 @app.get("/")
 async def root():
     """API root endpoint"""
@@ -278,6 +1113,7 @@ async def root():
         "version": "2.0",
         "endpoints": {
             "ml": "/api/ml/predict-crop",
+            "ml_batch": "/api/ml/predict-crop/batch",
             "sensors": "/api/sensors/current",
             "settings": "/api/settings",
             "pump": "/api/pump/toggle"
@@ -285,12 +1121,8 @@ async def root():
     }
 
 if __name__ == "__main__":
-    # Make sure the model is trained before starting
-    if not os.path.exists('crop_recommendation_model.pkl'):
-        print("Training ML model for the first time...")
-        crop_model.train_model('Crop_recommendation.csv')
-    
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # The model is loaded (or trained on first run) by the app's startup
+    uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
 
 # python -m uvicorn server:app --reload --port 8000
 # The above command can be used to run the server during development.
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+Persistence and cross-worker sharing of settings and device state
+
+The server keeps serving reads from its in-memory dicts. Each change only
+marks a (namespace, key) dirty, pointing at the live dict; a background task
+serializes and writes every dirty entry in one transaction per interval, so
+a burst of sensor posts costs a single write. With several uvicorn workers
+on one database, each worker checks `PRAGMA data_version` on every sync and
+pulls only rows committed by others since its last sync.
+
+Backends:
+    memory  nothing is persisted (single process, state lost on restart)
+    sqlite  a WAL-mode SQLite file shared by every worker on the host
+
+Another store (e.g. Redis) fits by implementing the methods of
+MemoryStateBackend.
+"""
+import json
+import sqlite3
+import threading
+
+STATE_BACKENDS = ('memory', 'sqlite')
+
+
+class MemoryStateBackend:
+    """Keeps nothing; the in-memory dicts are the only copy"""
+    flushes = 0
+
+    def load(self):
+        return {}
+
+    def write(self, namespace, key, value):
+        pass
+
+    @property
+    def pending(self):
+        return 0
+
+    def take_dirty(self):
+        return []
+
+    def write_rows(self, rows):
+        return 0
+
+    def flush(self):
+        return 0
+
+    def poll(self):
+        return {}
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'memory'}
+
+
+class SQLiteStateBackend:
+    def __init__(self, path='irrigation_state.db'):
+        self.path = path
+        self._dirty = {}  # (namespace, key) -> live value, serialized at flush time
+        self._written = {}  # (namespace, key) -> seq of this process's latest write
+        self._last_seq = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_received = 0
+        self._write_lock = threading.Lock()
+
+        # Writes go through their own connection (used from a worker thread),
+        # so polling on the event loop never waits on a commit's fsync
+        self._writer = self._connect()
+        self._writer.executescript("""
+            CREATE TABLE IF NOT EXISTS state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS state_seq ON state (seq);
+        """)
+        self._reader = self._connect()
+        self._data_version = None
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode NORMAL only risks the last commits on power loss, not corruption
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def load(self):
+        """Every stored entry as {(namespace, key): value}"""
+        self._data_version = self._reader.execute('PRAGMA data_version').fetchone()[0]
+        state = {}
+        for namespace, key, value, seq in self._reader.execute('SELECT namespace, key, value, seq FROM state'):
+            state[(namespace, key)] = json.loads(value)
+            self._last_seq = max(self._last_seq, seq)
+        return state
+
+    def write(self, namespace, key, value):
+        """Mark an entry dirty; value is read (and must stay JSON-serializable) at the next flush"""
+        self._dirty[(namespace, key)] = value
+
+    @property
+    def pending(self):
+        return len(self._dirty)
+
+    def take_dirty(self):
+        """Serialize and clear the dirty entries; call on the thread that mutates the values"""
+        dirty, self._dirty = self._dirty, {}
+        return [(namespace, key, json.dumps(value)) for (namespace, key), value in dirty.items()]
+
+    def write_rows(self, rows):
+        """Commit serialized rows in one transaction; safe to run in a worker thread"""
+        if not rows:
+            return 0
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                seq = cursor.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM state').fetchone()[0]
+                cursor.executemany(
+                    'INSERT INTO state (namespace, key, value, seq) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, seq = excluded.seq',
+                    [(namespace, key, value, seq) for namespace, key, value in rows]
+                )
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            for namespace, key, _ in rows:
+                self._written[(namespace, key)] = seq
+            self.flushes += 1
+            self.rows_written += len(rows)
+        return len(rows)
+
+    def flush(self):
+        """Write every dirty entry now"""
+        return self.write_rows(self.take_dirty())
+
+    def poll(self):
+        """Entries other processes committed since the last poll, as {(namespace, key): value}
+
+        Entries with an unflushed local change are skipped; the local value is newer.
+        """
+        version = self._reader.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            return {}
+        self._data_version = version
+
+        changes = {}
+        rows = self._reader.execute(
+            'SELECT namespace, key, value, seq FROM state WHERE seq > ? ORDER BY seq', (self._last_seq,)
+        ).fetchall()
+        for namespace, key, value, seq in rows:
+            self._last_seq = max(self._last_seq, seq)
+            entry = (namespace, key)
+            if entry in self._dirty or self._written.get(entry) == seq:
+                continue
+            changes[entry] = json.loads(value)
+        self.rows_received += len(changes)
+        return changes
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        self._reader.close()
+
+    def stats(self):
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'pending': len(self._dirty),
+            'flushes': self.flushes,
+            'rowsWritten': self.rows_written,
+            'rowsReceived': self.rows_received
+        }
+
+
+def create_state_backend(name, path='irrigation_state.db'):
+    if name == 'memory':
+        return MemoryStateBackend()
+    if name == 'sqlite':
+        return SQLiteStateBackend(path)
+    raise ValueError(f"Unknown state backend '{name}', expected one of {STATE_BACKENDS}")
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='session')
+def trained_model(tmp_path_factory):
+    """A model trained on the bundled dataset, with every artifact kept out of the tree"""
+    from ml_model import CropRecommendationModel
+
+    workdir = tmp_path_factory.mktemp('model')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        model = CropRecommendationModel()
+        model.train_model(os.path.join(BACKEND_DIR, 'Crop_recommendation.csv'))
+    finally:
+        os.chdir(cwd)
+    return model
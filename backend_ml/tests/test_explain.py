@@ -0,0 +1,42 @@
+import numpy as np
+
+from compiled_forest import CompiledForest
+from explain import ForestExplainer
+
+
+def _readings(n, seed):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.uniform(10, 40, n), rng.uniform(20, 100, n), rng.uniform(4, 9, n), rng.uniform(20, 300, n)
+    ])
+
+
+def _tied_readings(model, n=4000):
+    """Readings whose two most likely crops are exactly tied"""
+    readings = _readings(n, seed=7)
+    probabilities = model.model.predict_proba(readings)
+    top_two = np.sort(probabilities, axis=1)[:, -2:]
+    return readings[top_two[:, 0] == top_two[:, 1]]
+
+
+def test_explain_matches_predict_on_tied_inputs(trained_model):
+    tied = _tied_readings(trained_model)
+    assert len(tied) > 0
+
+    explained = trained_model.explain_batch(tied, top_k=5)
+    for reading, explanation in zip(tied.tolist(), explained):
+        prediction = trained_model.predict(*reading)
+        assert explanation['recommended_crop'] == prediction['recommended_crop']
+        assert explanation['confidence'] == prediction['confidence']
+        assert [e['crop'] for e in explanation['explanations']] == \
+            [r['crop'] for r in prediction['all_recommendations']]
+
+
+def test_contributions_sum_to_forest_probabilities(trained_model):
+    forest = CompiledForest.from_sklearn(trained_model.model)
+    explainer = ForestExplainer(forest, len(trained_model.feature_names))
+    readings = _readings(200, seed=3)
+    probabilities, contributions = explainer.explain(readings)
+
+    assert np.allclose(probabilities, trained_model.model.predict_proba(readings), atol=1e-9)
+    assert np.allclose(explainer.base_value + contributions.sum(axis=1), probabilities, atol=1e-9)
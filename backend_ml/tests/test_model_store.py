@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from compiled_forest import CompiledForest
+from model_store import has_arrays, load_arrays, save_arrays
+
+FEATURES = ['temperature', 'humidity', 'ph', 'rainfall']
+
+
+def _save_repeatedly(forest, classes, directory, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        save_arrays(forest, classes, FEATURES, directory)
+
+
+def test_save_and_load_round_trip(trained_model, tmp_path):
+    forest = CompiledForest.from_sklearn(trained_model.model)
+    directory = str(tmp_path / 'model')
+    save_arrays(forest, trained_model.class_labels, FEATURES, directory)
+
+    loaded, manifest = load_arrays(directory)
+    assert manifest['classes'] == list(trained_model.class_labels)
+    X = np.array([[25.0, 80.0, 6.5, 200.0], [30.0, 50.0, 7.0, 100.0]])
+    assert np.allclose(loaded.predict_proba(X), forest.predict_proba(X))
+
+
+def test_load_during_concurrent_saves(trained_model, tmp_path):
+    forest = CompiledForest.from_sklearn(trained_model.model)
+    classes = list(trained_model.class_labels)
+    directory = str(tmp_path / 'model')
+    save_arrays(forest, classes, FEATURES, directory)
+
+    context = multiprocessing.get_context('fork')
+    writers = [context.Process(target=_save_repeatedly, args=(forest, classes, directory, 3.0))
+               for _ in range(4)]
+    for writer in writers:
+        writer.start()
+    loads = 0
+    try:
+        while any(writer.is_alive() for writer in writers):
+            assert has_arrays(directory)
+            _, manifest = load_arrays(directory, verify=loads % 10 == 0)
+            assert manifest['classes'] == classes
+            loads += 1
+    finally:
+        for writer in writers:
+            writer.join()
+    assert all(writer.exitcode == 0 for writer in writers)
+    assert loads > 0
+
+
+def test_migrates_unversioned_directory(trained_model, tmp_path):
+    forest = CompiledForest.from_sklearn(trained_model.model)
+    classes = list(trained_model.class_labels)
+    directory = str(tmp_path / 'model')
+    save_arrays(forest, classes, FEATURES, directory)
+    # Lay out the directory as saves before versioning did
+    target = os.path.realpath(directory)
+    os.unlink(directory)
+    os.rename(target, directory)
+
+    save_arrays(forest, classes, FEATURES, directory)
+    assert os.path.islink(directory)
+    assert load_arrays(directory)[1]['classes'] == classes
+
+
+def test_model_stays_loadable_at_every_step_of_a_save(trained_model, tmp_path, monkeypatch):
+    import model_store
+
+    forest = CompiledForest.from_sklearn(trained_model.model)
+    classes = list(trained_model.class_labels)
+    directory = str(tmp_path / 'model')
+    save_arrays(forest, classes, FEATURES, directory)
+
+    # Check what a concurrent reader would see after every filesystem switch
+    seen = []
+
+    def checked(function):
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            seen.append(has_arrays(directory) and load_arrays(directory)[1]['classes'] == classes)
+            return result
+        return wrapper
+
+    monkeypatch.setattr(model_store.os, 'rename', checked(os.rename))
+    monkeypatch.setattr(model_store.os, 'replace', checked(os.replace))
+    save_arrays(forest, classes, FEATURES, directory)
+    assert seen and all(seen)
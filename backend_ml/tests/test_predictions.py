@@ -0,0 +1,36 @@
+import numpy as np
+
+from ml_model import rank_classes
+
+
+def test_ties_keep_legacy_order(trained_model):
+    labels = trained_model.class_labels
+    probabilities = np.zeros(len(labels))
+    probabilities[[2, 5, 9]] = 0.3
+    probabilities[[0, 7]] = 0.05
+
+    result = trained_model._format_prediction(probabilities, labels)
+
+    legacy = np.argsort(probabilities, kind='stable')[::-1][:5]
+    assert [r['crop'] for r in result['all_recommendations']] == [labels[i] for i in legacy]
+    # The recommended crop stays the forest's argmax
+    assert result['recommended_crop'] == labels[2]
+    assert result['confidence'] == 30.0
+
+
+def test_rank_classes_matches_per_row_order():
+    rng = np.random.default_rng(0)
+    probabilities = rng.integers(0, 4, size=(50, 22)) / 4.0
+    expected = np.array([np.argsort(row, kind='stable')[::-1] for row in probabilities])
+    assert np.array_equal(rank_classes(probabilities), expected)
+
+
+def test_batch_matches_single_predictions(trained_model):
+    rng = np.random.default_rng(1)
+    readings = np.column_stack([
+        rng.uniform(10, 40, 200), rng.uniform(20, 100, 200),
+        rng.uniform(4, 9, 200), rng.uniform(20, 300, 200)
+    ])
+    batch = trained_model.predict_batch(readings)
+    single = [trained_model.predict(*row) for row in readings.tolist()]
+    assert batch == single
@@ -0,0 +1,25 @@
+import pytest
+
+from retraining import RetrainingPipeline
+
+READING = {'temperature': 25.0, 'humidity': 80.0, 'ph': 6.5, 'rainfall': 200.0}
+
+
+@pytest.fixture
+def pipeline(trained_model, tmp_path):
+    return RetrainingPipeline(trained_model, observations_path=str(tmp_path / 'observations.csv'))
+
+
+def test_known_labels_are_normalised_and_accepted(pipeline):
+    assert pipeline.add_observations([{**READING, 'label': ' Rice '}]) == 1
+    assert pipeline.pending == 1
+
+
+def test_unknown_label_is_rejected(pipeline):
+    with pytest.raises(ValueError, match='ricee'):
+        pipeline.add_observations([{**READING, 'label': 'ricee'}])
+    assert pipeline.pending == 0
+
+
+def test_new_class_needs_explicit_opt_in(pipeline):
+    assert pipeline.add_observations([{**READING, 'label': 'quinoa'}], allow_new_classes=True) == 1
@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+from sensor_ingest import BulkFormatError, parse_bulk_body
+
+
+def test_json_body_with_device_id():
+    body = json.dumps({'deviceId': 'zone-1', 'readings': [
+        {'timestamp': 1000, 'temperature': 25.0, 'humidity': 60.0, 'soilMoisture': 40.0}
+    ]}).encode()
+    device_id, timestamps, values = parse_bulk_body(body, 'application/json')
+    assert device_id == 'zone-1'
+    assert timestamps.tolist() == [1000]
+    assert values.tolist() == [[25.0, 60.0, 40.0]]
+
+
+@pytest.mark.parametrize('device_id', [7, ['zone-1'], {'id': 'zone-1'}])
+def test_non_string_device_id_is_rejected(device_id):
+    body = json.dumps({'deviceId': device_id, 'readings': []}).encode()
+    with pytest.raises(BulkFormatError):
+        parse_bulk_body(body, 'application/json')